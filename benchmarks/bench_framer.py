@@ -0,0 +1,57 @@
+"""
+Micro-benchmark: framing a 10k-line DL burst.
+
+Compares the previous ``bytes`` buffer + ``partition`` approach with the
+shared ``Framer``. Run with ``python -m benchmarks.bench_framer``.
+"""
+import timeit
+
+from pyhomeworks.framer import Framer
+
+LINES = 10000
+BURST = b''.join(b'DL, [01:01:00:%02d:%02d],  %3d\r\n' % (i // 100 % 100, i % 100, i % 101)
+                 for i in range(LINES))
+SEPARATOR = b'\r\n'
+
+
+def chunked(size):
+    return [BURST[i:i + size] for i in range(0, len(BURST), size)]
+
+
+def legacy(chunks):
+    buffer = b''
+    count = 0
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            (command, separator, remainder) = buffer.partition(SEPARATOR)
+            if separator != SEPARATOR:
+                break
+            buffer = remainder
+            count += 1
+    return count
+
+
+def framer(chunks):
+    f = Framer()
+    count = 0
+    for chunk in chunks:
+        f.feed(chunk)
+        for _ in f.frames():
+            count += 1
+    return count
+
+
+def main():
+    # 1 KiB is the old fixed recv size; larger reads happen whenever the
+    # reader falls behind a burst, and the whole burst is the worst case.
+    for size in (1024, 64 * 1024, len(BURST)):
+        chunks = chunked(size)
+        for func in (legacy, framer):
+            assert func(chunks) == LINES, func.__name__
+            best = min(timeit.repeat(lambda: func(chunks), number=1, repeat=5))
+            print(f"{func.__name__:8} read={size:7}  {best * 1000:8.2f} ms  {LINES / best:10.0f} lines/s")
+
+
+if __name__ == '__main__':
+    main()
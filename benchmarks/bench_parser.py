@@ -0,0 +1,45 @@
+"""
+Micro-benchmark: parsing a 10k-line mix of DL, KBP and KLS messages.
+
+Compares the previous path (decode to str, ``split(', ')``, ``ACTIONS``
+lookup, str field parsers) with the byte-level ``LINE_PARSER``. Run with
+``python -m benchmarks.bench_parser``.
+"""
+import timeit
+
+from pyhomeworks.events import make_event
+from pyhomeworks.pyhomeworks import ACTIONS, LINE_PARSER
+
+LINES = [
+    b'DL, [01:01:00:%02d:%02d],  %d' % (i // 100 % 100, i % 100, i % 101) if i % 4 else
+    b'KBP, [01:04:%02d],  %d' % (i % 32, i % 24 + 1) if i % 8 else
+    b'KLS, [01:04:%02d], %s' % (i % 32, b'%024d' % i)
+    for i in range(10000)
+]
+
+
+def legacy(lines):
+    events = []
+    for line in lines:
+        raw_args = line.decode('utf-8').split(', ')
+        action = ACTIONS.get(raw_args[0], None)
+        if action and len(raw_args) == len(action):
+            name, p_address, p_value = action
+            events.append(make_event(name, p_address(raw_args[1]), p_value(raw_args[2]), 0.))
+    return events
+
+
+def parser(lines):
+    parse = LINE_PARSER.parse
+    return [parse(line, 0.) for line in lines]
+
+
+def main():
+    assert legacy(LINES) == parser(LINES)
+    for func in (legacy, parser):
+        best = min(timeit.repeat(lambda: func(LINES), number=1, repeat=15))
+        print(f"{func.__name__:8} {best * 1000:8.2f} ms  {len(LINES) / best:10.0f} lines/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Replay a capture file through the parse and dispatch path as fast as possible.
+
+Run with ``python -m benchmarks.bench_replay CAPTURE [--login LOGIN]``.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from pyhomeworks import AsyncHomeworks
+from pyhomeworks.capture import DIRECTION_IN, read_capture
+
+
+async def replay(records, login):
+    events = 0
+
+    def count(event):
+        nonlocal events
+        events += 1
+
+    hw = AsyncHomeworks('replay', 0, login=login, event_callback=count)
+    started = time.perf_counter()
+    await hw.replay(records, speed=None)
+    elapsed = time.perf_counter() - started
+    await hw.close()
+    return events, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('capture')
+    parser.add_argument('--login')
+    args = parser.parse_args()
+    logging.getLogger('pyhomeworks').setLevel(logging.ERROR)
+
+    records = list(read_capture(args.capture))
+    size = sum(len(record.data) for record in records if record.direction == DIRECTION_IN)
+    events, elapsed = asyncio.run(replay(records, args.login))
+    print(f"{len(records)} records, {size} bytes, {events} events in {elapsed * 1000:.1f} ms "
+          f"({events / elapsed:.0f} events/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""
+Benchmark suite with JSON baselines.
+
+Drives ``Homeworks`` and ``HomeworksProtocol`` against the device simulator
+from ``tests/device.py`` over a local socket pair and measures:
+
+* parse throughput of ``_process_line`` (lines/s),
+* memory allocated per framed and parsed message (bytes),
+* latency from a DL burst written by the device to the last callback (ms),
+* time from connect to ready/subscribed (ms).
+
+Absolute timings depend on the machine. The parse rate is CPU bound, so it
+is also normalized by a fixed reference workload that doesn't use the
+library, timed alternately with it, and compared normalized. Latencies are
+dominated by sockets and thread scheduling and don't scale that way; they
+are only comparable between runs on the same machine. CI therefore records a
+baseline from the base commit and compares the change against it on the
+same runner; ``baseline.json`` is a reference for local runs.
+
+Run ``python -m benchmarks.suite`` to compare against ``baseline.json``
+(the exit status is 1 if a metric regressed beyond the tolerance) and
+``python -m benchmarks.suite --save`` to record a new baseline.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+import timeit
+import tracemalloc
+from unittest import mock
+
+from pyhomeworks import Homeworks
+from pyhomeworks.exceptions import HomeworksConnectionLost
+from pyhomeworks.framer import FRAME_LINE, Framer
+from pyhomeworks.protocol import HomeworksProtocol
+from pyhomeworks.pyhomeworks import BaseHomeworks
+from tests.device import HomeworksDevice
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+TOLERANCE = 0.25
+# Absolute differences below these are timer and scheduler noise.
+NOISE_FLOOR = {'ms': 2.}
+LOGIN = 'user,password'
+
+LINES = 10000
+BURST_LINES = 1000
+MESSAGES = [
+    'DL, [01:01:00:%02d:%02d],  %d' % (i // 100 % 100, i % 100, i % 101) if i % 4 else
+    'KBP, [01:04:%02d],  %d' % (i % 32, i % 24 + 1) if i % 8 else
+    'KLS, [01:04:%02d], %s' % (i % 32, '%024d' % i)
+    for i in range(LINES)
+]
+
+
+def dl_burst(lines, level=0):
+    return [b'DL, [01:01:00:%02d:%02d],  %d' % (i // 100 % 100, i % 100, level) for i in range(lines)]
+
+
+class _Sink(BaseHomeworks):
+    def __init__(self):
+        BaseHomeworks.__init__(self, event_callback=lambda event: None)
+
+
+class _Link:
+    """A HomeworksDevice served on one end of a socket pair."""
+
+    def __init__(self, require_login=None):
+        self.client, self.server = socket.socketpair()
+        self.device = HomeworksDevice(on_send=self.server.sendall)
+        self.device.require_login = require_login
+        self._pump = threading.Thread(target=self._read, daemon=True)
+
+    def start(self):
+        self._pump.start()
+        self.device.start()
+
+    def _read(self):
+        while True:
+            try:
+                data = self.server.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            self.device.receive(data)
+
+    def burst(self, lines):
+        self.server.sendall(b''.join(line + b'\r\n' for line in lines))
+
+    def close(self):
+        self.device.stop()
+        self.device.join(1)
+        self.server.close()
+        self._pump.join(1)
+
+
+def _reference_work(lines):
+    for line in lines:
+        fields = line.decode('ascii').split(', ')
+        if fields[0] == 'KLS':
+            bytes(int(digit) for digit in fields[2])
+        else:
+            int(fields[2])
+
+
+def bench_parse_lines_per_sec(repeat=15):
+    """Parse rate and the seconds of the reference workload, timed alternately."""
+    sink = _Sink()
+    lines = [line.encode() for line in MESSAGES]
+    parse, reference = [], []
+    for _ in range(repeat):
+        parse.append(timeit.timeit(lambda: [sink._process_line(line, 0.) for line in lines], number=1))
+        reference.append(timeit.timeit(lambda: _reference_work(lines), number=1))
+    return LINES / min(parse), min(reference)
+
+
+def bench_memory_per_message():
+    data = b''.join(line.encode() + b'\r\n' for line in MESSAGES)
+    sink = _Sink()
+    framer = Framer()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for offset in range(0, len(data), 1024):
+            framer.feed(data[offset:offset + 1024])
+            for kind, payload in framer.frames():
+                if kind == FRAME_LINE:
+                    sink._process_line(payload, 0.)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return (peak - start) / LINES
+
+
+def _wait(predicate, timeout=5.):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("benchmark timed out")
+        time.sleep(0.0005)
+
+
+def bench_threaded(rounds=9):
+    """Connect-to-subscribed time and DL burst latency of Homeworks."""
+    ready, latency = [], []
+    for _ in range(rounds):
+        link = _Link(require_login=LOGIN)
+        done = threading.Event()
+        received = []
+
+        def on_event(event):
+            received.append(event)
+            if len(received) == BURST_LINES:
+                done.set()
+
+        with mock.patch('pyhomeworks.pyhomeworks.start_connection', return_value=link.client):
+            hw = Homeworks('127.0.0.1', 4003, login=LOGIN, event_callback=on_event, autostart=False)
+            link.start()
+            started = time.perf_counter()
+            hw.start()
+            _wait(lambda: hw._subscribed)
+            ready.append(time.perf_counter() - started)
+        try:
+            started = time.perf_counter()
+            link.burst(dl_burst(BURST_LINES, 1))
+            if not done.wait(5):
+                raise TimeoutError("burst not delivered")
+            latency.append(time.perf_counter() - started)
+        finally:
+            hw.close()
+            hw.join(1)
+            link.close()
+    return statistics.median(ready) * 1000, statistics.median(latency) * 1000
+
+
+async def _protocol_round():
+    link = _Link(require_login=LOGIN)
+    link.start()
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    transport, protocol = await loop.create_connection(lambda: HomeworksProtocol(LOGIN), sock=link.client)
+    try:
+        await protocol.ready_future
+        ready = time.perf_counter() - started
+
+        started = time.perf_counter()
+        link.burst(dl_burst(BURST_LINES, 1))
+        for _ in range(BURST_LINES):
+            await protocol.read_queue.get()
+        return ready, time.perf_counter() - started
+    finally:
+        transport.close()
+        try:
+            await protocol.connection_lost_future
+        except HomeworksConnectionLost:
+            pass
+        link.close()
+
+
+def bench_protocol(rounds=9):
+    """Connect-to-ready time and DL burst latency of HomeworksProtocol."""
+    results = [asyncio.run(_protocol_round()) for _ in range(rounds)]
+    return (statistics.median(ready for ready, _ in results) * 1000,
+            statistics.median(latency for _, latency in results) * 1000)
+
+
+def run():
+    threaded_ready, threaded_latency = bench_threaded()
+    protocol_ready, protocol_latency = bench_protocol()
+    parse_rate, reference = bench_parse_lines_per_sec()
+    return {
+        'reference_workload': {'value': reference * 1000, 'unit': 'ms', 'better': 'info'},
+        'parse_lines_per_sec': {'value': parse_rate, 'unit': 'lines/s', 'better': 'higher',
+                                'normalized': parse_rate * reference},
+        'memory_per_message': {'value': bench_memory_per_message(), 'unit': 'bytes', 'better': 'lower'},
+        'threaded_burst_latency': {'value': threaded_latency, 'unit': 'ms', 'better': 'lower'},
+        'threaded_connect_to_subscribed': {'value': threaded_ready, 'unit': 'ms', 'better': 'lower'},
+        'protocol_burst_latency': {'value': protocol_latency, 'unit': 'ms', 'better': 'lower'},
+        'protocol_connect_to_ready': {'value': protocol_ready, 'unit': 'ms', 'better': 'lower'},
+    }
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Names of the metrics that are worse than baseline by more than tolerance.
+
+    Metrics normalized in both are compared normalized, others absolutely.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or result['better'] not in ('higher', 'lower'):
+            continue
+        if 'normalized' in result and 'normalized' in base:
+            value, base_value, floor = result['normalized'], base['normalized'], 0.
+        else:
+            value, base_value, floor = result['value'], base['value'], NOISE_FLOOR.get(result['unit'], 0.)
+        slack = max(base_value * tolerance, floor)
+        if result['better'] == 'higher':
+            worse = value < base_value - slack
+        else:
+            worse = value > base_value + slack
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--save', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+    logging.getLogger('pyhomeworks').setLevel(logging.ERROR)
+
+    results = run()
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    for name, result in results.items():
+        base = baseline.get(name)
+        line = f"{name:32} {result['value']:12.1f} {result['unit']}"
+        if base:
+            line += f"  (baseline {base['value']:.1f})"
+        if 'normalized' in result:
+            line += f"  normalized {result['normalized']:.3f}"
+            if base and 'normalized' in base:
+                line += f" (baseline {base['normalized']:.3f})"
+        print(line)
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+            file.write('\n')
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name in regressions:
+        print(f"REGRESSION: {name}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,6 +11,7 @@ from homeassistant.components.homeworks import (
     HomeworksDevice, HOMEWORKS_CONTROLLER)
 from homeassistant.const import CONF_NAME
 import homeassistant.helpers.config_validation as cv
+from pyhomeworks.events import HW_BUTTON_PRESSED, HW_BUTTON_RELEASED
 
 DEPENDENCIES = ['homeworks']
 REQUIREMENTS = ['pyhomeworks==0.0.4']
@@ -33,7 +34,8 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
 })
 
 
-def setup_platform(hass, config, add_entities, discover_info=None):
+async def async_setup_platform(hass, config, async_add_entities,
+                               discovery_info=None):
     """Set up the Homeworks keypads."""
     controller = hass.data[HOMEWORKS_CONTROLLER]
     devs = []
@@ -47,17 +49,20 @@ def setup_platform(hass, config, add_entities, discover_info=None):
                 devname = name + '_' + title
                 dev = HomeworksKeypad(controller, addr, num, devname)
                 devs.append(dev)
-    add_entities(devs, True)
+    async_add_entities(devs, True)
+    controller.add_devices(devs)
     return True
 
 
 class HomeworksKeypad(HomeworksDevice, BinarySensorDevice):
     """Homeworks Keypad."""
 
+    actions = (HW_BUTTON_PRESSED, HW_BUTTON_RELEASED)
+
     def __init__(self, controller, addr, num, name):
         """Create keypad with addr, num, and name."""
         HomeworksDevice.__init__(self, controller, addr, name)
-        self._num = num
+        self.button = num
         self._state = None
 
     @property
@@ -65,16 +70,13 @@ class HomeworksKeypad(HomeworksDevice, BinarySensorDevice):
         """Return state of the button."""
         return self._state
 
-    def callback(self, msg_type, values):
-        """Dispatch messages from the controller."""
-        from pyhomeworks.pyhomeworks import (
-            HW_BUTTON_PRESSED, HW_BUTTON_RELEASED)
-
-        old_state = self._state
-        if msg_type == HW_BUTTON_PRESSED and values[1] == self._num:
-            self.hass.bus.fire(EVENT_BUTTON_PRESSED,
-                               {'entity_id': self.entity_id})
-            self._state = True
-        elif msg_type == HW_BUTTON_RELEASED and values[1] == self._num:
-            self._state = False
-        return old_state != self._state
+    def callback(self, event):
+        """Track press and release of this button."""
+        state = event.action == HW_BUTTON_PRESSED
+        if state and self.hass is not None:
+            self.hass.bus.async_fire(EVENT_BUTTON_PRESSED,
+                                     {'entity_id': self.entity_id})
+        if self._state == state:
+            return False
+        self._state = state
+        return True
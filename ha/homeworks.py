@@ -9,6 +9,9 @@ from homeassistant.const import (
     CONF_HOST, CONF_PORT, EVENT_HOMEASSISTANT_STOP)
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.entity import Entity
+from pyhomeworks import AsyncHomeworks
+from pyhomeworks.address import normalize_address
+from pyhomeworks.exceptions import HomeworksException
 
 REQUIREMENTS = ['pyhomeworks==0.0.4']
 
@@ -18,61 +21,111 @@ DOMAIN = 'homeworks'
 
 HOMEWORKS_CONTROLLER = 'homeworks'
 
+CONF_STATE_FILE = 'state_file'
+
 CONFIG_SCHEMA = vol.Schema({
     DOMAIN: vol.Schema({
         vol.Required(CONF_HOST): cv.string,
         vol.Required(CONF_PORT): cv.port,
+        vol.Optional(CONF_STATE_FILE): cv.string,
     }),
 }, extra=vol.ALLOW_EXTRA)
 
 
-def setup(hass, base_config):
+async def async_setup(hass, base_config):
     """Start Homeworks controller."""
-    from pyhomeworks.pyhomeworks import Homeworks
-
-    class HomeworksController(Homeworks):
-        """Interface between HASS and Homeworks controller."""
-
-        def __init__(self, host, port):
-            """Host and port of Lutron Homeworks controller."""
-            Homeworks.__init__(self, host, port, self.callback)
-            self._subscribers = {}
-
-        def subscribe(self, device):
-            """Add a device to subscribe to events."""
-            if device.addr not in self._subscribers:
-                self._subscribers[device.addr] = []
-            self._subscribers[device.addr].append(device)
-            if device.is_light:
-                self.request_dimmer_level(device.addr)
-
-        def callback(self, msg_type, values):
-            """Dispatch state changes."""
-            _LOGGER.debug('callback: %s, %s', msg_type, values)
-            addr = values[0]
-            for sub in self._subscribers.get(addr, []):
-                _LOGGER.debug("callback: %s", sub)
-                if sub.callback(msg_type, values):
-                    sub.schedule_update_ha_state()
-
     config = base_config.get(DOMAIN)
     host = config[CONF_HOST]
     port = config[CONF_PORT]
 
-    controller = HomeworksController(host, port)
+    state_file = config.get(CONF_STATE_FILE)
+    if state_file is not None:
+        state_file = hass.config.path(state_file)
+
+    controller = HomeworksController(hass, host, port, state_file)
+    try:
+        await controller.connect()
+    except (ConnectionError, HomeworksException) as error:
+        _LOGGER.error("Unable to connect to Homeworks: %s", error)
+        return False
     hass.data[HOMEWORKS_CONTROLLER] = controller
 
-    def cleanup(event):
-        controller.close()
+    async def cleanup(event):
+        await controller.close()
 
-    hass.bus.listen_once(EVENT_HOMEASSISTANT_STOP, cleanup)
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, cleanup)
     return True
 
 
+class HomeworksController(AsyncHomeworks):
+    """Interface between HASS and Homeworks controller.
+
+    Runs on HASS's event loop. Devices are kept in one index keyed by
+    (address, action, button) with a single dispatcher subscription per
+    key, and state writes are deferred to the end of the loop iteration so
+    a burst of events writes each entity's state once.
+    """
+
+    def __init__(self, hass, host, port, state_file=None):
+        """Host and port of Lutron Homeworks controller."""
+        AsyncHomeworks.__init__(self, host, port, state_file=state_file)
+        self._hass = hass
+        self._devices = {}
+        self._pending_writes = {}
+        self._write_handle = None
+
+    def add_devices(self, devices):
+        """Route events to the devices and request unknown dimmer levels."""
+        for device in devices:
+            for action in device.actions:
+                key = (normalize_address(device.addr), action, device.button)
+                routed = self._devices.get(key)
+                if routed is None:
+                    routed = self._devices[key] = []
+                    self.dispatcher.subscribe(self._router(routed), key[0], action, device.button)
+                routed.append(device)
+        unknown = [device.addr for device in devices
+                   if device.is_light and self.state.get_level(device.addr) is None]
+        if unknown:
+            self._hass.async_create_task(self.query_levels(unknown))
+
+    def _router(self, devices):
+        def route(event):
+            for device in devices:
+                if device.callback(event):
+                    self.schedule_write(device)
+        return route
+
+    def schedule_write(self, device):
+        """Write the device's state once the current loop iteration is done."""
+        self._pending_writes[id(device)] = device
+        if self._write_handle is None:
+            self._write_handle = self._hass.loop.call_soon(self._write_states)
+
+    def _write_states(self):
+        self._write_handle = None
+        devices, self._pending_writes = self._pending_writes, {}
+        for device in devices.values():
+            if device.hass is not None:
+                device.async_write_ha_state()
+
+    async def close(self):
+        """Close the connection and drop pending state writes."""
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+            self._write_handle = None
+        self._pending_writes.clear()
+        await AsyncHomeworks.close(self)
+
+
 class HomeworksDevice(Entity):
     """Base class of a Homeworks device."""
 
     is_light = False
+    # Event actions the controller routes to callback().
+    actions = ()
+    # Button number the routed button actions are narrowed to, if any.
+    button = None
 
     def __init__(self, controller, addr, name):
         """Controller, address, and name of the device."""
@@ -80,10 +133,6 @@ class HomeworksDevice(Entity):
         self._name = name
         self._controller = controller
 
-    async def async_added_to_hass(self):
-        """Register callback."""
-        self.hass.async_add_job(self._controller._subscribe, self)
-
     @property
     def addr(self):
         """Device address."""
@@ -99,6 +148,6 @@ class HomeworksDevice(Entity):
         """No need to poll."""
         return False
 
-    def callback(self, msg_type, values):
-        """Run when Homeworks device changes state."""
-        pass
+    def callback(self, event):
+        """Run when Homeworks device changes state; True to write the state."""
+        return False
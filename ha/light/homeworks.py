@@ -6,11 +6,12 @@ https://home-assistant.io/components/homeworks/
 import logging
 import voluptuous as vol
 from homeassistant.components.homeworks import (
-    HomeworksDevice, HOMEWORKS_CONTROLLER)
+    DOMAIN as HOMEWORKS_DOMAIN, HomeworksDevice, HOMEWORKS_CONTROLLER)
 from homeassistant.components.light import (
-    ATTR_BRIGHTNESS, SUPPORT_BRIGHTNESS, Light, PLATFORM_SCHEMA)
-from homeassistant.const import CONF_NAME
+    ATTR_BRIGHTNESS, ATTR_TRANSITION, SUPPORT_BRIGHTNESS, Light, PLATFORM_SCHEMA)
+from homeassistant.const import ATTR_ENTITY_ID, CONF_NAME
 import homeassistant.helpers.config_validation as cv
+from pyhomeworks.events import HW_LIGHT_CHANGED
 
 DEPENDENCIES = ['homeworks']
 REQUIREMENTS = ['pyhomeworks==0.0.4']
@@ -34,8 +35,18 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_DIMMERS): vol.All(cv.ensure_list, [DIMMER_SCHEMA])
 })
 
+HOMEWORKS_LIGHTS = 'homeworks_lights'
+SERVICE_FADE_LIGHTS = 'fade_lights'
 
-def setup_platform(hass, config, add_entities, discover_info=None):
+FADE_LIGHTS_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+    vol.Required(ATTR_BRIGHTNESS): vol.All(vol.Coerce(int), vol.Range(min=0, max=255)),
+    vol.Optional(ATTR_TRANSITION): CV_FADE_RATE,
+})
+
+
+async def async_setup_platform(hass, config, async_add_entities,
+                               discovery_info=None):
     """Set up the Homeworks lights."""
     controller = hass.data[HOMEWORKS_CONTROLLER]
     devs = []
@@ -43,58 +54,82 @@ def setup_platform(hass, config, add_entities, discover_info=None):
         dev = HomeworksLight(controller, dimmer[CONF_ADDR],
                              dimmer[CONF_NAME], dimmer[CONF_RATE])
         devs.append(dev)
-    add_entities(devs, True)
+    async_add_entities(devs, True)
+    controller.add_devices(devs)
+
+    lights = hass.data.setdefault(HOMEWORKS_LIGHTS, [])
+    if not lights:
+        async def async_fade_lights(call):
+            """Fade many lights with one write to the controller."""
+            entity_ids = set(call.data[ATTR_ENTITY_ID])
+            brightness = call.data[ATTR_BRIGHTNESS]
+            transition = call.data.get(ATTR_TRANSITION)
+            targets = [light for light in lights if light.entity_id in entity_ids]
+            await controller.fade_many(
+                light.fade(brightness, transition) for light in targets)
+            for light in targets:
+                light.set_level(brightness)
+
+        hass.services.async_register(
+            HOMEWORKS_DOMAIN, SERVICE_FADE_LIGHTS, async_fade_lights,
+            schema=FADE_LIGHTS_SCHEMA)
+    lights.extend(devs)
     return True
 
 
 class HomeworksLight(HomeworksDevice, Light):
     """Homeworks Light."""
 
+    is_light = True
+    actions = (HW_LIGHT_CHANGED,)
+
     def __init__(self, controller, addr, name, rate):
         """Create device with Addr, name, and rate."""
         HomeworksDevice.__init__(self, controller, addr, name)
         self._rate = rate
         self._level = None
-        self.is_light = True
 
     @property
     def supported_features(self):
         """Supported features."""
         return SUPPORT_BRIGHTNESS
 
-    def turn_on(self, **kwargs):
+    async def async_turn_on(self, **kwargs):
         """Turn on the light."""
-        if ATTR_BRIGHTNESS in kwargs:
-            self.brightness = kwargs[ATTR_BRIGHTNESS]
-        else:
-            self.brightness = 255
+        await self._async_fade(kwargs.get(ATTR_BRIGHTNESS, 255))
 
-    def turn_off(self, **kwargs):
+    async def async_turn_off(self, **kwargs):
         """Turn off the light."""
-        self.brightness = 0
+        await self._async_fade(0)
+
+    async def _async_fade(self, level):
+        await self._controller.fade_many([self.fade(level)])
+        self.set_level(level)
 
     @property
     def brightness(self):
-        """Control the brightness."""
+        """Brightness of the light."""
         return self._level
 
-    @brightness.setter
-    def brightness(self, level):
-        self._controller.fade_dim(
-            float((level*100.)/255.), self._rate,
-            0, self._addr)
+    def fade(self, level, rate=None):
+        """Fade of this light to brightness level, as fade_many takes it."""
+        return (self._addr, float((level*100.)/255.),
+                self._rate if rate is None else rate, 0)
+
+    def set_level(self, level):
+        """Record a brightness set through the controller."""
         self._level = level
+        self._controller.schedule_write(self)
 
     @property
     def is_on(self):
         """Is the light on/off."""
         return self._level != 0
 
-    def callback(self, msg_type, values):
-        """Process device specific messages."""
-        from pyhomeworks.pyhomeworks import HW_LIGHT_CHANGED
-
-        if msg_type == HW_LIGHT_CHANGED:
-            self._level = int((values[1] * 255.)/100.)
-            return True
-        return False
+    def callback(self, event):
+        """Process a level change."""
+        level = int((event.level * 255.)/100.)
+        if level == self._level:
+            return False
+        self._level = level
+        return True
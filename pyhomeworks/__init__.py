@@ -1,5 +1,7 @@
 name = "pyhomeworks"
 
+from .aio import AsyncHomeworks
+from .manager import HomeworksManager, SyncHomeworksManager
 from .pyhomeworks import Homeworks
 
-__all__ = ['Homeworks']
\ No newline at end of file
+__all__ = ['AsyncHomeworks', 'Homeworks', 'HomeworksManager', 'SyncHomeworksManager']
\ No newline at end of file
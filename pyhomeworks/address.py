@@ -0,0 +1,43 @@
+"""
+Homeworks address normalization.
+
+The controller prints addresses as ``[01:01:00:02:04]``, configurations
+often spell them ``[1:1:0:2:4]`` or ``01.01.00.02.04``. All of them normalize
+to the same tuple of ints, which is what indexes are keyed by.
+"""
+import re
+from functools import lru_cache
+from typing import Tuple, Union
+
+Address = Tuple[int, ...]
+
+_SEPARATORS = re.compile(r'[:.\-/]')
+
+
+@lru_cache(maxsize=4096)
+def _parse(addr: str) -> Address:
+    text = addr.strip().strip('[]').strip()
+    try:
+        return tuple(int(part) for part in _SEPARATORS.split(text))
+    except ValueError:
+        raise ValueError(f"Invalid Homeworks address: {addr!r}") from None
+
+
+def normalize_address(addr: Union[str, Address]) -> Address:
+    """Return the address as a tuple of ints, e.g. (1, 1, 0, 2, 4)."""
+    if isinstance(addr, tuple):
+        return addr
+    return _parse(addr)
+
+
+def pack_address(addr: Union[str, Address]) -> int:
+    """Pack an address into one int, one byte per component."""
+    packed = 0
+    for part in normalize_address(addr):
+        packed = (packed << 8) | part
+    return packed
+
+
+def format_address(addr: Union[str, Address]) -> str:
+    """Format an address the way the controller prints it."""
+    return '[' + ':'.join('%02d' % part for part in normalize_address(addr)) + ']'
@@ -0,0 +1,294 @@
+"""
+Asyncio interface to Lutron Homeworks Series 4 and 8 systems.
+
+Runs on the caller's event loop on top of HomeworksProtocol, so any number of
+controllers can share one loop without a thread per connection.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Callable, Dict, Iterable, Optional
+
+from .backoff import RECONNECT_DELAY, RECONNECT_MAX_DELAY, Backoff
+from .capture import ReplayTransport, read_capture
+from .fade import encode_fades
+from .exceptions import HomeworksAuthenticationException, HomeworksConnectionLost
+from .protocol import HomeworksProtocol
+from .pyhomeworks import BaseHomeworks
+from .writer import COALESCE_WINDOW, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, encode_command
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _runs_on(loop: asyncio.AbstractEventLoop) -> bool:
+    """Whether the calling thread is running loop."""
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+class AsyncHomeworks(BaseHomeworks):
+    """Asyncio interface with a Lutron Homeworks 4/8 Series system."""
+
+    COALESCE_WINDOW = COALESCE_WINDOW
+    BAUD_RATE = None
+    RECONNECT_DELAY = RECONNECT_DELAY
+    RECONNECT_MAX_DELAY = RECONNECT_MAX_DELAY
+    READ_QUEUE_SIZE = 1024
+
+    def __init__(self, host, port, callback: Optional[Callable] = None, login=None,
+                 event_callback: Optional[Callable] = None, event_window: Optional[float] = None,
+                 baud: Optional[int] = None, executor=None, state_file: Optional[str] = None):
+        """Prepare a connection to the controller at host, port.
+
+        With baud, writes are paced to what the controller's serial line drains.
+        With a DispatchExecutor, handlers run on its worker threads.
+        With state_file, the state is restored from and kept in that file.
+        A lost connection is re-established with backoff until close().
+        """
+        BaseHomeworks.__init__(self, callback, event_callback, event_window, executor, state_file)
+        self._host = host
+        self._port = port
+        self._login = login
+        self._baud = self.BAUD_RATE if baud is None else baud
+        self._transport: Optional[asyncio.Transport] = None
+        self._protocol: Optional[HomeworksProtocol] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_deadline: Optional[float] = None
+        self._backoff = Backoff(self.RECONNECT_DELAY, self.RECONNECT_MAX_DELAY)
+        self._reconnector: Optional[asyncio.Task] = None
+        # Loop of the connection; monitor updates from other threads run on it.
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.metrics.add_gauge('read_queue_depth',
+                               lambda: self._protocol.read_queue.qsize() if self._protocol else 0)
+        self.metrics.add_gauge('read_queue_occupancy',
+                               lambda: self._protocol.queue_occupancy if self._protocol else 0.)
+        self.metrics.add_gauge('outgoing_queue_depth',
+                               lambda: self._protocol.outgoing_depth if self._protocol else 0)
+
+    @property
+    def connected(self) -> bool:
+        """Whether the connection is up and subscribed."""
+        return self._transport is not None and not self._transport.is_closing()
+
+    def _make_protocol(self) -> HomeworksProtocol:
+        protocol = HomeworksProtocol(self._login, self.COALESCE_WINDOW, self._baud, self.metrics,
+                                     self.READ_QUEUE_SIZE)
+        protocol.capture = self.capture
+        protocol.drop_prefixes = self._drop_prefixes
+        return protocol
+
+    def start_capture(self, file):
+        capture = BaseHomeworks.start_capture(self, file)
+        if self._protocol is not None:
+            self._protocol.capture = capture
+        return capture
+
+    def stop_capture(self):
+        if self._protocol is not None:
+            self._protocol.capture = None
+        BaseHomeworks.stop_capture(self)
+
+    async def connect(self):
+        """Connect, log in and subscribe to controller events."""
+        loop = asyncio.get_running_loop()
+        try:
+            transport, protocol = await loop.create_connection(self._make_protocol, self._host, self._port)
+        except OSError as error:
+            raise ConnectionError(f"Couldn't connect to '{self._host}:{self._port}': {error}")
+        _LOGGER.info(f"Connected to '{self._host}:{self._port}'")
+        await self._attach(transport, protocol)
+
+    async def replay(self, capture, speed: Optional[float] = 1.):
+        """Play captured traffic through the parse and dispatch path instead of connecting.
+
+        capture is a capture file path or iterable of Records; speed scales the
+        recorded timing, None plays as fast as possible. Returns once every
+        received message was dispatched; call close() afterwards.
+        """
+        records = read_capture(capture) if isinstance(capture, str) else capture
+        protocol = self._make_protocol()
+        transport = ReplayTransport(records, protocol, speed)
+        transport.start()
+        await self._attach(transport, protocol)
+        await transport.done
+        while protocol.read_queue.qsize():
+            await asyncio.sleep(0)
+        if self.coalescer is not None:
+            self.coalescer.flush()
+
+    async def _attach(self, transport: asyncio.Transport, protocol: HomeworksProtocol):
+        loop = self._loop = asyncio.get_running_loop()
+        self._transport, self._protocol = transport, protocol
+        self._protocol.connection_lost_future.add_done_callback(self._on_connection_lost)
+        try:
+            await self._protocol.ready_future
+        except Exception:
+            transport, self._transport = self._transport, None
+            transport.close()
+            raise
+
+        self._subscribe()
+        self._arm_timer()
+        self._reader = loop.create_task(self._read())
+
+    async def close(self):
+        """Close the connection to the controller."""
+        self._queries.cancel_all(ConnectionError("Connection closed"))
+        if self._reconnector is not None:
+            self._reconnector.cancel()
+            self._reconnector = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self._transport is not None:
+            self._protocol.flush()
+            self._transport.close()
+            self._transport = None
+            self._monitoring = None
+            try:
+                await self._protocol.connection_lost_future
+            except HomeworksConnectionLost:
+                pass
+        if self.executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.executor.close)
+        self.state.close()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def fade_dim(self, intensity, fade_time, delay_time, addr):
+        """Change the brightness of a light."""
+        await asyncio.wrap_future(self._send('FADEDIM, %d, %d, %d, %s' %
+                                             (intensity, fade_time, delay_time, addr)))
+
+    async def fade_many(self, fades):
+        """Change the brightness of many lights with one write.
+
+        fades is an iterable of (addr, intensity, fade_time, delay_time);
+        lights fading alike share a FADEDIM command and the last fade of an
+        address wins.
+        """
+        await asyncio.wrap_future(self._send_encoded(encode_fades(fades)))
+
+    async def request_dimmer_level(self, addr):
+        """Request the controller to return brightness."""
+        await asyncio.wrap_future(self._send('RDL, %s' % addr, PRIORITY_BACKGROUND))
+
+    async def query_levels(self, addrs: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Query the brightness of many lights with pipelined requests.
+
+        Lights that do not answer within QUERY_TIMEOUT map to None.
+        """
+        if not self.connected:
+            raise ConnectionError(f"Not connected to '{self._host}:{self._port}'")
+        futures = self._queries.query(addrs)
+        self._arm_timer()
+        levels = {}
+        for addr, future in futures.items():
+            try:
+                levels[addr] = await asyncio.wrap_future(future)
+            except (TimeoutError, asyncio.TimeoutError):
+                levels[addr] = None
+        return levels
+
+    def _arm_timer(self):
+        deadline = self._next_deadline()
+        if deadline is None or (self._timer is not None and self._timer_deadline <= deadline):
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_deadline = deadline
+        self._timer = asyncio.get_running_loop().call_later(
+            max(0., deadline - time.monotonic()), self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._run_timers()
+        self._arm_timer()
+
+    def _send(self, command: str, priority: int = PRIORITY_INTERACTIVE) -> Future:
+        """Queue a command; the returned future completes once it was written."""
+        _LOGGER.debug("send: %s", command)
+        return self._send_encoded(encode_command(command), priority)
+
+    def _send_encoded(self, data: bytes, priority: int = PRIORITY_INTERACTIVE) -> Future:
+        """Queue already encoded commands as one write."""
+        if not self.connected:
+            raise ConnectionError(f"Not connected to '{self._host}:{self._port}'")
+        return self._protocol.send(data, priority)
+
+    @property
+    def outgoing_stats(self):
+        """Queueing delay of sent commands per priority lane."""
+        return self._protocol.outgoing_stats if self._protocol is not None else None
+
+    def _update_monitoring(self):
+        loop = self._loop
+        if loop is not None and not loop.is_closed() and not _runs_on(loop):
+            # Subscribed from another thread; the protocol belongs to the loop.
+            loop.call_soon_threadsafe(self._update_monitoring)
+            return
+        BaseHomeworks._update_monitoring(self)
+        if self._protocol is not None:
+            self._protocol.drop_prefixes = self._drop_prefixes
+
+    async def _read(self):
+        queue = self._protocol.read_queue
+        while True:
+            message = await queue.get()
+            try:
+                self._process_line(message.raw, message.timestamp)
+            except Exception:
+                _LOGGER.exception("Error in event handler for %s", message)
+            if self.coalescer is not None and len(self.coalescer):
+                self._arm_timer()
+
+    def _on_connection_lost(self, future: asyncio.Future):
+        exc = future.exception()
+        if self._transport is None:
+            # Closed on purpose.
+            return
+        _LOGGER.warning("Lost connection: %s", exc)
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        self._transport = None
+        self._monitoring = None
+        self._queries.cancel_all(ConnectionError("Lost connection"))
+        self.metrics.reconnects += 1
+        self._reconnector = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while True:
+            delay = self._backoff.next_delay()
+            _LOGGER.info("Reconnecting in %.1fs", delay)
+            await asyncio.sleep(delay)
+            try:
+                await self.connect()
+            except (ConnectionError, HomeworksConnectionLost) as error:
+                _LOGGER.warning("%s", error)
+                continue
+            except HomeworksAuthenticationException as error:
+                _LOGGER.error("Giving up reconnecting: %s", error)
+                self._reconnector = None
+                return
+            self._reconnector = None
+            self._backoff.reset()
+            self._resync()
+            self._arm_timer()
+            return
@@ -0,0 +1,35 @@
+"""
+Delays between reconnect attempts.
+
+Attempts back off exponentially up to a ceiling. Each delay is shortened by
+a random fraction, so that many clients losing the same NPort do not all
+reconnect in the same instant.
+"""
+import random
+from typing import Callable
+
+RECONNECT_DELAY = 1.
+RECONNECT_MAX_DELAY = 60.
+
+
+class Backoff:
+    """Jittered exponential backoff."""
+
+    def __init__(self, initial: float = RECONNECT_DELAY, maximum: float = RECONNECT_MAX_DELAY,
+                 factor: float = 2., jitter: float = 0.5, rng: Callable[[], float] = random.random):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self._rng = rng
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        """Delay before the next attempt; each call counts as one attempt."""
+        base = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return base * (1. - self.jitter * self._rng())
+
+    def reset(self):
+        """Start over after a connection proved usable."""
+        self.attempts = 0
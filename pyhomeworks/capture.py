@@ -0,0 +1,173 @@
+"""
+Traffic capture and replay.
+
+A capture file starts with ``MAGIC`` followed by one record per chunk of
+traffic: a little endian header of monotonic timestamp (double), direction
+(byte) and length (uint32), then the raw bytes. Files are only ever appended
+to, so a capture survives the process being killed mid-write except for the
+last record.
+
+``ReplayTransport`` feeds the received side of a capture into a
+``HomeworksProtocol`` with the original timing, scaled by a speed factor, or
+as fast as the protocol accepts it. Writes are recorded but go nowhere.
+"""
+import asyncio
+import struct
+import time
+from threading import Lock
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Union
+
+MAGIC = b'HWCAP\x00\x01\n'
+DIRECTION_IN = 0
+DIRECTION_OUT = 1
+
+_HEADER = struct.Struct('<dBI')
+
+
+class Record(NamedTuple):
+    timestamp: float
+    direction: int
+    data: bytes
+
+
+class CaptureWriter:
+    """Append traffic records to a capture file; safe to use from several threads."""
+
+    def __init__(self, file: Union[str, BinaryIO]):
+        self._owned = isinstance(file, str)
+        self._file = open(file, 'ab') if self._owned else file
+        self._lock = Lock()
+        self._closed = False
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def record(self, direction: int, data, timestamp: Optional[float] = None):
+        """Append data (any bytes-like object) seen at timestamp; ignored once closed."""
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            if self._closed:
+                return
+            self._file.write(_HEADER.pack(timestamp, direction, len(data)))
+            self._file.write(data)
+
+    def flush(self):
+        with self._lock:
+            if not self._closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._owned:
+                self._file.close()
+            else:
+                self._file.flush()
+
+
+def read_capture(file: Union[str, BinaryIO]) -> Iterator[Record]:
+    """Yield the records of a capture; a truncated last record is ignored."""
+    if isinstance(file, str):
+        with open(file, 'rb') as opened:
+            yield from read_capture(opened)
+        return
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a capture file")
+    while True:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        timestamp, direction, length = _HEADER.unpack(header)
+        data = file.read(length)
+        if len(data) < length:
+            return
+        yield Record(timestamp, direction, data)
+
+
+class ReplayTransport(asyncio.Transport):
+    """Transport that plays the received side of a capture into a protocol.
+
+    speed scales the recorded gaps (2.0 replays twice as fast); None replays
+    as fast as possible while still yielding to the event loop.
+    """
+
+    def __init__(self, records, protocol: asyncio.BaseProtocol, speed: Optional[float] = 1.):
+        super().__init__()
+        self._records = [record for record in records if record.direction == DIRECTION_IN]
+        self._protocol = protocol
+        self._speed = speed
+        self._loop = asyncio.get_running_loop()
+        self._closing = False
+        self._paused = False
+        self._resumed: Optional[asyncio.Future] = None
+        self.written: List[bytes] = []
+        self.done = self._loop.create_future()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Connect the protocol and start playing."""
+        self._protocol.connection_made(self)
+        self._task = self._loop.create_task(self._play())
+
+    async def _play(self):
+        records = self._records
+        start = records[0].timestamp if records else 0.
+        started = self._loop.time()
+        for record in records:
+            if self._speed is None:
+                await asyncio.sleep(0)
+            else:
+                delay = started + (record.timestamp - start) / self._speed - self._loop.time()
+                await asyncio.sleep(max(0., delay))
+            while self._paused and not self._closing:
+                self._resumed = self._loop.create_future()
+                await self._resumed
+            if self._closing:
+                break
+            self._deliver(record.data)
+        if not self.done.done():
+            self.done.set_result(len(records))
+
+    def _deliver(self, data: bytes):
+        protocol = self._protocol
+        if isinstance(protocol, asyncio.BufferedProtocol):
+            view = memoryview(data)
+            while view:
+                buffer = protocol.get_buffer(len(view))
+                size = min(len(buffer), len(view))
+                buffer[:size] = view[:size]
+                protocol.buffer_updated(size)
+                view = view[size:]
+        else:
+            protocol.data_received(data)
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+        if not self.done.done():
+            self.done.set_result(None)
+        self._loop.call_soon(self._protocol.connection_lost, None)
+
+    def abort(self):
+        self.close()
+
+    def pause_reading(self):
+        self._paused = True
+
+    def resume_reading(self):
+        self._paused = False
+        if self._resumed is not None and not self._resumed.done():
+            self._resumed.set_result(None)
+
+    def is_reading(self) -> bool:
+        return not self._paused
@@ -0,0 +1,108 @@
+"""
+Per-address coalescing of state events.
+
+During a fade or scene change the controller streams many intermediate DL
+(and KLS) lines for the same address. ``EventCoalescer`` delivers the first
+event of a quiet address immediately, then at most one event per ``window``
+seconds for that address, always ending with the latest value. Events equal
+to the last delivered one are dropped. Button events are never coalesced.
+"""
+import heapq
+import itertools
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .address import normalize_address
+from .events import KeypadEnableChanged, LedStateChanged, LightChanged, merge_events
+
+COALESCED_EVENTS = (LightChanged, LedStateChanged, KeypadEnableChanged)
+
+
+class EventCoalescer:
+    """Bound the per-address event rate while keeping the final value."""
+
+    def __init__(self, deliver: Callable, window: float):
+        self._deliver = deliver
+        self.window = window
+        self._windows: Dict[tuple, float] = {}
+        # (type, address) -> (delivered at, event)
+        self._delivered: Dict[tuple, Tuple[float, object]] = {}
+        # (type, address) -> (deadline, latest undelivered event)
+        self._pending: Dict[tuple, Tuple[float, object]] = {}
+        self._deadlines: List[Tuple[float, int, tuple]] = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def set_window(self, addr, window: Optional[float]):
+        """Override the window for one address; None restores the default."""
+        addr = normalize_address(addr)
+        if window is None:
+            self._windows.pop(addr, None)
+        else:
+            self._windows[addr] = window
+
+    def submit(self, event, now: Optional[float] = None):
+        """Deliver the event now, later, or not at all."""
+        kind = type(event)
+        if kind not in COALESCED_EVENTS:
+            self._deliver(event)
+            return
+
+        address = normalize_address(event.address)
+        key = (kind, address)
+        last = self._delivered.get(key)
+        if last is not None and last[1][1] == event[1]:
+            # Back to the delivered value: nothing left to report.
+            self._pending.pop(key, None)
+            return
+
+        now = time.monotonic() if now is None else now
+        window = self._windows.get(address, self.window)
+        if last is None or now - last[0] >= window:
+            self._pending.pop(key, None)
+            self._delivered[key] = (now, event)
+            self._deliver(event)
+            return
+
+        pending = self._pending.get(key)
+        if pending is None:
+            deadline = last[0] + window
+            heapq.heappush(self._deadlines, (deadline, next(self._sequence), key))
+        else:
+            deadline = pending[0]
+            event = merge_events(pending[1], event)
+        self._pending[key] = (deadline, event)
+
+    def poll(self, now: Optional[float] = None):
+        """Deliver pending events whose window has passed."""
+        now = time.monotonic() if now is None else now
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            deadline, _, key = heapq.heappop(deadlines)
+            pending = self._pending.get(key)
+            if pending is not None and pending[0] == deadline:
+                del self._pending[key]
+                self._delivered[key] = (now, pending[1])
+                self._deliver(pending[1])
+
+    def next_deadline(self) -> Optional[float]:
+        """Monotonic time at which poll() has something to deliver."""
+        deadlines = self._deadlines
+        while deadlines:
+            deadline, _, key = deadlines[0]
+            pending = self._pending.get(key)
+            if pending is not None and pending[0] == deadline:
+                return deadline
+            heapq.heappop(deadlines)
+        return None
+
+    def flush(self):
+        """Deliver every pending event immediately."""
+        self._deadlines.clear()
+        pending, self._pending = self._pending, {}
+        now = time.monotonic()
+        for key, (_, event) in pending.items():
+            self._delivered[key] = (now, event)
+            self._deliver(event)
@@ -0,0 +1,123 @@
+"""
+Indexed event dispatch.
+
+Handlers register for an address, optionally narrowed to an action (one of
+the HW_* callback types) and a button number. Dispatching an event costs a
+fixed number of dict lookups no matter how many handlers exist, and only the
+handlers registered for that exact key are called.
+
+``on_change`` is called whenever the set of subscribed actions changes, so
+the connection can adjust which messages it asks the controller for.
+"""
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .address import Address, normalize_address
+from .events import ButtonEvent
+
+Key = Tuple[Optional[str], Address, Optional[int]]
+
+
+class EventDispatcher:
+    """Route events to handlers keyed by (action, address, button)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._handlers: Dict[Key, Tuple[Callable, ...]] = {}
+        self._addresses: Dict[Address, int] = {}
+        self._actions: Dict[Optional[str], int] = {}
+        self.on_change: Optional[Callable[[], None]] = None
+
+    def __len__(self) -> int:
+        return sum(len(handlers) for handlers in self._handlers.values())
+
+    def subscribe(self, handler: Callable, address, action: Optional[str] = None,
+                  button: Optional[int] = None) -> Callable[[], None]:
+        """Call handler(event) for matching events; returns an unsubscribe function.
+
+        Without action the handler receives every event for the address;
+        button only applies to button actions.
+        """
+        if button is not None and action is None:
+            raise ValueError("button requires an action")
+        key = (action, normalize_address(address), button)
+        with self._lock:
+            self._handlers[key] = self._handlers.get(key, ()) + (handler,)
+            self._addresses[key[1]] = self._addresses.get(key[1], 0) + 1
+            self._actions[action] = self._actions.get(action, 0) + 1
+            changed = self._actions[action] == 1
+        if changed and self.on_change is not None:
+            self.on_change()
+
+        def unsubscribe():
+            with self._lock:
+                handlers = list(self._handlers.get(key, ()))
+                if handler not in handlers:
+                    return
+                handlers.remove(handler)
+                if handlers:
+                    self._handlers[key] = tuple(handlers)
+                else:
+                    del self._handlers[key]
+                count = self._addresses[key[1]] - 1
+                if count:
+                    self._addresses[key[1]] = count
+                else:
+                    del self._addresses[key[1]]
+                count = self._actions[action] - 1
+                if count:
+                    self._actions[action] = count
+                else:
+                    del self._actions[action]
+            if not count and self.on_change is not None:
+                self.on_change()
+
+        return unsubscribe
+
+    def has_subscribers(self, address) -> bool:
+        """Whether any handler is registered for the address."""
+        return normalize_address(address) in self._addresses
+
+    def actions(self) -> Set[Optional[str]]:
+        """Actions with at least one handler; None stands for handlers of every action."""
+        return set(self._actions)
+
+    def addresses(self, action: Optional[str] = None):
+        """Normalized addresses that have at least one handler.
+
+        With action, only addresses whose handlers receive that action.
+        """
+        if action is None:
+            return list(self._addresses)
+        with self._lock:
+            return list({key[1]: None for key in self._handlers if key[0] in (action, None)})
+
+    def handlers_for(self, event) -> List[Callable]:
+        """The handlers dispatch(event) would call, in order."""
+        address = normalize_address(event.address)
+        if address not in self._addresses:
+            return []
+        handlers = self._handlers
+        action = event.action
+        keys = [(action, address, None), (None, address, None)]
+        if type(event) is ButtonEvent:
+            keys.insert(0, (action, address, event.button))
+        return [handler for key in keys for handler in handlers.get(key, ())]
+
+    def dispatch(self, event) -> int:
+        """Call the handlers registered for the event; returns how many ran."""
+        address = normalize_address(event.address)
+        if address not in self._addresses:
+            return 0
+        handlers = self._handlers
+        action = event.action
+        called = 0
+        if type(event) is ButtonEvent:
+            for handler in handlers.get((action, address, event.button), ()):
+                handler(event)
+                called += 1
+        for key in ((action, address, None), (None, address, None)):
+            for handler in handlers.get(key, ()):
+                handler(event)
+                called += 1
+        return called
@@ -0,0 +1,117 @@
+"""
+Typed events produced from controller messages.
+
+Events are immutable named tuples, so they carry no per-instance ``__dict__``
+and consumers can dispatch on their type instead of comparing action strings.
+``timestamp`` is the ``time.monotonic()`` value taken when the bytes were
+received.
+"""
+from functools import partial
+from typing import Callable, Dict, NamedTuple, Optional
+
+# Callback types
+HW_BUTTON_DOUBLE_TAP = 'button_double_tap'
+HW_BUTTON_HOLD = 'button_hold'
+HW_BUTTON_PRESSED = 'button_pressed'
+HW_BUTTON_RELEASED = 'button_released'
+HW_KEYPAD_ENABLE_CHANGED = 'keypad_enable_changed'
+HW_KEYPAD_LED_CHANGED = 'keypad_led_changed'
+HW_LIGHT_CHANGED = 'light_changed'
+
+
+class LightChanged(NamedTuple):
+    """A dimmer reported a new level (DL)."""
+    address: str
+    level: int
+    timestamp: float
+
+    action = HW_LIGHT_CHANGED
+
+    @property
+    def args(self) -> list:
+        return [self.address, self.level]
+
+
+class ButtonEvent(NamedTuple):
+    """A keypad, dimmer or seeTouch button was pressed, released, held or double tapped."""
+    action: str
+    address: str
+    button: int
+    timestamp: float
+
+    @property
+    def args(self) -> list:
+        return [self.address, self.button]
+
+
+class LedStateChanged(NamedTuple):
+    """A keypad reported its LED states (KLS).
+
+    leds holds one state per LED as bytes. changed is a bit mask of the LEDs
+    that differ from the previously known states (all of them for a keypad
+    seen the first time); it is None for events that were not compared.
+    """
+    address: str
+    leds: bytes
+    timestamp: float
+    changed: Optional[int] = None
+
+    action = HW_KEYPAD_LED_CHANGED
+
+    @property
+    def args(self) -> list:
+        return [self.address, list(self.leds)]
+
+    def led_changed(self, index: int) -> bool:
+        """Whether LED index (0 based) changed; True if not compared."""
+        return self.changed is None or bool(self.changed >> index & 1)
+
+    def changes(self) -> Dict[int, int]:
+        """New state of every changed LED by index."""
+        if self.changed is None:
+            return dict(enumerate(self.leds))
+        return {index: self.leds[index] for index in range(len(self.leds)) if self.changed >> index & 1}
+
+
+class KeypadEnableChanged(NamedTuple):
+    """A keypad was enabled or disabled (KES)."""
+    address: str
+    enabled: bool
+    timestamp: float
+
+    action = HW_KEYPAD_ENABLE_CHANGED
+
+    @property
+    def args(self) -> list:
+        return [self.address, self.enabled]
+
+
+EVENT_TYPES = {
+    HW_BUTTON_PRESSED: partial(ButtonEvent, HW_BUTTON_PRESSED),
+    HW_BUTTON_RELEASED: partial(ButtonEvent, HW_BUTTON_RELEASED),
+    HW_BUTTON_HOLD: partial(ButtonEvent, HW_BUTTON_HOLD),
+    HW_BUTTON_DOUBLE_TAP: partial(ButtonEvent, HW_BUTTON_DOUBLE_TAP),
+    HW_KEYPAD_LED_CHANGED: LedStateChanged,
+    HW_LIGHT_CHANGED: LightChanged,
+    HW_KEYPAD_ENABLE_CHANGED: KeypadEnableChanged,
+}
+
+
+def merge_events(older, newer):
+    """Event replacing older with newer, keeping what older reported as changed."""
+    if type(newer) is LedStateChanged and older.changed is not None and newer.changed is not None:
+        return newer._replace(changed=older.changed | newer.changed)
+    return newer
+
+
+def make_event(action: str, address, value, timestamp: float):
+    """Build the event for a callback type from its parsed arguments."""
+    return EVENT_TYPES[action](address, value, timestamp)
+
+
+def legacy_callback(callback: Callable[[str, list], None]) -> Callable:
+    """Adapt a ``callback(action_name, args)`` function to receive events."""
+    def adapter(event):
+        callback(event.action, event.args)
+
+    return adapter
@@ -0,0 +1,166 @@
+"""
+Decoupled event dispatch.
+
+``DispatchExecutor`` sits between parsing and the user's handlers: the
+reader only queues the event and returns, worker threads run the handlers.
+Events are sharded over the workers by address, so events for one address
+are always handled in order by the same worker.
+
+Each shard is bounded. What happens when a shard is full is decided by the
+overflow policy:
+
+* ``OVERFLOW_BLOCK`` waits for space. The reader then waits on slow handlers.
+* ``OVERFLOW_DROP_OLDEST`` drops the oldest queued event of the shard.
+* ``OVERFLOW_COALESCE`` replaces a queued state event of the same type and
+  address with the new one, keeping its position. When there is nothing to
+  replace, the oldest event is dropped.
+"""
+import logging
+from collections import deque
+from threading import Condition, Thread
+from typing import Callable, Deque, Dict, List, Optional
+
+from .address import normalize_address
+from .coalesce import COALESCED_EVENTS
+from .events import merge_events
+
+_LOGGER = logging.getLogger(__name__)
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_COALESCE = 'coalesce'
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_COALESCE)
+
+DEFAULT_MAXSIZE = 1024
+
+
+class _Shard(Thread):
+    """One worker and its bounded queue of [event] slots."""
+
+    def __init__(self, executor: 'DispatchExecutor', index: int, maxsize: int):
+        Thread.__init__(self, name=f'homeworks-dispatch-{index}', daemon=True)
+        self._executor = executor
+        self.maxsize = maxsize
+        self.condition = Condition()
+        self.queue: Deque[list] = deque()
+        # (type, address) -> queued slot, for coalescing
+        self.slots: Dict[tuple, list] = {}
+        self.closing = False
+        self.busy = False
+
+    def put(self, event, policy: str) -> bool:
+        """Queue the event; False if it was merged into a queued one."""
+        executor = self._executor
+        kind = type(event)
+        key = (kind, normalize_address(event.address)) if kind in COALESCED_EVENTS else None
+        with self.condition:
+            if len(self.queue) >= self.maxsize:
+                if policy == OVERFLOW_BLOCK:
+                    while len(self.queue) >= self.maxsize and not self.closing:
+                        self.condition.wait()
+                else:
+                    slot = self.slots.get(key) if policy == OVERFLOW_COALESCE and key else None
+                    if slot is not None:
+                        slot[0] = merge_events(slot[0], event)
+                        executor.coalesced += 1
+                        return False
+                    self._drop_oldest()
+            slot = [event, key]
+            self.queue.append(slot)
+            if key is not None:
+                self.slots[key] = slot
+            self.condition.notify_all()
+        return True
+
+    def _drop_oldest(self):
+        slot = self.queue.popleft()
+        self._forget(slot)
+        self._executor.dropped += 1
+        _LOGGER.warning("Dispatch queue full, dropped %s", slot[0])
+
+    def _forget(self, slot):
+        key = slot[1]
+        if key is not None and self.slots.get(key) is slot:
+            del self.slots[key]
+
+    def run(self):
+        dispatch = self._executor.dispatch
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.busy = False
+                    self.condition.notify_all()
+                    if self.closing:
+                        return
+                    self.condition.wait()
+                slot = self.queue.popleft()
+                self._forget(slot)
+                self.busy = True
+                self.condition.notify_all()
+            try:
+                dispatch(slot[0])
+            except Exception:
+                _LOGGER.exception("Error in event handler for %s", slot[0])
+
+
+class DispatchExecutor:
+    """Run event handlers on worker threads behind bounded queues."""
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, workers: int = 1,
+                 overflow: str = OVERFLOW_DROP_OLDEST):
+        """
+        :param maxsize: queued events per worker
+        :param workers: worker threads; one address always maps to one worker
+        :param overflow: one of OVERFLOW_POLICIES
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}")
+        self.maxsize = maxsize
+        self.workers = workers
+        self.overflow = overflow
+        self.dispatch: Optional[Callable] = None
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._shards: List[_Shard] = []
+
+    def __len__(self) -> int:
+        return sum(len(shard.queue) for shard in self._shards)
+
+    def bind(self, dispatch: Callable):
+        """Set the function that runs the handlers of one event."""
+        self.dispatch = dispatch
+
+    def submit(self, event):
+        """Queue the event for its address's worker; never runs handlers inline.
+
+        Events submitted after close() are dropped.
+        """
+        if self.closed:
+            self.dropped += 1
+            return
+        if not self._shards:
+            self._shards = [_Shard(self, index, self.maxsize) for index in range(self.workers)]
+            for shard in self._shards:
+                shard.start()
+        shard = self._shards[hash(normalize_address(event.address)) % len(self._shards)]
+        shard.put(event, self.overflow)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued event was handled."""
+        for shard in self._shards:
+            with shard.condition:
+                if not shard.condition.wait_for(lambda: not shard.queue and not shard.busy, timeout):
+                    return False
+        return True
+
+    def close(self, timeout: float = 1.):
+        """Handle what is queued, then stop the workers."""
+        self.closed = True
+        for shard in self._shards:
+            with shard.condition:
+                shard.closing = True
+                shard.condition.notify_all()
+        for shard in self._shards:
+            shard.join(timeout)
+        self._shards = []
@@ -0,0 +1,56 @@
+"""
+Bulk fades.
+
+``FADEDIM`` takes a list of addresses after intensity, fade and delay time,
+so a batch of fades is sent as one command per distinct (intensity, fade,
+delay) group instead of one command per light. Addresses are written in
+their shortest form, ``[1:1:0:2:4]``, and a group is split over several
+commands only when it exceeds ``MAX_FADE_ADDRESSES``.
+
+Within a batch the last fade of an address wins; earlier ones are dropped.
+"""
+from typing import Dict, Iterable, List, Tuple
+
+from .address import normalize_address
+from .writer import COMMAND_SEPARATOR
+
+# Addresses per FADEDIM line; keeps lines well within the controller's buffer.
+MAX_FADE_ADDRESSES = 10
+
+Fade = Tuple[object, float, float, float]
+
+
+def _compact_address(addr: tuple) -> str:
+    return '[' + ':'.join(str(part) for part in addr) + ']'
+
+
+def group_fades(fades: Iterable[Fade]) -> List[Tuple[Tuple[int, int, int], List[tuple]]]:
+    """Group (addr, intensity, fade_time, delay_time) tuples by their parameters.
+
+    Returns ((intensity, fade_time, delay_time), addresses) pairs in the
+    order the groups first appear, with each address in one group only.
+    """
+    latest: Dict[tuple, Tuple[int, int, int]] = {}
+    for addr, intensity, fade_time, delay_time in fades:
+        addr = normalize_address(addr)
+        # Re-insert so a superseded fade doesn't keep its earlier position.
+        latest.pop(addr, None)
+        latest[addr] = (int(intensity), int(fade_time), int(delay_time))
+    groups: Dict[Tuple[int, int, int], List[tuple]] = {}
+    for addr, params in latest.items():
+        groups.setdefault(params, []).append(addr)
+    return list(groups.items())
+
+
+def encode_fades(fades: Iterable[Fade]) -> bytes:
+    """Encode a batch of fades as the shortest sequence of FADEDIM commands."""
+    # Not through encode_command: batches rarely repeat and would only push
+    # single commands out of its cache.
+    data = bytearray()
+    for (intensity, fade_time, delay_time), addrs in group_fades(fades):
+        for start in range(0, len(addrs), MAX_FADE_ADDRESSES):
+            chunk = addrs[start:start + MAX_FADE_ADDRESSES]
+            data += ('FADEDIM, %d, %d, %d, %s' % (intensity, fade_time, delay_time,
+                                                  ', '.join(map(_compact_address, chunk)))).encode('utf8')
+            data += COMMAND_SEPARATOR
+    return bytes(data)
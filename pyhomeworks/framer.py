@@ -0,0 +1,175 @@
+"""
+Receive framer shared by the threaded reader and the asyncio protocol.
+
+Incoming bytes are written into a preallocated ``bytearray`` and consumed by
+advancing a read offset, so extracting N lines from a burst costs O(N) instead
+of re-slicing an immutable buffer after every line.
+"""
+from typing import Iterator, Optional, Sequence, Tuple
+
+FRAME_LINE = 0
+FRAME_PROMPT = 1
+FRAME_LOGIN = 2
+
+Frame = Tuple[int, bytes]
+
+
+class Framer:
+    """Split a controller byte stream into lines, prompts and login requests."""
+
+    COMMAND_SEPARATOR = b'\r\n'
+    PROMPT_REQUESTS = (b'LNET> ', b'L232> ')
+    LOGIN_REQUEST = b'LOGIN: '
+
+    MIN_READ_SIZE = 1024
+    MAX_READ_SIZE = 64 * 1024
+
+    def __init__(self, size: int = 16 * 1024,
+                 separator: bytes = COMMAND_SEPARATOR,
+                 prompts: Sequence[bytes] = PROMPT_REQUESTS,
+                 login: bytes = LOGIN_REQUEST):
+        self._buffer = bytearray(max(size, self.MIN_READ_SIZE))
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        # Everything in [_start, _scanned) is known to contain no token
+        # except the partial tail that may still complete.
+        self._scanned = 0
+        self._read_size = self.MIN_READ_SIZE
+
+        self._separator = separator
+        self._tokens = [(prompt, FRAME_PROMPT) for prompt in prompts]
+        self._tokens.append((login, FRAME_LOGIN))
+        self._max_token = max(len(token) for token, _ in self._tokens)
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def read_size(self) -> int:
+        """Size of the next read requested from the transport."""
+        return self._read_size
+
+    def clear(self):
+        """Drop all buffered data, e.g. after the connection was lost."""
+        self._start = self._end = self._scanned = 0
+        self._read_size = self.MIN_READ_SIZE
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """Return writable free space for the next read (``recv_into``)."""
+        wanted = min(max(sizehint, self._read_size), self.MAX_READ_SIZE)
+        self._reserve(wanted)
+        return self._view[self._end:self._end + wanted]
+
+    def buffer_updated(self, nbytes: int):
+        """Commit ``nbytes`` written into the view from ``get_buffer``."""
+        requested = self._read_size
+        self._end += nbytes
+        if nbytes >= requested:
+            self._read_size = min(requested * 2, self.MAX_READ_SIZE)
+        elif nbytes < requested // 4:
+            self._read_size = max(requested // 2, self.MIN_READ_SIZE)
+
+    def recv_into(self, sock) -> int:
+        """Read once from ``sock`` into the buffer; returns the byte count."""
+        view = self.get_buffer()
+        nbytes = sock.recv_into(view, len(view))
+        self.buffer_updated(nbytes)
+        return nbytes
+
+    def feed(self, data: bytes):
+        """Append bytes that were received elsewhere."""
+        size = len(data)
+        self._reserve(size)
+        self._buffer[self._end:self._end + size] = data
+        self._end += size
+
+    def frames(self) -> Iterator[Frame]:
+        """Yield every complete frame currently in the buffer."""
+        separator = self._separator
+        while True:
+            start = self._start
+            end = self._end
+            last = self._buffer.rfind(separator, max(start, self._scanned - len(separator) + 1), end)
+            if last > start:
+                # Fast path: split every complete line in front of the first
+                # prompt/login token with a single ``bytes.split``.
+                token = self._find_token(max(start, self._scanned - self._max_token + 1), last)[0]
+                cut = last if token < 0 else self._buffer.rfind(separator, start, token)
+                if cut > start:
+                    lines = bytes(self._view[start:cut]).split(separator)
+                    self._advance(cut + len(separator))
+                    for line in lines:
+                        yield FRAME_LINE, line
+
+            frame = self.next_frame()
+            if frame is None:
+                return
+            yield frame
+
+    def next_frame(self) -> Optional[Frame]:
+        """Extract the next complete frame, or ``None`` if more data is needed."""
+        buffer = self._buffer
+        start = self._start
+        end = self._end
+        if start == end:
+            return None
+
+        scan = max(start, self._scanned - len(self._separator) + 1)
+        line_end = buffer.find(self._separator, scan, end)
+        limit = end if line_end < 0 else line_end
+
+        # Prompts and LOGIN are not terminated, so look for them anywhere
+        # between the read offset and the end of the current line.
+        found, found_token = self._find_token(max(start, self._scanned - self._max_token + 1), limit)
+        if found_token is not None:
+            token, kind = found_token
+            if found != start:
+                # Cut the token out and keep the partial line in front of it.
+                buffer[start + len(token):found + len(token)] = buffer[start:found]
+            self._advance(start + len(token))
+            return kind, token
+
+        if line_end < 0:
+            self._scanned = end
+            return None
+
+        line = bytes(self._view[start:line_end])
+        self._advance(line_end + len(self._separator))
+        return FRAME_LINE, line
+
+    def _find_token(self, start: int, end: int):
+        found = -1
+        found_token = None
+        for token in self._tokens:
+            index = self._buffer.find(token[0], start, end)
+            if index >= 0 and (found < 0 or index < found):
+                found = index
+                found_token = token
+        return found, found_token
+
+    def _advance(self, position: int):
+        if position == self._end:
+            self._start = self._end = self._scanned = 0
+        else:
+            self._start = self._scanned = position
+
+    def _reserve(self, size: int):
+        if len(self._buffer) - self._end >= size:
+            return
+
+        pending = self._end - self._start
+        if len(self._buffer) - pending < size or pending > len(self._buffer) // 2:
+            capacity = len(self._buffer)
+            while capacity - pending < size or pending > capacity // 2:
+                capacity *= 2
+            buffer = bytearray(capacity)
+            buffer[:pending] = self._view[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        else:
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+
+        self._scanned -= self._start
+        self._start = 0
+        self._end = pending
@@ -0,0 +1,170 @@
+"""
+Many controllers on one event loop.
+
+``HomeworksManager`` owns one ``AsyncHomeworks`` per controller id and feeds
+their events into a single callback as ``(controller_id, event)``, so a site
+with dozens of processors still runs on one loop and one thread.
+``SyncHomeworksManager`` runs a manager on a private loop thread and offers
+blocking, thread-safe methods for code that is not asyncio based.
+"""
+import asyncio
+from concurrent.futures import Future
+from threading import Thread
+from typing import Callable, Dict, Hashable, Iterable, Optional
+
+from .aio import AsyncHomeworks
+from .metrics import prometheus_text
+
+
+class HomeworksManager:
+    """Connections to many controllers sharing one event loop and dispatch path."""
+
+    def __init__(self, event_callback: Optional[Callable[[Hashable, object], None]] = None):
+        """event_callback(controller_id, event) receives events of every controller."""
+        self._event_callback = event_callback
+        self._controllers: Dict[Hashable, AsyncHomeworks] = {}
+
+    def __contains__(self, controller_id) -> bool:
+        return controller_id in self._controllers
+
+    def __getitem__(self, controller_id) -> AsyncHomeworks:
+        return self._controllers[controller_id]
+
+    def __len__(self) -> int:
+        return len(self._controllers)
+
+    @property
+    def controller_ids(self):
+        return list(self._controllers)
+
+    async def add_controller(self, controller_id: Hashable, host, port, login=None,
+                             **kwargs) -> AsyncHomeworks:
+        """Connect a controller; kwargs are passed on to AsyncHomeworks."""
+        if controller_id in self._controllers:
+            raise ValueError(f"Controller {controller_id!r} already exists")
+        if self._event_callback is not None:
+            # Without a manager callback controllers only monitor what is subscribed.
+            kwargs['event_callback'] = self._forwarder(controller_id)
+        controller = AsyncHomeworks(host, port, login=login, **kwargs)
+        self._controllers[controller_id] = controller
+        try:
+            await controller.connect()
+        except Exception:
+            del self._controllers[controller_id]
+            raise
+        return controller
+
+    async def remove_controller(self, controller_id: Hashable):
+        """Disconnect and forget a controller."""
+        await self._controllers.pop(controller_id).close()
+
+    async def close(self):
+        """Disconnect every controller."""
+        controllers = list(self._controllers.values())
+        self._controllers.clear()
+        await asyncio.gather(*(controller.close() for controller in controllers))
+
+    def subscribe(self, controller_id: Hashable, handler: Callable, address,
+                  action: Optional[str] = None, button: Optional[int] = None):
+        """Register handler(event) with one controller's dispatch index."""
+        return self._controllers[controller_id].dispatcher.subscribe(handler, address, action, button)
+
+    async def fade_dim(self, controller_id: Hashable, intensity, fade_time, delay_time, addr):
+        """Change the brightness of a light on one controller."""
+        await self._controllers[controller_id].fade_dim(intensity, fade_time, delay_time, addr)
+
+    async def fade_many(self, controller_id: Hashable, fades):
+        """Change the brightness of many lights on one controller with one write."""
+        await self._controllers[controller_id].fade_many(fades)
+
+    async def request_dimmer_level(self, controller_id: Hashable, addr):
+        """Request one controller to return brightness."""
+        await self._controllers[controller_id].request_dimmer_level(addr)
+
+    async def query_levels(self, controller_id: Hashable, addrs: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Query the brightness of many lights on one controller."""
+        return await self._controllers[controller_id].query_levels(addrs)
+
+    def get_level(self, controller_id: Hashable, addr) -> Optional[int]:
+        """Last reported level of a dimmer on one controller."""
+        return self._controllers[controller_id].state.get_level(addr)
+
+    def prometheus_text(self, prefix: str = 'homeworks') -> str:
+        """Metrics of every controller, labelled with its id."""
+        return prometheus_text((({'controller': str(controller_id)}, controller.metrics)
+                                for controller_id, controller in self._controllers.items()), prefix)
+
+    def _forwarder(self, controller_id):
+        def forward(event):
+            self._event_callback(controller_id, event)
+
+        return forward
+
+
+class SyncHomeworksManager:
+    """Thread-safe blocking facade over a HomeworksManager on its own loop thread.
+
+    Callbacks run on the loop thread.
+    """
+
+    def __init__(self, event_callback: Optional[Callable[[Hashable, object], None]] = None,
+                 timeout: float = 10.):
+        self._timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever, name='homeworks-manager', daemon=True)
+        self._thread.start()
+        self.manager = HomeworksManager(event_callback)
+
+    def _call(self, coro) -> object:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(self._timeout)
+
+    def _run(self, function: Callable, *args) -> object:
+        """Call function on the loop thread and wait for its result."""
+        async def call():
+            return function(*args)
+
+        return self._call(call())
+
+    def submit(self, coro) -> Future:
+        """Schedule any coroutine on the manager's loop."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def add_controller(self, controller_id: Hashable, host, port, login=None, **kwargs):
+        """Connect a controller and wait until it is subscribed."""
+        self._call(self.manager.add_controller(controller_id, host, port, login, **kwargs))
+
+    def remove_controller(self, controller_id: Hashable):
+        self._call(self.manager.remove_controller(controller_id))
+
+    def subscribe(self, controller_id: Hashable, handler: Callable, address,
+                  action: Optional[str] = None, button: Optional[int] = None) -> Callable[[], None]:
+        """Register handler(event) on the loop thread; returns an unsubscribe function."""
+        unsubscribe = self._run(self.manager.subscribe, controller_id, handler, address, action, button)
+        return lambda: self._run(unsubscribe)
+
+    def fade_dim(self, controller_id: Hashable, intensity, fade_time, delay_time, addr) -> Future:
+        """Change the brightness of a light; returns without waiting for the write."""
+        return self.submit(self.manager.fade_dim(controller_id, intensity, fade_time, delay_time, addr))
+
+    def fade_many(self, controller_id: Hashable, fades) -> Future:
+        """Change the brightness of many lights; returns without waiting for the write."""
+        return self.submit(self.manager.fade_many(controller_id, list(fades)))
+
+    def request_dimmer_level(self, controller_id: Hashable, addr) -> Future:
+        return self.submit(self.manager.request_dimmer_level(controller_id, addr))
+
+    def query_levels(self, controller_id: Hashable, addrs: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Query many levels and wait for the answers."""
+        return self._call(self.manager.query_levels(controller_id, addrs))
+
+    def get_level(self, controller_id: Hashable, addr) -> Optional[int]:
+        return self.manager.get_level(controller_id, addr)
+
+    def close(self):
+        """Disconnect everything and stop the loop thread."""
+        try:
+            self._call(self.manager.close())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(self._timeout)
+            self._loop.close()
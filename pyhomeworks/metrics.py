@@ -0,0 +1,139 @@
+"""
+Connection and parse pipeline metrics.
+
+Counters are plain integer attributes and the callback duration histogram
+uses fixed buckets, so updating them on the hot path is an attribute
+increment or a bisect. Each counter is written from a single thread (reader
+or writer), so no locking is needed; only the histogram is shared when a
+DispatchExecutor runs several workers, and an occasional lost increment is
+accepted there. Queue depths are gauges, read only when a snapshot is taken.
+
+``Metrics.snapshot()`` returns a plain dict. ``prometheus_text()`` renders
+one or more ``Metrics`` in the Prometheus text exposition format for any
+HTTP handler to serve.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; user callbacks normally take microseconds, anything near the
+# upper buckets stalls the reader.
+CALLBACK_BUCKETS = (0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.)
+
+
+class Histogram:
+    """Cumulative histogram over fixed upper bounds."""
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """(upper bound, cumulative count) pairs ending with +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    """Counters, gauges and the callback duration histogram of one connection."""
+
+    def __init__(self, actions: Iterable[str] = ()):
+        """actions are the message tokens counted in messages, like ACTIONS."""
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.messages: Dict[str, int] = dict.fromkeys(actions, 0)
+        self.parse_failures = 0
+        self.unknown_messages = 0
+        self.dropped_messages = 0
+        self.reconnects = 0
+        self.callback_duration = Histogram(CALLBACK_BUCKETS)
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def add_gauge(self, name: str, read: Callable[[], float]):
+        """Report read() as name in snapshots."""
+        self._gauges[name] = read
+
+    def snapshot(self) -> dict:
+        histogram = self.callback_duration
+        return {
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'messages': dict(self.messages),
+            'parse_failures': self.parse_failures,
+            'unknown_messages': self.unknown_messages,
+            'dropped_messages': self.dropped_messages,
+            'reconnects': self.reconnects,
+            'callback_duration': {
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'buckets': histogram.buckets(),
+            },
+            **{name: read() for name, read in self._gauges.items()},
+        }
+
+    def prometheus_text(self, prefix: str = 'homeworks', labels: Optional[Dict[str, str]] = None) -> str:
+        return prometheus_text([(labels or {}, self)], prefix)
+
+
+_COUNTERS = (
+    ('bytes_in', "Bytes received from the controller."),
+    ('bytes_out', "Bytes sent to the controller."),
+    ('parse_failures', "Messages with malformed arguments."),
+    ('unknown_messages', "Messages that are not handled."),
+    ('dropped_messages', "Messages of unmonitored actions dropped before parsing."),
+    ('reconnects', "Connections lost and re-established."),
+)
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for key, value in labels.items())
+
+
+def _bound(value: float) -> str:
+    return '+Inf' if value == float('inf') else repr(value)
+
+
+def prometheus_text(sources: Iterable[Tuple[Dict[str, str], Metrics]], prefix: str = 'homeworks') -> str:
+    """Render metrics of one or more connections, told apart by their labels."""
+    sources = list(sources)
+    lines = []
+    for name, help_text in _COUNTERS:
+        lines += [f'# HELP {prefix}_{name}_total {help_text}', f'# TYPE {prefix}_{name}_total counter']
+        lines += [f'{prefix}_{name}_total{_labels(labels)} {getattr(metrics, name)}'
+                  for labels, metrics in sources]
+
+    lines += [f'# HELP {prefix}_messages_total Messages received per action.',
+              f'# TYPE {prefix}_messages_total counter']
+    for labels, metrics in sources:
+        for action, count in metrics.messages.items():
+            lines.append(f'{prefix}_messages_total{_labels({**labels, "action": action})} {count}')
+
+    gauges = sorted({name for _, metrics in sources for name in metrics._gauges})
+    for name in gauges:
+        lines += [f'# TYPE {prefix}_{name} gauge']
+        lines += [f'{prefix}_{name}{_labels(labels)} {metrics._gauges[name]()}'
+                  for labels, metrics in sources if name in metrics._gauges]
+
+    name = f'{prefix}_callback_duration_seconds'
+    lines += [f'# HELP {name} Time spent in event handlers per event.', f'# TYPE {name} histogram']
+    for labels, metrics in sources:
+        histogram = metrics.callback_duration
+        for bound, count in histogram.buckets():
+            lines.append(f'{name}_bucket{_labels({**labels, "le": _bound(bound)})} {count}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+    return '\n'.join(lines) + '\n'
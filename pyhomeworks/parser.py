@@ -0,0 +1,78 @@
+"""
+Byte-level message parser.
+
+``LineParser`` compiles the ``ACTIONS`` table into a dict keyed by the
+leading token of a line (``b'DL'``, ``b'KBP'``, ...) holding the event
+constructor and a bytes parser per field. Lines are parsed without decoding
+them first: integer fields go from bytes straight to int, LED states are
+translated to one byte per LED in one pass and only the address is decoded,
+since events carry it as str.
+"""
+from typing import Callable, Dict, Optional, Tuple
+
+from .events import EVENT_TYPES
+
+SEPARATOR = b', '
+# Dimmer levels are percentages; state stores keep them in signed bytes.
+MAX_LEVEL = 100
+
+# b'0'..b'9' -> 0..9
+_LED_DIGITS = bytes.maketrans(b'0123456789', bytes(range(10)))
+
+
+def parse_address(field: bytes) -> str:
+    return field.decode('ascii')
+
+
+def parse_int(field: bytes) -> int:
+    return int(field)
+
+
+def parse_level(field: bytes) -> int:
+    level = int(field)
+    if not 0 <= level <= MAX_LEVEL:
+        raise ValueError(f"Invalid level: {field!r}")
+    return level
+
+
+def parse_enabled(field: bytes) -> bool:
+    return field == b'enabled'
+
+
+def parse_ledstate(field: bytes) -> bytes:
+    if field and not field.isdigit():
+        raise ValueError(f"Invalid LED states: {field!r}")
+    return field.translate(_LED_DIGITS)
+
+
+class LineParser:
+    """Parse received lines into events through a table built from an action table."""
+
+    def __init__(self, actions: Dict[str, tuple], field_parsers: Dict[Callable, Callable]):
+        """
+        :param actions: token -> (callback type, address parser, value parser), like ACTIONS
+        :param field_parsers: str field parser -> its bytes counterpart
+        """
+        self._table: Dict[bytes, Tuple[Callable, Callable, Callable, str]] = {
+            token.encode('ascii'): (EVENT_TYPES[action], field_parsers[p_address], field_parsers[p_value], token)
+            for token, (action, p_address, p_value) in actions.items()
+        }
+
+    def parse(self, line, timestamp: float, counts: Optional[Dict[str, int]] = None):
+        """Parse a bytes-like line into an event.
+
+        Returns None for lines that are not handled and raises ValueError
+        for malformed arguments. A memoryview is copied once. With counts,
+        counts[token] is incremented for every line parsed into an event.
+        """
+        if type(line) is memoryview:
+            line = line.tobytes()
+        fields = line.split(SEPARATOR)
+        entry = self._table.get(fields[0])
+        if entry is None or len(fields) != 3:
+            return None
+        make, p_address, p_value, token = entry
+        event = make(p_address(fields[1]), p_value(fields[2]), timestamp)
+        if counts is not None:
+            counts[token] += 1
+        return event
@@ -0,0 +1,128 @@
+"""
+Dispatch profiling hooks.
+
+A hook is any callable ``hook(event, handler, duration)``; once one is
+registered with ``add_dispatch_hook``, every handler and listener call is
+timed individually and reported to the hooks. Without hooks, dispatch takes
+the untimed path.
+
+``SlowCallbackLogger`` warns about calls over a threshold,
+``CallbackTimings`` aggregates time per event type and address, and
+``SlowestDispatches`` keeps the slowest N calls for later inspection.
+"""
+import heapq
+import itertools
+import logging
+import time
+from threading import Lock
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from .address import format_address
+
+_LOGGER = logging.getLogger(__name__)
+
+# Same default as asyncio's slow_callback_duration.
+SLOW_CALLBACK_DURATION = 0.1
+
+
+def handler_name(handler: Callable) -> str:
+    """Readable name of a handler for log messages and reports."""
+    name = getattr(handler, '__qualname__', None) or type(handler).__qualname__
+    module = getattr(handler, '__module__', None)
+    return f'{module}.{name}' if module else name
+
+
+class SlowCallbackLogger:
+    """Log a warning for every call that takes longer than threshold seconds."""
+
+    def __init__(self, threshold: float = SLOW_CALLBACK_DURATION, logger: logging.Logger = _LOGGER):
+        self.threshold = threshold
+        self._logger = logger
+
+    def __call__(self, event, handler: Callable, duration: float):
+        if duration >= self.threshold:
+            self._logger.warning("Slow callback %s took %.1f ms for %s %s",
+                                 handler_name(handler), duration * 1000, type(event).__name__,
+                                 format_address(event.address))
+
+
+class Timing(NamedTuple):
+    count: int
+    total: float
+    max: float
+
+
+class CallbackTimings:
+    """Callback time attributed to (event type, formatted address)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._timings: Dict[Tuple[str, str], List] = {}
+
+    def __call__(self, event, handler: Callable, duration: float):
+        key = (type(event).__name__, event.address)
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                self._timings[key] = [1, duration, duration]
+                return
+            timing[0] += 1
+            timing[1] += duration
+            if duration > timing[2]:
+                timing[2] = duration
+
+    def report(self) -> Dict[Tuple[str, str], Timing]:
+        """Timings keyed by (event type, formatted address), most total time first."""
+        with self._lock:
+            items = [((kind, format_address(addr)), Timing(*timing))
+                     for (kind, addr), timing in self._timings.items()]
+        merged: Dict[Tuple[str, str], Timing] = {}
+        for key, timing in items:
+            other = merged.get(key)
+            if other is not None:
+                timing = Timing(other.count + timing.count, other.total + timing.total,
+                                max(other.max, timing.max))
+            merged[key] = timing
+        return dict(sorted(merged.items(), key=lambda item: item[1].total, reverse=True))
+
+    def clear(self):
+        with self._lock:
+            self._timings.clear()
+
+
+class Sample(NamedTuple):
+    duration: float
+    handler: str
+    event: object
+    time: float
+
+
+class SlowestDispatches:
+    """Keep the n slowest calls."""
+
+    def __init__(self, n: int = 20):
+        self.n = n
+        self._lock = Lock()
+        self._heap: List[Tuple[float, int, Sample]] = []
+        self._sequence = itertools.count()
+
+    def __call__(self, event, handler: Callable, duration: float):
+        heap = self._heap
+        if len(heap) >= self.n and duration <= heap[0][0]:
+            return
+        sample = Sample(duration, handler_name(handler), event, time.time())
+        with self._lock:
+            entry = (duration, next(self._sequence), sample)
+            if len(heap) < self.n:
+                heapq.heappush(heap, entry)
+            else:
+                heapq.heappushpop(heap, entry)
+
+    def samples(self) -> List[Sample]:
+        """Recorded calls, slowest first."""
+        with self._lock:
+            return [sample for _, _, sample in sorted(self._heap, reverse=True)]
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
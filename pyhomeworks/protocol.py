@@ -1,10 +1,20 @@
 import asyncio
+import logging
+import time
 from asyncio.events import TimerHandle
+from concurrent.futures import Future
 from asyncio.queues import Queue
 from asyncio.transports import Transport
-from typing import Optional, Callable, Union, Any
+from typing import Optional, Callable, Union, Any, Tuple
 
 from pyhomeworks.exceptions import HomeworksNoCredentialsProvided, InvalidCredentialsProvided, HomeworksConnectionLost
+from pyhomeworks.capture import DIRECTION_IN, DIRECTION_OUT, CaptureWriter
+from pyhomeworks.framer import FRAME_LINE, FRAME_LOGIN, Framer
+from pyhomeworks.metrics import Metrics
+from pyhomeworks.writer import (
+    COALESCE_WINDOW, PRIORITY_INTERACTIVE, OutgoingQueue, QueueStats, TokenBucket, complete)
+
+_LOGGER = logging.getLogger(__name__)
 
 ENCODING = 'ascii'
 
@@ -17,33 +27,90 @@ def ensure_bytes(data: Optional[Union[str, bytes]]):
 
 
 class Message:
-    def __init__(self, payload: str):
-        self.payload = payload
+    """A received line; kept as bytes, decoded only when payload is read."""
+    __slots__ = ('raw', 'timestamp')
+
+    def __init__(self, payload: Union[str, bytes], timestamp: Optional[float] = None):
+        self.raw = ensure_bytes(payload)
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+
+    @property
+    def payload(self) -> str:
+        return self.raw.decode(ENCODING)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.payload!r})'
 
 
 class Command(Message):
     pass
 
 
-class HomeworksProtocol(asyncio.Protocol):
+class ReadQueue(Queue):
+    """Queue that reports every item taken, so reading can resume."""
+
+    def __init__(self, on_get: Callable[[], None]):
+        Queue.__init__(self)
+        self._on_get = on_get
+
+    def _get(self):
+        item = Queue._get(self)
+        self._on_get()
+        return item
+
+
+class HomeworksProtocol(asyncio.BufferedProtocol):
     _non_login_reply_received_timer: TimerHandle
-    read_queue: Queue[Message]
+    read_queue: 'Queue[Message]'
     _transport: Transport
 
     PROMPT_REQUESTS = [b'LNET> ', b'L232> ']
     LOGIN_REQUEST = b'LOGIN: '
     COMMAND_SEPARATOR = b'\r\n'
 
-    def __init__(self, credentials: Optional[Union[str, bytes]] = None):
+    def __init__(self, credentials: Optional[Union[str, bytes]] = None,
+                 coalesce_window: float = COALESCE_WINDOW, baud: Optional[int] = None,
+                 metrics: Optional[Metrics] = None, max_queue: Optional[int] = None):
+        """With max_queue, reading from the transport pauses once that many
+        messages wait in read_queue and resumes when half of them were taken.
+        Messages already received are still queued, so the queue may exceed
+        max_queue by the messages of one read, but nothing is dropped.
+        """
         self.ready_future = asyncio.Future()
         self.connection_lost_future = asyncio.Future()
-        self.read_queue = Queue()
-        self._buffer = b''
+        self.read_queue = ReadQueue(self._on_message_taken)
+        self.high_watermark = max_queue
+        self.low_watermark = max_queue // 2 if max_queue else None
+        self.reading_paused = False
+        self._outgoing = OutgoingQueue(coalesce_window, TokenBucket.for_baud(baud) if baud else None)
+        self._flush_handle: Optional[TimerHandle] = None
+        self._flush_at: Optional[float] = None
+        self._framer = Framer(separator=self.COMMAND_SEPARATOR, prompts=self.PROMPT_REQUESTS,
+                              login=self.LOGIN_REQUEST)
         self._credentials = ensure_bytes(credentials)
+        self.metrics = Metrics() if metrics is None else metrics
+        self.capture: Optional[CaptureWriter] = None
+        # Lines starting with one of these are dropped before decoding.
+        self.drop_prefixes: Tuple[bytes, ...] = ()
+        self._read_view: Optional[memoryview] = None
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        self._read_view = self._framer.get_buffer(sizehint)
+        return self._read_view
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self.metrics.bytes_in += nbytes
+        if self.capture is not None:
+            self.capture.record(DIRECTION_IN, self._read_view[:nbytes])
+        self._framer.buffer_updated(nbytes)
+        self.handle_buffer_increment(time.monotonic())
 
     def data_received(self, data: bytes) -> None:
-        self._buffer += data
-        self.handle_buffer_increment()
+        self.metrics.bytes_in += len(data)
+        if self.capture is not None:
+            self.capture.record(DIRECTION_IN, data)
+        self._framer.feed(data)
+        self.handle_buffer_increment(time.monotonic())
 
     def connection_made(self, transport: Transport) -> None:
         self._transport = transport
@@ -55,6 +122,10 @@ class HomeworksProtocol(asyncio.Protocol):
             self._transport.close()
         self._transport = None
         self._non_login_reply_received_timer.cancel()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._outgoing.fail_all(HomeworksConnectionLost(f'Connection lost: {exc}'))
 
         exception = HomeworksConnectionLost(f'Connection lost before ready state: {exc}')
         if not self.ready_future.done():
@@ -62,25 +133,72 @@ class HomeworksProtocol(asyncio.Protocol):
 
         self.connection_lost_future.set_exception(exception)
 
-    def handle_buffer_increment(self):
-        while any([
-            self._check_login_prompt(),
-            self._trim_prompts(),
-            self._check_messages()
-        ]):
-            pass
+    def handle_buffer_increment(self, timestamp: Optional[float] = None):
+        for kind, payload in self._framer.frames():
+            if kind == FRAME_LINE:
+                self._check_message(payload, timestamp)
+            elif kind == FRAME_LOGIN:
+                self._on_login_prompt_found(payload)
+            else:
+                self._on_prompt_found(payload)
 
     def write(self, data: bytes):
         data = ensure_bytes(data)
 
         if not self._transport.is_closing():
-            self._transport.write(data)
-
-    def _check_login_prompt(self) -> bool:
-        return self._trim_prefix(self.LOGIN_REQUEST, self._on_login_prompt_found)
-
-    def _trim_prompts(self) -> bool:
-        return any(self._trim_prefix(prompt, self._on_prompt_found) for prompt in self.PROMPT_REQUESTS)
+            self._transport_write(data)
+
+    def _transport_write(self, data: bytes):
+        self.metrics.bytes_out += len(data)
+        if self.capture is not None:
+            self.capture.record(DIRECTION_OUT, data)
+        self._transport.write(data)
+
+    @property
+    def outgoing_stats(self) -> Tuple[QueueStats, ...]:
+        """Queueing delay of sent commands per priority lane."""
+        return self._outgoing.stats
+
+    @property
+    def outgoing_depth(self) -> int:
+        """Commands waiting to be written."""
+        return len(self._outgoing)
+
+    def send(self, data: bytes, priority: int = PRIORITY_INTERACTIVE) -> Future:
+        """Queue an encoded command for a coalesced, paced write."""
+        future = self._outgoing.put(data, priority)
+        self._schedule_flush()
+        return future
+
+    def flush(self):
+        """Write everything queued now, ignoring pacing."""
+        self._write_queued(limited=False)
+
+    def _schedule_flush(self):
+        ready = self._outgoing.ready_at(time.monotonic())
+        if ready is None or (self._flush_handle is not None and self._flush_at <= ready):
+            return
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_at = ready
+        self._flush_handle = asyncio.get_event_loop().call_later(
+            max(0., ready - time.monotonic()), self._on_flush_timer)
+
+    def _on_flush_timer(self):
+        self._flush_handle = None
+        self._write_queued(limited=True)
+        self._schedule_flush()
+
+    def _write_queued(self, limited: bool):
+        if not self._outgoing:
+            return
+        if self._transport is None or self._transport.is_closing():
+            self._outgoing.fail_all(HomeworksConnectionLost('Transport is closed'))
+            return
+        data, futures = self._outgoing.take(limited=limited)
+        if futures:
+            self._transport_write(data)
+            complete(futures)
 
     def _on_prompt_found(self, _):
         self._notify_ready()
@@ -92,37 +210,45 @@ class HomeworksProtocol(asyncio.Protocol):
 
         self.write(self._credentials + self.COMMAND_SEPARATOR)
 
-    def _trim_prefix(self, prefix: bytes, on_match: Callable[[bytes], None]) -> bool:
-        if self._buffer.startswith(prefix):
-            self._buffer = self._buffer[len(prefix):]
-            on_match(prefix)
-            return True
-
-        return False
-
-    def _check_messages(self) -> bool:
-        (command, separator, remainder) = self._buffer.partition(self.COMMAND_SEPARATOR)
-        if separator != self.COMMAND_SEPARATOR:
-            return False
-        self._buffer = remainder
-
+    def _check_message(self, command: bytes, timestamp: Optional[float] = None):
+        if command.startswith(self.drop_prefixes):
+            self.metrics.dropped_messages += 1
+            return
         command = command.strip()
         if command == b'':
-            return True
-
-        self._handle_message(command.decode(ENCODING))
+            return
 
-        return True
+        if not command.isascii():
+            _LOGGER.warning("Undecodable data: %s", command)
+            return
+        self._handle_message(Message(command, timestamp))
 
-    def _handle_message(self, message: str):
-        if message == "login successful":
+    def _handle_message(self, message: Message):
+        if message.raw == b'login successful':
             self._notify_ready()
             return
-        elif message == "login incorrect":
+        elif message.raw == b'login incorrect':
             self._raise_exception(InvalidCredentialsProvided())
 
         self._notify_ready()
         self.read_queue.put_nowait(message)
+        if (self.high_watermark is not None and not self.reading_paused
+                and self.read_queue.qsize() >= self.high_watermark and self._transport is not None):
+            self.reading_paused = True
+            self._transport.pause_reading()
+
+    def _on_message_taken(self):
+        if self.reading_paused and self.read_queue.qsize() <= self.low_watermark:
+            self.reading_paused = False
+            if self._transport is not None:
+                self._transport.resume_reading()
+
+    @property
+    def queue_occupancy(self) -> float:
+        """Fill level of read_queue relative to max_queue; 0 when unbounded."""
+        if not self.high_watermark:
+            return 0.
+        return self.read_queue.qsize() / self.high_watermark
 
     def _notify_ready(self):
         self._non_login_reply_received_timer.cancel()
@@ -8,11 +8,35 @@ The Series4/8 is connected to an RS232 port to an Ethernet adaptor (NPort).
 
 Michael Dubno - 2018 - New York
 """
+import errno
+import heapq
+import itertools
 import logging
-import select
+import os
+import selectors
 import socket
 import time
-from threading import Thread
+from threading import Lock, Thread
+
+from .events import (
+    HW_BUTTON_DOUBLE_TAP, HW_BUTTON_HOLD, HW_BUTTON_PRESSED, HW_BUTTON_RELEASED,
+    HW_KEYPAD_ENABLE_CHANGED, HW_KEYPAD_LED_CHANGED, HW_LIGHT_CHANGED,
+    LedStateChanged, LightChanged, legacy_callback)
+from .address import format_address
+from .backoff import RECONNECT_DELAY, RECONNECT_MAX_DELAY, Backoff
+from .capture import DIRECTION_IN, DIRECTION_OUT, CaptureWriter
+from .coalesce import EventCoalescer
+from .dispatch import EventDispatcher
+from .fade import encode_fades
+from .framer import FRAME_LINE, FRAME_LOGIN, Framer
+from .metrics import Metrics
+from .parser import LineParser, parse_address, parse_enabled, parse_int, parse_ledstate, parse_level
+from .query import DEFAULT_TIMEOUT, DEFAULT_WINDOW, LevelQueries
+from .state import DeviceState
+from .statefile import MappedDeviceState
+from .writer import (
+    COALESCE_WINDOW, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, CommandWriter, TokenBucket,
+    encode_command)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -20,21 +44,12 @@ _LOGGER = logging.getLogger(__name__)
 def _p_address(arg):    return arg
 def _p_button(arg):     return int(arg)
 def _p_enabled(arg):    return arg == 'enabled'
-def _p_level(arg):      return int(arg)
-def _p_ledstate(arg):   return [int(num) for num in arg]
+def _p_level(arg):      return parse_level(arg.encode('ascii'))
+def _p_ledstate(arg):   return bytes(int(num) for num in arg)
 
 def _norm(x): return (x, _p_address, _p_button)
 
 
-# Callback types
-HW_BUTTON_DOUBLE_TAP = 'button_double_tap'
-HW_BUTTON_HOLD = 'button_hold'
-HW_BUTTON_PRESSED = 'button_pressed'
-HW_BUTTON_RELEASED = 'button_released'
-HW_KEYPAD_ENABLE_CHANGED = 'keypad_enable_changed'
-HW_KEYPAD_LED_CHANGED = 'keypad_led_changed'
-HW_LIGHT_CHANGED = 'light_changed'
-
 ACTIONS = {
     "KBP":   _norm(HW_BUTTON_PRESSED),
     "KBR":   _norm(HW_BUTTON_RELEASED),
@@ -53,27 +68,350 @@ ACTIONS = {
     "KES":   (HW_KEYPAD_ENABLE_CHANGED, _p_address, _p_enabled),
 }
 
+# Bytes counterparts of the field parsers above, for LineParser.
+_BYTE_PARSERS = {
+    _p_address: parse_address,
+    _p_button: parse_int,
+    _p_enabled: parse_enabled,
+    _p_level: parse_level,
+    _p_ledstate: parse_ledstate,
+}
+
+LINE_PARSER = LineParser(ACTIONS, _BYTE_PARSERS)
+
+_BUTTON_ACTIONS = (HW_BUTTON_PRESSED, HW_BUTTON_RELEASED, HW_BUTTON_HOLD, HW_BUTTON_DOUBLE_TAP)
+
+# Monitor command -> actions of the messages it turns on. GRAFIK Eye scene
+# messages are not parsed, so GSMON is only sent when everything is monitored.
+MONITOR_COMMANDS = {
+    'KBMON': _BUTTON_ACTIONS,  # Monitor keypad events
+    'GSMON': (),  # Monitor GRAFIKEYE scenes
+    'DLMON': (HW_LIGHT_CHANGED,),  # Monitor dimmer levels
+    'KLMON': (HW_KEYPAD_LED_CHANGED,),  # Monitor keypad LED states
+}
+
+def monitor_commands(actions) -> tuple:
+    """Monitor commands needed to receive actions; None means all of them."""
+    if actions is None:
+        return tuple(MONITOR_COMMANDS)
+    return tuple(command for command, monitored in MONITOR_COMMANDS.items()
+                 if not actions.isdisjoint(monitored))
+
+
+def drop_prefixes(actions) -> tuple:
+    """Byte prefixes of the messages for actions nobody wants; empty for None.
+
+    Lines starting with one of them can be dropped before decoding.
+    """
+    if actions is None:
+        return ()
+    return tuple(('%s, ' % name).encode('ascii') for name, (action, *_) in ACTIONS.items()
+                 if action not in actions)
+
+
+def parse_event(data: str, timestamp: float):
+    """Parse a controller message into an event.
+
+    Returns None for messages that are not handled and raises ValueError
+    for malformed arguments.
+    """
+    return LINE_PARSER.parse(data.encode('utf8'), timestamp)
+
+
+class BaseHomeworks:
+    """Message handling shared by the threaded and asyncio interfaces."""
+
+    QUERY_WINDOW = DEFAULT_WINDOW
+    QUERY_TIMEOUT = DEFAULT_TIMEOUT
+    EVENT_WINDOW = None
+    # Path of a memory-mapped state file; None keeps the state in memory only.
+    STATE_FILE = None
+    # Actions to monitor; None derives them from the registered consumers.
+    MONITOR = None
+
+    def __init__(self, callback=None, event_callback=None, event_window=None, executor=None,
+                 state_file=None):
+        """Deliver events to event_callback(event) and/or callback(action, args).
+
+        With event_window (seconds) state events are coalesced per address so
+        that fades deliver at most one event per window and address. With a
+        DispatchExecutor, handlers run on its workers instead of the reader.
+        With state_file, the state is restored from and kept in that file.
+        """
+        self._listeners = tuple(
+            listener for listener in (event_callback, callback and legacy_callback(callback))
+            if listener is not None)
+        self._queries = LevelQueries(self._send_level_request, self.QUERY_WINDOW, self.QUERY_TIMEOUT)
+        state_file = self.STATE_FILE if state_file is None else state_file
+        self.state = DeviceState() if state_file is None else MappedDeviceState(state_file)
+        self.dispatcher = EventDispatcher()
+        self.executor = executor
+        if executor is not None:
+            executor.bind(self._dispatch_event)
+        self._deliver = self._dispatch_event if executor is None else executor.submit
+        event_window = self.EVENT_WINDOW if event_window is None else event_window
+        self.coalescer = EventCoalescer(self._deliver, event_window) if event_window else None
+        self.metrics = Metrics(ACTIONS)
+        self.capture = None
+        if executor is not None:
+            self.metrics.add_gauge('dispatch_queue_depth', executor.__len__)
+            self.metrics.add_gauge('dispatch_dropped', lambda: executor.dropped)
+        self._dispatch_hooks = ()
+        self._monitor_lock = Lock()
+        # Monitor commands sent on the current connection, None until subscribed.
+        self._monitoring = None
+        self._drop_prefixes = drop_prefixes(self.monitored_actions())
+        self.dispatcher.on_change = self._update_monitoring
+
+    @property
+    def reconnects(self):
+        """How often the connection was lost."""
+        return self.metrics.reconnects
+
+    def start_capture(self, file):
+        """Record the traffic of this connection to a capture file (path or binary file)."""
+        self.stop_capture()
+        self.capture = CaptureWriter(file)
+        return self.capture
+
+    def stop_capture(self):
+        capture, self.capture = self.capture, None
+        if capture is not None:
+            capture.close()
+
+    def _send(self, command, priority=PRIORITY_INTERACTIVE):
+        raise NotImplementedError
 
-class Homeworks(Thread):
-    """Interface with a Lutron Homeworks 4/8 Series system."""
+    def _send_level_request(self, addr):
+        self._send('RDL, %s' % addr, PRIORITY_BACKGROUND)
+
+    def monitored_actions(self):
+        """Actions the controller is asked to report; None for all of them.
+
+        Without MONITOR, everything is monitored as soon as there is an
+        event_callback, a callback or a dispatcher subscription without an
+        action; otherwise only the subscribed actions are. Dimmer levels are
+        always monitored since level queries and the state store rely on
+        them. State listeners do not count as consumers.
+        """
+        if self.MONITOR is not None:
+            return frozenset(self.MONITOR) | {HW_LIGHT_CHANGED}
+        if self._listeners:
+            return None
+        actions = self.dispatcher.actions()
+        if None in actions:
+            return None
+        return frozenset(actions) | {HW_LIGHT_CHANGED}
+
+    def _subscribe(self):
+        # Setup interface and subscribe to events
+        with self._monitor_lock:
+            commands = monitor_commands(self.monitored_actions())
+            # No prompt is needed
+            for command in ('PROMPTOFF',) + commands:
+                self._send(command)
+            self._monitoring = commands
+        self._reconcile()
+
+    def _reconcile(self):
+        """Re-query the dimmers and keypad LEDs restored from the state file."""
+        addrs = [format_address(addr) for addr in self.state.restored()]
+        if addrs:
+            _LOGGER.info("Reconciling %d restored dimmer levels", len(addrs))
+            self._queries.query(addrs)
+        keypads = self.state.restored_keypads()
+        actions = self.monitored_actions()
+        if keypads and (actions is None or HW_KEYPAD_LED_CHANGED in actions):
+            _LOGGER.info("Reconciling %d restored keypad LED states", len(keypads))
+            for addr in keypads:
+                self._send('RKLS, %s' % format_address(addr), PRIORITY_BACKGROUND)
+
+    def _update_monitoring(self):
+        """Follow a change of consumers: update the pre-filter and the monitors."""
+        with self._monitor_lock:
+            actions = self.monitored_actions()
+            self._drop_prefixes = drop_prefixes(actions)
+            if self._monitoring is None:
+                return
+            commands = monitor_commands(actions)
+            for command in commands:
+                if command not in self._monitoring:
+                    self._send(command)
+            for command in self._monitoring:
+                if command not in commands:
+                    # KBMON -> KBMOFF
+                    self._send(command[:-2] + 'OFF')
+            self._monitoring = commands
+
+    def _processReceivedData(self, data: str, timestamp: float = None):
+        self._process_line(data.encode('utf8'), time.monotonic() if timestamp is None else timestamp)
+
+    def _process_line(self, line: bytes, timestamp: float):
+        """Parse and handle one received line; only warnings decode it."""
+        _LOGGER.debug("Raw: %s", line)
+        try:
+            event = LINE_PARSER.parse(line, timestamp, self.metrics.messages)
+        except ValueError:
+            self.metrics.parse_failures += 1
+            _LOGGER.warning("Weird data: %s", bytes(line).decode('ascii', 'replace'))
+            return
+        if event is None:
+            self.metrics.unknown_messages += 1
+            _LOGGER.warning("Not handling: %s", bytes(line).decode('ascii', 'replace').split(', '))
+            return
+        self._handle_event(event)
+
+    def _resync(self):
+        """Re-query every dimmer that has subscribers, e.g. after a reconnect.
+
+        With a callback or event_callback every dimmer with a known level
+        counts as subscribed. The answers arrive as regular events, so
+        subscribers see whatever changed while the connection was down.
+        """
+        addrs = [format_address(addr) for addr in self.dispatcher.addresses(HW_LIGHT_CHANGED)]
+        if self._listeners:
+            addrs = list(dict.fromkeys(addrs + list(self.state.snapshot().levels)))
+        if addrs:
+            _LOGGER.info("Resyncing %d dimmers", len(addrs))
+            self._queries.query(addrs)
+
+    def _handle_event(self, event):
+        applied = self.state.apply(event)
+        if type(event) is LedStateChanged:
+            # Only LED changes are news; deliver them with their change mask.
+            if applied is None:
+                return
+            event = applied
+        if type(event) is LightChanged:
+            self._queries.on_level(event.address, event.level, event.timestamp)
+        if self.coalescer is None:
+            self._deliver(event)
+        else:
+            self.coalescer.submit(event, event.timestamp)
+
+    def add_dispatch_hook(self, hook):
+        """Time every handler call and report hook(event, handler, duration).
+
+        See pyhomeworks.profiling for ready-made hooks; returns a remover.
+        """
+        self._dispatch_hooks += (hook,)
+
+        def remove():
+            self._dispatch_hooks = tuple(other for other in self._dispatch_hooks if other is not hook)
+
+        return remove
+
+    def _dispatch_event(self, event):
+        started = time.perf_counter()
+        try:
+            if self._dispatch_hooks:
+                self._dispatch_timed(event)
+            else:
+                self.dispatcher.dispatch(event)
+                for listener in self._listeners:
+                    listener(event)
+        except Exception:
+            # A failing handler must not stop the reader.
+            _LOGGER.exception("Error in event handler for %s", event)
+        self.metrics.callback_duration.observe(time.perf_counter() - started)
+
+    def _dispatch_timed(self, event):
+        hooks = self._dispatch_hooks
+        for handler in self.dispatcher.handlers_for(event) + list(self._listeners):
+            started = time.perf_counter()
+            try:
+                handler(event)
+            finally:
+                duration = time.perf_counter() - started
+                for hook in hooks:
+                    hook(event, handler, duration)
+
+    def _next_deadline(self):
+        """Earliest monotonic time at which _run_timers has work to do."""
+        deadlines = [self._queries.next_deadline()]
+        if self.coalescer is not None:
+            deadlines.append(self.coalescer.next_deadline())
+        return min((deadline for deadline in deadlines if deadline is not None), default=None)
+
+    def _run_timers(self):
+        now = time.monotonic()
+        self._queries.expire(now)
+        if self.coalescer is not None:
+            self.coalescer.poll(now)
+
+
+def start_connection(host, port) -> socket.socket:
+    """Start a non-blocking TCP connect to host, port.
+
+    The socket turns writable once the connect completed or failed; its
+    SO_ERROR tells which. Name resolution still blocks.
+    """
+    family, kind, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+    sock = socket.socket(family, kind, proto)
+    sock.setblocking(False)
+    error = sock.connect_ex(address)
+    if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+        sock.close()
+        raise OSError(error, os.strerror(error))
+    return sock
+
+
+class Homeworks(BaseHomeworks, Thread):
+    """Interface with a Lutron Homeworks 4/8 Series system.
+
+    The reader thread sleeps in a selector until the socket is readable, a
+    timer is due or another thread wakes it, so an idle connection costs no
+    CPU and ``close()`` takes effect immediately. Connects are non-blocking
+    too, finished by the selector or abandoned after CONNECT_TIMEOUT.
+    """
     _socket: socket.socket
 
     LOGIN_REQUEST = b'LOGIN: '
     PROMPT_REQUESTS = [b'LNET> ', b'L232> ']
-    POLLING_FREQ = 1.
+    RECONNECT_DELAY = RECONNECT_DELAY
+    RECONNECT_MAX_DELAY = RECONNECT_MAX_DELAY
     LOGIN_PROMPT_WAIT_TIME = 0.2
+    CONNECT_TIMEOUT = 10.
+    COALESCE_WINDOW = COALESCE_WINDOW
+    BAUD_RATE = None
 
-    def __init__(self, host, port, callback, autostart=True, login=None):
+    def __init__(self, host, port, callback=None, autostart=True, login=None, event_callback=None,
+                 event_window=None, baud=None, executor=None, state_file=None):
         """Connect to controller using host, port.
         :param login:
+        :param event_callback: receives typed events from pyhomeworks.events
+        :param event_window: per-address coalescing window for state events
+        :param baud: pace writes to the controller's serial line speed
+        :param executor: run handlers on a pyhomeworks.executor.DispatchExecutor
+        :param state_file: restore the device state from and keep it in this file
         """
         Thread.__init__(self)
+        BaseHomeworks.__init__(self, callback, event_callback, event_window, executor, state_file)
         self._host = host
         self._port = port
         self._login = login
-        self._callback = callback
         self._socket = None
-        self._command_separator = b'\r\n'
+        # Socket and timeout timer of a connect in progress.
+        self._connecting = None
+        self._connect_timer = None
+        baud = self.BAUD_RATE if baud is None else baud
+        self._writer = CommandWriter(self._send_bytes, self.COALESCE_WINDOW,
+                                     TokenBucket.for_baud(baud) if baud else None)
+        self._framer = Framer(prompts=self.PROMPT_REQUESTS, login=self.LOGIN_REQUEST)
+        self.metrics.add_gauge('outgoing_queue_depth', self._writer.__len__)
+
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ, self._drain_wakeup)
+        # Heap of [when, sequence, callback]; a cancelled timer has callback None.
+        self._timers = []
+        self._timer_sequence = itertools.count()
+        self._subscribe_timer = None
+        self._backoff = Backoff(self.RECONNECT_DELAY, self.RECONNECT_MAX_DELAY)
+        self._logged_in = False
+        self._subscribed = False
 
         self._running = False
 
@@ -81,104 +419,237 @@ class Homeworks(Thread):
             self.start()
 
     def _connect(self):
+        """Start connecting; _on_connected takes over once the socket is writable."""
         try:
-            self._socket = socket.create_connection((self._host, self._port))
-            _LOGGER.info(f"Connected to '{self._host}:{self._port}'")
-        except (BlockingIOError, ConnectionError, TimeoutError) as error:
+            sock = start_connection(self._host, self._port)
+        except OSError as error:
             raise ConnectionError(f"Couldn't connect to '{self._host}:{self._port}': {error}")
+        self._connecting = sock
+        self._selector.register(sock, selectors.EVENT_WRITE, self._on_connected)
+        self._connect_timer = self._call_later(self.CONNECT_TIMEOUT, self._on_connect_timeout)
 
-    def _send(self, command):
-        _LOGGER.debug("send: %s", command)
+    def _on_connected(self):
+        sock = self._stop_connecting()
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            sock.close()
+            self._retry(ConnectionError(
+                f"Couldn't connect to '{self._host}:{self._port}': {os.strerror(error)}"))
+            return
+        # The writer thread relies on blocking sends.
+        sock.setblocking(True)
+        self._socket = sock
+        _LOGGER.info(f"Connected to '{self._host}:{self._port}'")
+        self._selector.register(sock, selectors.EVENT_READ, self._on_readable)
+        self._logged_in = self._login is None
+        self._subscribed = False
+        self._subscribe_timer = self._call_later(self.LOGIN_PROMPT_WAIT_TIME, self._on_login_wait_done)
+
+    def _on_connect_timeout(self):
+        self._stop_connecting().close()
+        self._retry(ConnectionError(f"Timed out connecting to '{self._host}:{self._port}'"))
+
+    def _stop_connecting(self):
+        """Forget the connect in progress; returns its socket."""
+        sock, self._connecting = self._connecting, None
+        self._selector.unregister(sock)
+        self._connect_timer[2] = None
+        self._connect_timer = None
+        return sock
+
+    def _reconnect(self):
         try:
-            self._socket.send(command.encode('utf8') + self._command_separator)
-            return True
-        except (ConnectionError, AttributeError):
-            self._socket = None
-            return False
+            self._connect()
+        except ConnectionError as error:
+            self._retry(error)
+
+    def _retry(self, error):
+        delay = self._backoff.next_delay()
+        _LOGGER.warning("%s; retrying in %.1fs", error, delay)
+        self._call_later(delay, self._reconnect)
+
+    def _send(self, command, priority=PRIORITY_INTERACTIVE):
+        """Queue a command; the returned future completes once it was sent."""
+        _LOGGER.debug("send: %s", command)
+        return self._writer.write(encode_command(command), priority)
+
+    def _send_encoded(self, data, priority=PRIORITY_INTERACTIVE):
+        """Queue already encoded commands as one write."""
+        _LOGGER.debug("send: %r", data)
+        return self._writer.write(data, priority)
+
+    @property
+    def outgoing_stats(self):
+        """Queueing delay of sent commands per priority lane."""
+        return self._writer.stats
+
+    def _send_bytes(self, data):
+        sent = self._socket.send(data)
+        self.metrics.bytes_out += sent
+        if self.capture is not None:
+            self.capture.record(DIRECTION_OUT, data[:sent])
+        return sent
 
     def fade_dim(self, intensity, fade_time, delay_time, addr):
         """Change the brightness of a light."""
-        self._send('FADEDIM, %d, %d, %d, %s' %
-                   (intensity, fade_time, delay_time, addr))
+        return self._send('FADEDIM, %d, %d, %d, %s' %
+                          (intensity, fade_time, delay_time, addr))
+
+    def fade_many(self, fades):
+        """Change the brightness of many lights with one write.
+
+        fades is an iterable of (addr, intensity, fade_time, delay_time);
+        lights fading alike share a FADEDIM command and the last fade of an
+        address wins. The returned future completes once all were sent.
+        """
+        return self._send_encoded(encode_fades(fades))
 
     def request_dimmer_level(self, addr):
         """Request the controller to return brightness."""
-        self._send('RDL, %s' % addr)
+        return self._send('RDL, %s' % addr, PRIORITY_BACKGROUND)
+
+    def query_levels(self, addrs):
+        """Query the brightness of many lights with pipelined requests.
+
+        Returns a dict of addr -> Future resolving to the level, or raising
+        concurrent.futures.TimeoutError if the controller did not answer.
+        """
+        futures = self._queries.query(addrs)
+        # The reader thread has to pick up the new timeout deadlines.
+        self._wakeup()
+        return futures
 
     def run(self):
         """Read and dispatch messages from the controller."""
         self._running = True
-        buffer = b''
-        start_time = time.time()
-        subscribed = False
-        logged_in = self._login is None
-        while self._running:
+        try:
             if self._socket is None:
-                start_time = time.time()
-                self._connect()
-            else:
-                try:
-                    if logged_in and not subscribed and time.time() - start_time > self.LOGIN_PROMPT_WAIT_TIME:
-                        self._subscribe()
-                        subscribed = True
-                    readable, _, _ = select.select([self._socket], [], [], self.POLLING_FREQ)
-                    if len(readable) != 0:
-                        buffer += self._socket.recv(1024)
-                        for prompt in self.PROMPT_REQUESTS:
-                            if buffer.startswith(prompt):
-                                logged_in = True
-                                buffer = buffer[len(prompt):]
-                        if buffer.startswith(self.LOGIN_REQUEST):
-                            self._handle_login_request()
-                            logged_in = True
-                            buffer = buffer[len(self.LOGIN_REQUEST):]
-                            continue
-                        while True:
-                            (command, separator, remainder) = buffer.partition(self._command_separator)
-                            if separator != self._command_separator:
-                                break
-                            buffer = remainder
-                            self._processReceivedData(command.decode('utf-8'))
-                except (ConnectionError, AttributeError):
-                    _LOGGER.warning("Lost connection.")
-                    self._socket = None
-                    subscribed = False
-                    logged_in = self._login is None
-                    buffer = b''
-                    if self._running:
-                        time.sleep(self.POLLING_FREQ)
-                except UnicodeDecodeError:
-                    pass
-
-    def _processReceivedData(self, data: str):
-        _LOGGER.debug("Raw: %s", data)
+                self._reconnect()
+            while self._running:
+                for key, _ in self._selector.select(self._select_timeout()):
+                    key.data()
+                self._run_timers()
+        finally:
+            self._disconnect()
+            self._selector.close()
+            self._wakeup_reader.close()
+            self._wakeup_writer.close()
+            self.state.close()
+
+    def _select_timeout(self):
+        deadlines = [self._next_deadline()]
+        while self._timers and self._timers[0][2] is None:
+            heapq.heappop(self._timers)
+        if self._timers:
+            deadlines.append(self._timers[0][0])
+        deadline = min((deadline for deadline in deadlines if deadline is not None), default=None)
+        return None if deadline is None else max(0., deadline - time.monotonic())
+
+    def _call_later(self, delay, callback):
+        timer = [time.monotonic() + delay, next(self._timer_sequence), callback]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def _run_timers(self):
+        BaseHomeworks._run_timers(self)
+        now = time.monotonic()
+        timers = self._timers
+        while timers and timers[0][0] <= now:
+            callback = heapq.heappop(timers)[2]
+            if callback is not None:
+                callback()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            # Already pending, or the reader has stopped.
+            pass
+
+    def _drain_wakeup(self):
         try:
-            raw_args = data.split(', ')
-            action = ACTIONS.get(raw_args[0], None)
-            if action and len(raw_args) == len(action):
-                args = [parser(arg) for parser, arg in
-                        zip(action[1:], raw_args[1:])]
-                self._callback(action[0], args)
+            while self._wakeup_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _on_readable(self):
+        try:
+            view = self._framer.get_buffer()
+            nbytes = self._socket.recv_into(view, len(view))
+            if not nbytes:
+                raise ConnectionError("Connection closed by controller")
+            self.metrics.bytes_in += nbytes
+            if self.capture is not None:
+                self.capture.record(DIRECTION_IN, view[:nbytes])
+            self._framer.buffer_updated(nbytes)
+        except OSError as error:
+            self._on_connection_lost(error)
+            return
+        timestamp = time.monotonic()
+        for kind, payload in self._framer.frames():
+            if kind == FRAME_LINE:
+                self._handle_line(payload, timestamp)
             else:
-                _LOGGER.warning("Not handling: %s", raw_args)
-        except ValueError:
-            _LOGGER.warning("Weird data: %s", data)
+                if kind == FRAME_LOGIN:
+                    self._handle_login_request()
+                self._logged_in = True
+                self._maybe_subscribe()
+
+    def _on_login_wait_done(self):
+        self._subscribe_timer = None
+        self._maybe_subscribe()
+
+    def _maybe_subscribe(self):
+        if self._logged_in and not self._subscribed and self._subscribe_timer is None:
+            self._subscribe()
+            self._subscribed = True
+            self._backoff.reset()
+            if self.reconnects:
+                self._resync()
+
+    def _on_connection_lost(self, error):
+        _LOGGER.warning("Lost connection: %s", error)
+        self._disconnect()
+        self._queries.cancel_all(ConnectionError("Lost connection"))
+        if self._running:
+            self.metrics.reconnects += 1
+            self._call_later(self._backoff.next_delay(), self._reconnect)
+
+    def _disconnect(self):
+        if self._subscribe_timer is not None:
+            self._subscribe_timer[2] = None
+            self._subscribe_timer = None
+        if self._connecting is not None:
+            self._stop_connecting().close()
+        self._framer.clear()
+        self._monitoring = None
+        sock, self._socket = self._socket, None
+        if sock is not None:
+            self._selector.unregister(sock)
+            sock.close()
+
+    def _handle_line(self, line: bytes, timestamp: float):
+        if line.startswith(self._drop_prefixes):
+            self.metrics.dropped_messages += 1
+            return
+        self._process_line(line, timestamp)
 
     def close(self):
         """Close the connection to the controller."""
         self._running = False
-        if self._socket:
-            # time.sleep(POLLING_FREQ)
-            self._socket.close()
-            self._socket = None
+        self._writer.close()
+        if self.executor is not None:
+            self.executor.close()
+        self._queries.cancel_all(ConnectionError("Connection closed"))
+        if self.is_alive():
+            self._wakeup()
+        elif self.ident is None:
+            self._disconnect()
+            self._selector.close()
+            self._wakeup_reader.close()
+            self._wakeup_writer.close()
+            self.state.close()
 
     def _handle_login_request(self):
         self._send(self._login)
-
-    def _subscribe(self):
-        # Setup interface and subscribe to events
-        self._send('PROMPTOFF')  # No prompt is needed
-        self._send('KBMON')  # Monitor keypad events
-        self._send('GSMON')  # Monitor GRAFIKEYE scenes
-        self._send('DLMON')  # Monitor dimmer levels
-        self._send('KLMON')  # Monitor keypad LED states
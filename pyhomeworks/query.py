@@ -0,0 +1,111 @@
+"""
+Pipelined dimmer level queries.
+
+``RDL`` requests are answered asynchronously by ``DL`` lines on the regular
+event stream. ``LevelQueries`` keeps up to ``window`` requests in flight,
+matches replies by address and fails requests that are not answered within
+``timeout`` seconds of being sent. Addresses are matched in normalized form,
+so ``[1:1:0:3:2]`` is answered by ``DL, [01:01:00:03:02], ...``.
+"""
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+from threading import RLock
+from typing import Callable, Dict, Iterable, Optional
+
+from .address import format_address, normalize_address
+
+DEFAULT_WINDOW = 16
+DEFAULT_TIMEOUT = 2.
+
+
+class LevelQueries:
+    """Correlate RDL requests with DL replies."""
+
+    def __init__(self, send: Callable[[str], object],
+                 window: int = DEFAULT_WINDOW, timeout: float = DEFAULT_TIMEOUT):
+        """send(addr) must issue the RDL for addr without blocking."""
+        self._send = send
+        self.window = window
+        self.timeout = timeout
+        self._lock = RLock()
+        # address -> (addr, futures), for requests not yet sent
+        self._waiting: Dict[tuple, tuple] = OrderedDict()
+        # address -> (deadline, futures), for requests sent to the controller
+        self._in_flight: Dict[tuple, tuple] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._waiting) + len(self._in_flight)
+
+    def query(self, addresses: Iterable[str]) -> Dict[str, Future]:
+        """Queue RDL requests; returns a future per address resolving to its level."""
+        futures = {}
+        with self._lock:
+            for addr in addresses:
+                if addr in futures:
+                    continue
+                future = futures[addr] = Future()
+                future.set_running_or_notify_cancel()
+                key = normalize_address(addr)
+                if key in self._in_flight:
+                    self._in_flight[key][1].append(future)
+                else:
+                    self._waiting.setdefault(key, (addr, []))[1].append(future)
+            self._fill_window(time.monotonic())
+        return futures
+
+    def on_level(self, addr: str, level: int, now: Optional[float] = None):
+        """Resolve pending requests for addr with a DL reply."""
+        with self._lock:
+            entry = self._in_flight.pop(normalize_address(addr), None)
+            if entry is None:
+                return
+            for future in entry[1]:
+                future.set_result(level)
+            self._fill_window(time.monotonic() if now is None else now)
+
+    def expire(self, now: Optional[float] = None):
+        """Fail requests whose deadline passed."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            expired = [key for key, (deadline, _) in self._in_flight.items() if deadline <= now]
+            for key in expired:
+                for future in self._in_flight.pop(key)[1]:
+                    future.set_exception(TimeoutError(f"No reply for {format_address(key)}"))
+            if expired:
+                self._fill_window(now)
+
+    def next_deadline(self) -> Optional[float]:
+        """Monotonic time of the earliest timeout, if any request is in flight."""
+        with self._lock:
+            # Requests are sent in order, so the oldest one expires first.
+            for deadline, _ in self._in_flight.values():
+                return deadline
+        return None
+
+    def cancel_all(self, exc: BaseException):
+        """Fail every pending request, e.g. when the connection is lost."""
+        with self._lock:
+            pending = list(self._in_flight.values())
+            self._in_flight.clear()
+            waiting = list(self._waiting.values())
+            self._waiting.clear()
+        for _, futures in pending:
+            for future in futures:
+                future.set_exception(exc)
+        for _, futures in waiting:
+            for future in futures:
+                future.set_exception(exc)
+
+    def _fill_window(self, now: float):
+        deadline = now + self.timeout
+        while self._waiting and len(self._in_flight) < self.window:
+            key, (addr, futures) = self._waiting.popitem(last=False)
+            self._in_flight[key] = (deadline, futures)
+            try:
+                self._send(addr)
+            except Exception as error:
+                # Not sent, so no reply will come; e.g. not connected.
+                del self._in_flight[key]
+                for future in futures:
+                    future.set_exception(error)
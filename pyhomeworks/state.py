@@ -0,0 +1,180 @@
+"""
+In-memory state of the devices reported by the controller.
+
+Every normalized address gets a slot on first sight; dimmer levels, keypad
+LED vectors and keypad enable flags live in arrays indexed by that slot, so
+lookups are a dict hit plus an array read and no per-device objects are
+allocated. LED states are kept as the bytes the parser produced; a new KLS
+is compared against them and its event carries a mask of the changed LEDs.
+"""
+from array import array
+from threading import RLock
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from .address import Address, format_address, normalize_address
+from .events import KeypadEnableChanged, LedStateChanged, LightChanged
+
+UNKNOWN_LEVEL = -1
+_ENABLE_UNKNOWN, _ENABLE_OFF, _ENABLE_ON = 0, 1, 2
+
+
+def led_changes(previous: Optional[bytes], leds: bytes) -> int:
+    """Bit mask of the LEDs whose state differs; all of them without previous."""
+    if previous is None or len(previous) != len(leds):
+        return (1 << len(leds)) - 1
+    # One byte per LED: find the differing bytes of the XOR, lowest first.
+    diff = int.from_bytes(previous, 'little') ^ int.from_bytes(leds, 'little')
+    mask = 0
+    while diff:
+        index = ((diff & -diff).bit_length() - 1) >> 3
+        mask |= 1 << index
+        diff &= ~(0xFF << (index << 3))
+    return mask
+
+
+class Snapshot(NamedTuple):
+    """Consistent copy of the state at one point in time, keyed by formatted address."""
+    levels: Dict[str, int]
+    leds: Dict[str, Tuple[int, ...]]
+    enabled: Dict[str, bool]
+
+
+class DeviceState:
+    """Last known dimmer levels, LED states and keypad enable flags."""
+
+    def __init__(self):
+        self._lock = RLock()
+        self._slots: Dict[Address, int] = {}
+        # Levels are 0..MAX_LEVEL or UNKNOWN_LEVEL; the parser rejects others.
+        self._levels = array('b')
+        self._leds: List[Optional[bytes]] = []
+        # Slots whose LED states were restored rather than reported.
+        self._stale_leds: Set[int] = set()
+        self._enabled = bytearray()
+        self._updated = array('d')
+        self._listeners: List[Callable] = []
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, addr) -> bool:
+        return normalize_address(addr) in self._slots
+
+    def add_listener(self, listener: Callable) -> Callable[[], None]:
+        """Call listener(event) for events that changed the state; returns a remover."""
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    def get_level(self, addr) -> Optional[int]:
+        """Last reported level of a dimmer, or None if it never reported."""
+        slot = self._slots.get(normalize_address(addr))
+        if slot is None:
+            return None
+        level = self._levels[slot]
+        return None if level == UNKNOWN_LEVEL else level
+
+    def get_leds(self, addr) -> Optional[Tuple[int, ...]]:
+        """Last reported LED states of a keypad."""
+        slot = self._slots.get(normalize_address(addr))
+        if slot is None or self._leds[slot] is None:
+            return None
+        return tuple(self._leds[slot])
+
+    def get_led(self, addr, index: int) -> Optional[int]:
+        """Last reported state of one LED (0 based) of a keypad, without copying the rest."""
+        slot = self._slots.get(normalize_address(addr))
+        if slot is None or self._leds[slot] is None or index >= len(self._leds[slot]):
+            return None
+        return self._leds[slot][index]
+
+    def is_enabled(self, addr) -> Optional[bool]:
+        """Last reported enable state of a keypad."""
+        slot = self._slots.get(normalize_address(addr))
+        if slot is None or self._enabled[slot] == _ENABLE_UNKNOWN:
+            return None
+        return self._enabled[slot] == _ENABLE_ON
+
+    def last_update(self, addr) -> Optional[float]:
+        """Monotonic receive time of the last change for addr."""
+        slot = self._slots.get(normalize_address(addr))
+        return None if slot is None else self._updated[slot]
+
+    def snapshot(self) -> Snapshot:
+        """Copy all known state under the lock."""
+        levels, leds, enabled = {}, {}, {}
+        with self._lock:
+            for addr, slot in self._slots.items():
+                name = format_address(addr)
+                if self._levels[slot] != UNKNOWN_LEVEL:
+                    levels[name] = self._levels[slot]
+                if self._leds[slot] is not None:
+                    leds[name] = tuple(self._leds[slot])
+                if self._enabled[slot] != _ENABLE_UNKNOWN:
+                    enabled[name] = self._enabled[slot] == _ENABLE_ON
+        return Snapshot(levels, leds, enabled)
+
+    def update(self, event) -> bool:
+        """Apply an event; listeners are notified only if it changed something."""
+        return self.apply(event) is not None
+
+    def apply(self, event):
+        """Apply an event and return it as listeners see it, None if nothing changed.
+
+        LED events come back with changed set to the mask of changed LEDs;
+        the first report of restored LED states counts as a change of all.
+        """
+        kind = type(event)
+        if kind not in (LightChanged, LedStateChanged, KeypadEnableChanged):
+            return None
+        with self._lock:
+            slot = self._slot(normalize_address(event.address))
+            if kind is LightChanged:
+                changed = self._levels[slot] != event.level
+                self._levels[slot] = event.level
+            elif kind is LedStateChanged:
+                leds = bytes(event.leds)
+                previous = self._leds[slot]
+                if slot in self._stale_leds:
+                    self._stale_leds.discard(slot)
+                    previous = None
+                changed = previous != leds
+                if changed:
+                    self._leds[slot] = leds
+                    event = event._replace(leds=leds, changed=led_changes(previous, leds))
+            else:
+                enabled = _ENABLE_ON if event.enabled else _ENABLE_OFF
+                changed = self._enabled[slot] != enabled
+                self._enabled[slot] = enabled
+            if changed:
+                self._updated[slot] = event.timestamp
+                self._stored(slot)
+
+        if not changed:
+            return None
+        for listener in self._listeners:
+            listener(event)
+        return event
+
+    def restored(self) -> List[Address]:
+        """Dimmers whose level was restored rather than reported; each is returned once."""
+        return []
+
+    def restored_keypads(self) -> List[Address]:
+        """Keypads whose LED states were restored rather than reported; each is returned once."""
+        return []
+
+    def close(self):
+        """Release what backs the store; the in-memory state stays readable."""
+
+    def _stored(self, slot: int):
+        """Called under the lock after slot changed."""
+
+    def _slot(self, addr: Address) -> int:
+        slot = self._slots.get(addr)
+        if slot is None:
+            slot = self._slots[addr] = len(self._levels)
+            self._levels.append(UNKNOWN_LEVEL)
+            self._leds.append(None)
+            self._enabled.append(_ENABLE_UNKNOWN)
+            self._updated.append(0.)
+        return slot
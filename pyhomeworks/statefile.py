@@ -0,0 +1,309 @@
+"""
+Device state backed by a memory-mapped file.
+
+The file has a fixed layout so it can be mapped as is: a header of ``MAGIC``,
+slot size, capacity and the number of slots in use, padded to
+``HEADER_SIZE``, followed by ``capacity`` slots of ``SLOT_SIZE`` bytes. A slot
+holds the address (component count, then one byte per component), a sequence
+number, the dimmer level, the keypad enable flag, the LED count, the wall
+clock time of the last change and up to ``MAX_LEDS`` LED states, little
+endian throughout. Slots are allocated in the order addresses are first
+seen and never move.
+
+``MappedDeviceState`` restores the state from the file when it is opened and
+writes every change through to its slot. Only one writer may have a file
+open; it holds an exclusive lock on it where the platform supports ``flock``.
+``StateFileReader`` maps it read-only from any number of other processes and
+reads single slots straight from the mapping. The writer makes the sequence
+number of a slot odd while it rewrites it, and readers retry until they read
+an even, unchanged sequence number around the slot's fields.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .address import Address, format_address, normalize_address
+from .state import _ENABLE_ON, _ENABLE_UNKNOWN, UNKNOWN_LEVEL, DeviceState, Snapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'HWSTA\x00\x01\n'
+HEADER_SIZE = 64
+SLOT_SIZE = 64
+MAX_LEDS = 32
+DEFAULT_CAPACITY = 1024
+
+# magic, slot size, capacity, slots in use
+_HEADER = struct.Struct('<8sIII')
+_COUNT_OFFSET = 16
+_COUNT = struct.Struct('<I')
+_ADDRESS = struct.Struct('<8s')
+_SEQUENCE = struct.Struct('<I')
+_SEQUENCE_OFFSET = 8
+# level (signed, like DeviceState's levels), enabled, LED count, wall clock
+# time of the last change, LED states
+_BODY = struct.Struct('<bBBxd%ds' % MAX_LEDS)
+_BODY_OFFSET = 12
+# LED count of a keypad that never reported its LEDs.
+_NO_LEDS = 0xFF
+# Reads of a slot left mid-write by a crashed writer give up waiting after this.
+_READ_RETRIES = 1000
+
+
+def _encode_address(addr: Address) -> bytes:
+    if len(addr) >= _ADDRESS.size:
+        raise ValueError(f"Address too long for a state file: {addr}")
+    return bytes((len(addr),) + addr)
+
+
+def _decode_address(data: bytes) -> Address:
+    return tuple(data[1:1 + data[0]])
+
+
+def _read_header(buffer) -> Tuple[int, int]:
+    """Validate the header; returns (capacity, slots in use)."""
+    if len(buffer) < HEADER_SIZE:
+        raise ValueError("Not a state file")
+    magic, slot_size, capacity, count = _HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError("Not a state file")
+    if slot_size != SLOT_SIZE or len(buffer) < HEADER_SIZE + capacity * SLOT_SIZE:
+        raise ValueError("Unsupported or truncated state file")
+    return capacity, min(count, capacity)
+
+
+def _slot_offset(slot: int) -> int:
+    return HEADER_SIZE + slot * SLOT_SIZE
+
+
+class MappedDeviceState(DeviceState):
+    """DeviceState restored from and written through to a state file.
+
+    A file that doesn't exist or is empty is created with room for capacity
+    addresses; an existing file keeps its capacity. Addresses beyond the
+    capacity are only kept in memory. Opening a file another writer has
+    open raises OSError.
+    """
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY):
+        DeviceState.__init__(self)
+        self.path = path
+        self._file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError as error:
+                    raise OSError(error.errno, f"State file {path} is open in another writer") from error
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self._file.truncate(HEADER_SIZE + capacity * SLOT_SIZE)
+                self._file.write(_HEADER.pack(MAGIC, SLOT_SIZE, capacity, 0))
+                self._file.flush()
+            self._map = mmap.mmap(self._file.fileno(), 0)
+            self.capacity, count = _read_header(self._map)
+        except Exception:
+            self._file.close()
+            raise
+        # Monotonic event timestamps are stored as wall clock time.
+        self._wall_offset = time.time() - time.monotonic()
+        self._restored: List[Address] = []
+        self._restored_keypads: List[Address] = []
+        self._warned = False
+        self._load(count)
+
+    def _load(self, count: int):
+        for slot in range(count):
+            offset = _slot_offset(slot)
+            addr = _decode_address(_ADDRESS.unpack_from(self._map, offset)[0])
+            sequence = _SEQUENCE.unpack_from(self._map, offset + _SEQUENCE_OFFSET)[0]
+            if sequence & 1:
+                # The previous writer stopped in the middle of this slot.
+                _SEQUENCE.pack_into(self._map, offset + _SEQUENCE_OFFSET, (sequence + 1) & 0xFFFFFFFF)
+            level, enabled, led_count, updated, leds = _BODY.unpack_from(self._map, offset + _BODY_OFFSET)
+            DeviceState._slot(self, addr)
+            self._levels[slot] = level
+            self._enabled[slot] = enabled
+            self._updated[slot] = updated - self._wall_offset if updated else 0.
+            if level != UNKNOWN_LEVEL:
+                self._restored.append(addr)
+            if led_count != _NO_LEDS:
+                self._leds[slot] = leds[:led_count]
+                self._stale_leds.add(slot)
+                self._restored_keypads.append(addr)
+        if count:
+            _LOGGER.info("Restored %d addresses from %s", count, self.path)
+
+    def restored(self) -> List[Address]:
+        with self._lock:
+            restored, self._restored = self._restored, []
+        return restored
+
+    def restored_keypads(self) -> List[Address]:
+        with self._lock:
+            restored, self._restored_keypads = self._restored_keypads, []
+        return restored
+
+    def flush(self):
+        """Write the mapping back to the file, e.g. before taking a backup."""
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self):
+        with self._lock:
+            if self._map is None:
+                return
+            self._map.flush()
+            self._map.close()
+            self._map = None
+            self._file.close()
+
+    def _slot(self, addr: Address) -> int:
+        slot = self._slots.get(addr)
+        if slot is not None:
+            return slot
+        slot = DeviceState._slot(self, addr)
+        if self._map is None:
+            return slot
+        if slot < self.capacity:
+            # Readers only look at slots below the count, so the address and
+            # an unknown state are in place before they can see the slot.
+            offset = _slot_offset(slot)
+            _ADDRESS.pack_into(self._map, offset, _encode_address(addr))
+            _BODY.pack_into(self._map, offset + _BODY_OFFSET,
+                            UNKNOWN_LEVEL, _ENABLE_UNKNOWN, _NO_LEDS, 0., b'')
+            _COUNT.pack_into(self._map, _COUNT_OFFSET, slot + 1)
+        elif not self._warned:
+            self._warned = True
+            _LOGGER.warning("State file %s is full; %s and later addresses are not persisted",
+                            self.path, format_address(addr))
+        return slot
+
+    def _stored(self, slot: int):
+        if slot >= self.capacity or self._map is None:
+            return
+        offset = _slot_offset(slot) + _SEQUENCE_OFFSET
+        sequence = _SEQUENCE.unpack_from(self._map, offset)[0]
+        _SEQUENCE.pack_into(self._map, offset, sequence + 1)
+        leds = self._leds[slot]
+        _BODY.pack_into(self._map, _slot_offset(slot) + _BODY_OFFSET,
+                        self._levels[slot], self._enabled[slot],
+                        _NO_LEDS if leds is None else min(len(leds), MAX_LEDS),
+                        self._updated[slot] + self._wall_offset, leds or b'')
+        _SEQUENCE.pack_into(self._map, offset, (sequence + 2) & 0xFFFFFFFF)
+
+
+class StateFileReader:
+    """Read-only view of a state file written by another process.
+
+    Lookups read one slot from the shared mapping; nothing is copied up
+    front and no connection to the controller is needed. Times are wall
+    clock times, as another process's monotonic clock means nothing here.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.capacity, _ = _read_header(self._map)
+        except ValueError:
+            self._map.close()
+            raise
+        self._slots: Dict[Address, int] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def __len__(self) -> int:
+        return self._refresh()
+
+    def _refresh(self) -> int:
+        """Index the slots the writer added since the last call."""
+        count = min(_COUNT.unpack_from(self._map, _COUNT_OFFSET)[0], self.capacity)
+        for slot in range(len(self._slots), count):
+            addr = _decode_address(_ADDRESS.unpack_from(self._map, _slot_offset(slot))[0])
+            self._slots[addr] = slot
+        return count
+
+    def _find(self, addr) -> Optional[int]:
+        addr = normalize_address(addr)
+        slot = self._slots.get(addr)
+        if slot is None:
+            self._refresh()
+            slot = self._slots.get(addr)
+        return slot
+
+    def _read(self, slot: int) -> tuple:
+        offset = _slot_offset(slot)
+        for _ in range(_READ_RETRIES):
+            sequence = _SEQUENCE.unpack_from(self._map, offset + _SEQUENCE_OFFSET)[0]
+            if not sequence & 1:
+                body = _BODY.unpack_from(self._map, offset + _BODY_OFFSET)
+                if _SEQUENCE.unpack_from(self._map, offset + _SEQUENCE_OFFSET)[0] == sequence:
+                    return body
+            time.sleep(0)
+        return _BODY.unpack_from(self._map, offset + _BODY_OFFSET)
+
+    def addresses(self) -> List[str]:
+        """Formatted addresses with a slot in the file."""
+        self._refresh()
+        return [format_address(addr) for addr in self._slots]
+
+    def get_level(self, addr) -> Optional[int]:
+        """Last reported level of a dimmer, or None if it never reported."""
+        slot = self._find(addr)
+        if slot is None:
+            return None
+        level = self._read(slot)[0]
+        return None if level == UNKNOWN_LEVEL else level
+
+    def get_leds(self, addr) -> Optional[Tuple[int, ...]]:
+        """Last reported LED states of a keypad."""
+        slot = self._find(addr)
+        if slot is None:
+            return None
+        _, _, led_count, _, leds = self._read(slot)
+        return None if led_count == _NO_LEDS else tuple(leds[:led_count])
+
+    def is_enabled(self, addr) -> Optional[bool]:
+        """Last reported enable state of a keypad."""
+        slot = self._find(addr)
+        if slot is None:
+            return None
+        enabled = self._read(slot)[1]
+        return None if enabled == _ENABLE_UNKNOWN else enabled == _ENABLE_ON
+
+    def last_update(self, addr) -> Optional[float]:
+        """Wall clock time of the last change for addr."""
+        slot = self._find(addr)
+        return None if slot is None else self._read(slot)[3]
+
+    def snapshot(self) -> Snapshot:
+        """Copy all known state, slot by slot."""
+        levels, leds, enabled = {}, {}, {}
+        self._refresh()
+        for addr, slot in self._slots.items():
+            name = format_address(addr)
+            level, enable, led_count, _, led_states = self._read(slot)
+            if level != UNKNOWN_LEVEL:
+                levels[name] = level
+            if led_count != _NO_LEDS:
+                leds[name] = tuple(led_states[:led_count])
+            if enable != _ENABLE_UNKNOWN:
+                enabled[name] = enable == _ENABLE_ON
+        return Snapshot(levels, leds, enabled)
@@ -0,0 +1,263 @@
+"""
+Outgoing command path.
+
+Commands are queued without blocking the caller and written in batches:
+everything issued within a short coalescing window goes out in one write.
+Each queued command gets a ``concurrent.futures.Future`` that completes once
+its bytes have been handed to the socket in full.
+
+The controller sits behind an RS232 adaptor, so writes can optionally be paced
+by a token bucket that models the serial line (``baud / 10`` bytes per
+second for 8N1). Commands wait in priority lanes: interactive commands such
+as ``FADEDIM`` always go ahead of background ``RDL`` polling.
+"""
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache
+from threading import Condition, Thread
+from typing import Callable, Deque, List, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+COMMAND_SEPARATOR = b'\r\n'
+COALESCE_WINDOW = 0.002
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+# Bits per byte on the serial line: start bit, 8 data bits, stop bit.
+BITS_PER_BYTE = 10
+# Bytes the adaptor may accept ahead of the serial line.
+DEFAULT_BURST = 256
+
+
+@lru_cache(maxsize=1024)
+def encode_command(command: str) -> bytes:
+    """Encode a command and its separator; repeated commands reuse the same bytes."""
+    return command.encode('utf8') + COMMAND_SEPARATOR
+
+
+def write_all(send: Callable[[memoryview], int], data: bytes) -> int:
+    """Call send until every byte of data was accepted."""
+    view = memoryview(data)
+    total = len(view)
+    offset = 0
+    while offset < total:
+        offset += send(view[offset:])
+    return total
+
+
+class TokenBucket:
+    """Byte budget refilled at a constant rate, up to a burst capacity."""
+
+    def __init__(self, rate: float, capacity: float = DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    @classmethod
+    def for_baud(cls, baud: int, capacity: float = DEFAULT_BURST) -> 'TokenBucket':
+        """Bucket draining like a serial line at baud."""
+        return cls(baud / BITS_PER_BYTE, capacity)
+
+    def available(self, now: float) -> float:
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+        return self._tokens
+
+    def consume(self, size: int, now: float):
+        self.available(now)
+        self._tokens -= size
+
+    def delay(self, size: int, now: float) -> float:
+        """Seconds until size bytes may be sent."""
+        missing = min(size, self.capacity) - self.available(now)
+        return max(0., missing / self.rate)
+
+
+class QueueStats:
+    """Queueing delay of the commands written from one lane."""
+    __slots__ = ('count', 'total_delay', 'max_delay')
+
+    def __init__(self):
+        self.count = 0
+        self.total_delay = 0.
+        self.max_delay = 0.
+
+    def record(self, delay: float):
+        self.count += 1
+        self.total_delay += delay
+        if delay > self.max_delay:
+            self.max_delay = delay
+
+    @property
+    def mean_delay(self) -> float:
+        return self.total_delay / self.count if self.count else 0.
+
+    def __repr__(self):
+        return (f'QueueStats(count={self.count}, mean_delay={self.mean_delay:.6f}, '
+                f'max_delay={self.max_delay:.6f})')
+
+
+class OutgoingQueue:
+    """Prioritized commands waiting for a write, with their completion futures.
+
+    Not thread-safe; CommandWriter and HomeworksProtocol serialize access.
+    """
+
+    def __init__(self, coalesce_window: float = COALESCE_WINDOW, bucket: Optional[TokenBucket] = None):
+        self.coalesce_window = coalesce_window
+        self.bucket = bucket
+        self._lanes: Tuple[Deque[tuple], ...] = tuple(deque() for _ in PRIORITIES)
+        self.stats = tuple(QueueStats() for _ in PRIORITIES)
+        self.first_enqueued: Optional[float] = None
+
+    def __len__(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    def put(self, data: bytes, priority: int = PRIORITY_INTERACTIVE) -> Future:
+        future = Future()
+        now = time.monotonic()
+        if self.first_enqueued is None:
+            self.first_enqueued = now
+        self._lanes[priority].append((data, future, now))
+        return future
+
+    def ready_at(self, now: float) -> Optional[float]:
+        """Monotonic time at which take() will return data, None if empty."""
+        if self.first_enqueued is None:
+            return None
+        ready = self.first_enqueued + self.coalesce_window
+        if self.bucket is not None:
+            head = next(lane[0][0] for lane in self._lanes if lane)
+            ready = max(ready, now + self.bucket.delay(len(head), now))
+        return ready
+
+    def take(self, now: Optional[float] = None, limited: bool = True) -> Tuple[bytes, List[Future]]:
+        """Remove as many commands as the byte budget allows, highest priority first."""
+        now = time.monotonic() if now is None else now
+        bucket = self.bucket if limited else None
+        budget = bucket.available(now) if bucket is not None else None
+        full = budget is not None and budget >= bucket.capacity
+        chunks = []
+        futures = []
+        for lane, stats in zip(self._lanes, self.stats):
+            while lane:
+                data = lane[0][0]
+                if budget is not None and len(data) > budget and not (full and not chunks):
+                    break
+                data, future, enqueued = lane.popleft()
+                chunks.append(data)
+                futures.append(future)
+                stats.record(now - enqueued)
+                if budget is not None:
+                    budget -= len(data)
+            if lane:
+                # Lower lanes never overtake a blocked higher one.
+                break
+
+        data = b''.join(chunks)
+        if bucket is not None:
+            bucket.consume(len(data), now)
+        remaining = [lane[0][2] for lane in self._lanes if lane]
+        self.first_enqueued = min(remaining) if remaining else None
+        return data, futures
+
+    def fail_all(self, exc: BaseException):
+        """Fail every queued command."""
+        futures = [future for lane in self._lanes for _, future, _ in lane]
+        for lane in self._lanes:
+            lane.clear()
+        self.first_enqueued = None
+        complete(futures, exc)
+
+
+def complete(futures: List[Future], exc: Optional[BaseException] = None):
+    """Resolve the futures of a finished write."""
+    for future in futures:
+        if not future.set_running_or_notify_cancel():
+            continue
+        if exc is None:
+            future.set_result(True)
+        else:
+            future.set_exception(exc)
+
+
+class CommandWriter(Thread):
+    """Thread-safe writer used by the threaded interface.
+
+    ``write`` only queues and returns; the writer thread waits
+    ``coalesce_window`` after the first command of a burst, and for the
+    token bucket if one is configured, then sends what is due with as few
+    ``send`` calls as the socket allows.
+    """
+
+    def __init__(self, send: Callable[[memoryview], int],
+                 coalesce_window: float = COALESCE_WINDOW, bucket: Optional[TokenBucket] = None):
+        Thread.__init__(self, name='homeworks-writer', daemon=True)
+        self._send = send
+        self._condition = Condition()
+        self._queue = OutgoingQueue(coalesce_window, bucket)
+        self._closing = False
+
+    @property
+    def stats(self) -> Tuple[QueueStats, ...]:
+        """Queueing delay per priority lane."""
+        return self._queue.stats
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def write(self, data: bytes, priority: int = PRIORITY_INTERACTIVE) -> Future:
+        """Queue encoded bytes for sending; never blocks on the socket."""
+        with self._condition:
+            if self._closing:
+                future = Future()
+                future.set_exception(ConnectionError("Writer is closed"))
+                return future
+            future = self._queue.put(data, priority)
+            self._condition.notify()
+            if not self.is_alive() and self.ident is None:
+                self.start()
+        return future
+
+    def close(self, timeout: float = 1.):
+        """Flush what is already queued and stop the writer thread."""
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+        if self.ident is not None:
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._closing:
+                        if not self._queue:
+                            return
+                        break
+                    ready = self._queue.ready_at(time.monotonic())
+                    if ready is None:
+                        self._condition.wait()
+                        continue
+                    remaining = ready - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                data, futures = self._queue.take(limited=not self._closing)
+
+            if not futures:
+                continue
+            try:
+                write_all(self._send, data)
+            except (OSError, AttributeError) as error:
+                _LOGGER.warning("Failed to send %d commands: %s", len(futures), error)
+                complete(futures, ConnectionError(f"Send failed: {error}"))
+            else:
+                complete(futures)
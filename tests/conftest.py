@@ -0,0 +1,43 @@
+"""Fixtures shared by the asyncio tests."""
+import asyncio
+
+import pytest_asyncio
+
+
+class FakeController(asyncio.Protocol):
+    """Minimal controller: prompts, records commands, answers RDL."""
+
+    def __init__(self, received, connections=None, unanswered=()):
+        self.received = received
+        self.connections = connections
+        self.unanswered = unanswered
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.connections is not None:
+            self.connections.append(transport)
+        transport.write(b'LNET> ')
+
+    def data_received(self, data):
+        for command in data.split(b'\r\n'):
+            if not command:
+                continue
+            self.received.append(command)
+            if command.startswith(b'RDL, ') and command[5:] not in self.unanswered:
+                self.transport.write(b'DL, ' + command[5:] + b',  42\r\n')
+
+
+@pytest_asyncio.fixture
+async def controller():
+    received = []
+    connections = []
+    unanswered = set()
+    server = await asyncio.get_running_loop().create_server(
+        lambda: FakeController(received, connections, unanswered), '127.0.0.1', 0)
+    server.received = received
+    server.connections = connections
+    server.unanswered = unanswered
+    server.port = server.sockets[0].getsockname()[1]
+    yield server
+    server.close()
+    await server.wait_closed()
@@ -0,0 +1,337 @@
+"""
+TCP simulator of a Homeworks controller for integration and load tests.
+
+``ControllerSimulator`` serves any number of connections from an inventory
+of dimmers and keypads. It answers the monitor commands, ``RDL`` and
+``FADEDIM`` for one or more addresses (streaming intermediate ``DL`` levels
+like the real processor), generates keypad button and LED traffic at a configurable rate, can pace its
+output to a serial line's baud rate and injects faults: split packets,
+garbage lines and disconnects.
+
+It runs on the caller's event loop (``await start()``) or on a private loop
+thread (``start_thread()``) for threaded clients.
+"""
+import asyncio
+import random
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from pyhomeworks.address import format_address
+
+SEPARATOR = b'\r\n'
+PROMPT = b'LNET> '
+LEDS_PER_KEYPAD = 24
+BUTTONS_PER_KEYPAD = 24
+
+MONITOR_REPLIES = {
+    b'KBMON': b'Keypad button monitoring enabled',
+    b'GSMON': b'GrafikEye scene monitoring enabled',
+    b'DLMON': b'Dimmer level monitoring enabled',
+    b'KLMON': b'Keypad led monitoring enabled',
+}
+
+
+class Inventory:
+    """Dimmer levels and keypad LED states, keyed by formatted address."""
+
+    def __init__(self, dimmers: Iterable[str] = (), keypads: Iterable[str] = ()):
+        self.levels: Dict[str, int] = {format_address(addr): 0 for addr in dimmers}
+        self.leds: Dict[str, bytearray] = {format_address(addr): bytearray(LEDS_PER_KEYPAD)
+                                           for addr in keypads}
+
+    @classmethod
+    def generate(cls, dimmers: int = 1000, keypads: int = 100) -> 'Inventory':
+        """Inventory of the given size spread over processors, links and modules."""
+        return cls(('[%02d:%02d:%02d:%02d:%02d]' % (1 + i // 4096, 1 + i // 1024 % 4, i // 64 % 16,
+                                                     1 + i // 4 % 16, 1 + i % 4)
+                    for i in range(dimmers)),
+                   ('[%02d:%02d:%02d]' % (1 + i // 128, 4 + i // 32 % 4, 1 + i % 32)
+                    for i in range(keypads)))
+
+
+class Faults:
+    """Fault injection settings; the defaults inject nothing."""
+
+    def __init__(self, split_packets: int = 0, garbage_rate: float = 0.,
+                 disconnect_after: Optional[int] = None):
+        """
+        :param split_packets: write output in chunks of at most this many bytes
+        :param garbage_rate: probability of a garbage line before each line
+        :param disconnect_after: drop each connection after this many lines
+        """
+        self.split_packets = split_packets
+        self.garbage_rate = garbage_rate
+        self.disconnect_after = disconnect_after
+
+
+class _Connection(asyncio.Protocol):
+
+    def __init__(self, simulator: 'ControllerSimulator'):
+        self._simulator = simulator
+        self._rng = simulator.rng
+        self._buffer = b''
+        self._output = bytearray()
+        self._drain_handle = None
+        self._lines_sent = 0
+        self.transport: Optional[asyncio.Transport] = None
+        self.logged_in = simulator.login is None
+        self.prompts = True
+        self.monitors = set()
+        self.received: List[bytes] = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._simulator.connections.append(self)
+        if self.logged_in:
+            self.send(PROMPT, line=False)
+        else:
+            self.send(b'LOGIN: ', line=False)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if self._drain_handle is not None:
+            self._drain_handle.cancel()
+        if self in self._simulator.connections:
+            self._simulator.connections.remove(self)
+
+    def data_received(self, data):
+        self._buffer += data
+        *commands, self._buffer = self._buffer.split(SEPARATOR)
+        for command in commands:
+            self.received.append(command)
+            if not self.logged_in:
+                self._handle_login(command)
+            else:
+                self._simulator.handle_command(self, command.strip())
+                if self.prompts:
+                    self.send(PROMPT, line=False)
+
+    def _handle_login(self, credentials):
+        if credentials == self._simulator.login.encode():
+            self.logged_in = True
+            self.send(b'login successful')
+        else:
+            self.send(b'login incorrect')
+            self.send(b'LOGIN: ', line=False)
+
+    def send(self, data: bytes, line: bool = True):
+        if self.transport is None:
+            return
+        faults = self._simulator.faults
+        if line:
+            if faults.garbage_rate and self._rng.random() < faults.garbage_rate:
+                self._output += bytes(self._rng.randrange(256) for _ in range(12)) + SEPARATOR
+            data += SEPARATOR
+        self._output += data
+        if line:
+            self._lines_sent += 1
+        if self._drain_handle is None:
+            self._drain()
+        if faults.disconnect_after is not None and self._lines_sent >= faults.disconnect_after:
+            self.disconnect()
+
+    def disconnect(self):
+        if self.transport is not None:
+            self._flush_output()
+            self.transport.close()
+
+    def _flush_output(self):
+        if self._output:
+            self.transport.write(bytes(self._output))
+            self._output.clear()
+
+    def _drain(self):
+        self._drain_handle = None
+        if self.transport is None or not self._output:
+            return
+        faults = self._simulator.faults
+        rate = self._simulator.baud / 10 if self._simulator.baud else None
+        if rate is None and not faults.split_packets:
+            self._flush_output()
+            return
+        size = len(self._output)
+        if faults.split_packets:
+            size = min(size, self._rng.randint(1, faults.split_packets))
+        delay = 0.001
+        if rate is not None:
+            size = max(1, min(size, int(rate * self._simulator.tick)))
+            delay = size / rate
+        self.transport.write(bytes(self._output[:size]))
+        del self._output[:size]
+        if self._output:
+            self._drain_handle = asyncio.get_running_loop().call_later(delay, self._drain)
+
+
+class ControllerSimulator:
+    """Local TCP server speaking the controller's RS232 protocol."""
+
+    def __init__(self, inventory: Optional[Inventory] = None, login: Optional[str] = None,
+                 baud: Optional[int] = None, faults: Optional[Faults] = None,
+                 fade_step: float = 0.1, seed: int = 0):
+        """
+        :param login: credentials required after the LOGIN prompt
+        :param baud: pace output like a serial line at this speed
+        :param fade_step: interval of intermediate DL levels during fades
+        """
+        self.inventory = inventory or Inventory()
+        self.login = login
+        self.baud = baud
+        self.faults = faults or Faults()
+        self.fade_step = fade_step
+        self.tick = 0.01
+        self.rng = random.Random(seed)
+        self.connections: List[_Connection] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._fades: Dict[str, asyncio.Task] = {}
+        self._traffic: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self.port: Optional[int] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self._loop = asyncio.get_running_loop()
+        self._server = await self._loop.create_server(lambda: _Connection(self), host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.stop_traffic()
+        for task in self._fades.values():
+            task.cancel()
+        self._fades.clear()
+        for connection in list(self.connections):
+            connection.disconnect()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def start_thread(self, host: str = '127.0.0.1', port: int = 0):
+        """Serve from a private event loop thread."""
+        loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=loop.run_forever, name='homeworks-simulator', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(host, port), loop).result(5)
+
+    def stop_thread(self):
+        loop = self._loop
+        asyncio.run_coroutine_threadsafe(self.stop(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(5)
+        loop.close()
+
+    def threadsafe(self, func, *args):
+        """Run func(*args) on the simulator's loop and wait for the result."""
+        async def call():
+            return func(*args)
+        return asyncio.run_coroutine_threadsafe(call(), self._loop).result(5)
+
+    @property
+    def received(self) -> List[bytes]:
+        """Commands received on all current connections."""
+        return [command for connection in self.connections for command in connection.received]
+
+    def broadcast(self, line: bytes, monitor: bytes):
+        """Send line to every connection that enabled monitor."""
+        for connection in list(self.connections):
+            if monitor in connection.monitors:
+                connection.send(line)
+
+    def disconnect_all(self):
+        for connection in list(self.connections):
+            connection.disconnect()
+
+    def handle_command(self, connection: _Connection, command: bytes):
+        if command == b'PROMPTOFF':
+            connection.prompts = False
+        elif command in MONITOR_REPLIES:
+            connection.monitors.add(command)
+            connection.send(MONITOR_REPLIES[command])
+        elif command.startswith(b'RDL, '):
+            addr = self._known_dimmer(command[5:])
+            if addr is not None:
+                connection.send(self._dl(addr))
+        elif command.startswith(b'FADEDIM, '):
+            self._fade_command(command)
+
+    def _known_dimmer(self, raw: bytes) -> Optional[str]:
+        try:
+            addr = format_address(raw.decode().strip())
+        except ValueError:
+            return None
+        return addr if addr in self.inventory.levels else None
+
+    def _dl(self, addr: str) -> bytes:
+        return b'DL, %s,  %d' % (addr.encode(), self.inventory.levels[addr])
+
+    def _fade_command(self, command: bytes):
+        try:
+            _, intensity, fade_time, delay_time, raw = command.split(b', ', 4)
+            intensity, fade_time, delay_time = int(intensity), float(fade_time), float(delay_time)
+        except ValueError:
+            return
+        for raw_addr in raw.split(b','):
+            addr = self._known_dimmer(raw_addr)
+            if addr is None:
+                continue
+            previous = self._fades.pop(addr, None)
+            if previous is not None:
+                previous.cancel()
+            self._fades[addr] = asyncio.get_running_loop().create_task(
+                self._fade(addr, max(0, min(100, intensity)), fade_time, delay_time))
+
+    async def _fade(self, addr: str, target: int, fade_time: float, delay_time: float):
+        try:
+            if delay_time:
+                await asyncio.sleep(delay_time)
+            start = self.inventory.levels[addr]
+            steps = max(1, int(fade_time / self.fade_step))
+            for step in range(1, steps + 1):
+                level = start + (target - start) * step // steps
+                if level != self.inventory.levels[addr]:
+                    self.inventory.levels[addr] = level
+                    self.broadcast(self._dl(addr), b'DLMON')
+                if step < steps:
+                    await asyncio.sleep(self.fade_step)
+        finally:
+            if self._fades.get(addr) is asyncio.current_task():
+                del self._fades[addr]
+
+    def press(self, keypad: str, button: int, release: bool = True):
+        """Report a button press (and release) on a keypad."""
+        addr = format_address(keypad).encode()
+        self.broadcast(b'KBP, %s,  %d' % (addr, button), b'KBMON')
+        if release:
+            self.broadcast(b'KBR, %s,  %d' % (addr, button), b'KBMON')
+
+    def set_leds(self, keypad: str, leds: Iterable[int]):
+        """Change the LED states of a keypad and report them."""
+        addr = format_address(keypad)
+        state = self.inventory.leds.setdefault(addr, bytearray(LEDS_PER_KEYPAD))
+        state[:] = bytes(leds)
+        self.broadcast(b'KLS, %s, %s' % (addr.encode(), bytes(b + 48 for b in state)), b'KLMON')
+
+    def start_traffic(self, rate: float, led_share: float = 0.5):
+        """Generate random keypad button and LED events at rate events/s."""
+        self.stop_traffic()
+        self._traffic = asyncio.get_running_loop().create_task(self._generate(rate, led_share))
+
+    def stop_traffic(self):
+        if self._traffic is not None:
+            self._traffic.cancel()
+            self._traffic = None
+
+    async def _generate(self, rate: float, led_share: float):
+        keypads = list(self.inventory.leds)
+        if not keypads:
+            return
+        loop = asyncio.get_running_loop()
+        interval = 1. / rate
+        due = loop.time()
+        while True:
+            keypad = self.rng.choice(keypads)
+            if self.rng.random() < led_share:
+                leds = self.inventory.leds[keypad]
+                leds[self.rng.randrange(LEDS_PER_KEYPAD)] ^= 1
+                self.set_leds(keypad, leds)
+            else:
+                self.press(keypad, self.rng.randint(1, BUTTONS_PER_KEYPAD))
+            due += interval
+            await asyncio.sleep(max(0., due - loop.time()))
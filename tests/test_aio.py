@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from pyhomeworks import AsyncHomeworks
+from pyhomeworks.pyhomeworks import HW_BUTTON_PRESSED, HW_KEYPAD_LED_CHANGED, HW_LIGHT_CHANGED
+
+
+@pytest.mark.asyncio
+async def test_connect_subscribes(controller):
+    hw = AsyncHomeworks('127.0.0.1', controller.port, lambda *args: None)
+    await hw.connect()
+    try:
+        await asyncio.sleep(0.05)
+        assert controller.received == [b'PROMPTOFF', b'KBMON', b'GSMON', b'DLMON', b'KLMON']
+        assert hw.connected
+    finally:
+        await hw.close()
+    assert not hw.connected
+
+
+@pytest.mark.asyncio
+async def test_events_dispatched_on_loop(controller):
+    events = asyncio.Queue()
+    async with AsyncHomeworks('127.0.0.1', controller.port,
+                              lambda *args: events.put_nowait(args)) as hw:
+        await hw.request_dimmer_level('[01:01:00:03:02]')
+        assert await asyncio.wait_for(events.get(), 1) == (HW_LIGHT_CHANGED, ['[01:01:00:03:02]', 42])
+
+
+@pytest.mark.asyncio
+async def test_connect_refused():
+    hw = AsyncHomeworks('127.0.0.1', 1, lambda *args: None)
+    with pytest.raises(ConnectionError):
+        await hw.connect()
+
+
+@pytest.mark.asyncio
+async def test_query_levels(controller):
+    async with AsyncHomeworks('127.0.0.1', controller.port) as hw:
+        addrs = ['[01:01:00:03:%02d]' % i for i in range(40)]
+        assert await hw.query_levels(addrs) == {addr: 42 for addr in addrs}
+
+
+@pytest.mark.asyncio
+async def test_query_levels_timeout(controller):
+    controller.unanswered.add(b'[01:01:00:03:05]')
+    async with AsyncHomeworks('127.0.0.1', controller.port) as hw:
+        hw._queries.timeout = 0.05
+        assert await hw.query_levels(['[01:01:00:03:04]', '[01:01:00:03:05]']) == {
+            '[01:01:00:03:04]': 42, '[01:01:00:03:05]': None}
+
+
+@pytest.mark.asyncio
+async def test_reconnect_resubscribes_and_resyncs(controller):
+    levels = asyncio.Queue()
+    hw = AsyncHomeworks('127.0.0.1', controller.port)
+    hw._backoff.initial = 0.01
+    hw.dispatcher.subscribe(lambda event: levels.put_nowait(event.level), '[01:01:00:03:02]', HW_LIGHT_CHANGED)
+    hw.dispatcher.subscribe(lambda event: None, '[01:04:10]', HW_BUTTON_PRESSED, 1)
+    await hw.connect()
+    try:
+        controller.received.clear()
+        controller.connections[0].close()
+        assert await asyncio.wait_for(levels.get(), 2) == 42
+        assert hw.connected
+        assert hw.reconnects == 1
+        # Only the monitors the subscriptions need.
+        assert controller.received == [b'PROMPTOFF', b'KBMON', b'DLMON', b'RDL, [01:01:00:03:02]']
+    finally:
+        await hw.close()
+
+
+@pytest.mark.asyncio
+async def test_monitoring_follows_subscriptions(controller):
+    hw = AsyncHomeworks('127.0.0.1', controller.port)
+    await hw.connect()
+    try:
+        await asyncio.sleep(0.05)
+        assert controller.received == [b'PROMPTOFF', b'DLMON']
+        assert hw._protocol.drop_prefixes == (
+            b'KBP, ', b'KBR, ', b'KBH, ', b'KBDT, ', b'DBP, ', b'DBR, ', b'DBH, ', b'DBDT, ',
+            b'SVBP, ', b'SVBR, ', b'SVBH, ', b'SVBDT, ', b'KLS, ', b'KES, ')
+
+        unsubscribe = hw.dispatcher.subscribe(lambda event: None, '[01:04:10]', HW_KEYPAD_LED_CHANGED)
+        await asyncio.sleep(0.05)
+        assert controller.received[2:] == [b'KLMON']
+        assert b'KLS, ' not in hw._protocol.drop_prefixes
+
+        unsubscribe()
+        await asyncio.sleep(0.05)
+        assert controller.received[3:] == [b'KLMOFF']
+        assert b'KLS, ' in hw._protocol.drop_prefixes
+    finally:
+        await hw.close()
+
+
+@pytest.mark.asyncio
+async def test_handler_error_keeps_reading(controller):
+    levels = asyncio.Queue()
+
+    def callback(msg_type, values):
+        levels.put_nowait(values[1])
+        raise RuntimeError('handler failed')
+
+    hw = AsyncHomeworks('127.0.0.1', controller.port, callback)
+    await hw.connect()
+    await hw.request_dimmer_level('[01:01:00:03:02]')
+    await hw.request_dimmer_level('[01:01:00:03:03]')
+    assert await asyncio.wait_for(levels.get(), 1) == 42
+    assert await asyncio.wait_for(levels.get(), 1) == 42
+    assert hw.connected
+    await hw.close()
+
+
+@pytest.mark.asyncio
+async def test_query_levels_when_disconnected():
+    hw = AsyncHomeworks('127.0.0.1', 1)
+    with pytest.raises(ConnectionError):
+        await hw.query_levels(['[01:01:00:03:02]'])
+    assert len(hw._queries) == 0
+
+
+@pytest.mark.asyncio
+async def test_subscribe_from_another_thread(controller):
+    async with AsyncHomeworks('127.0.0.1', controller.port) as hw:
+        await asyncio.sleep(0.05)
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: hw.dispatcher.subscribe(lambda event: None, '[01:04:10]', HW_BUTTON_PRESSED, 1))
+        await asyncio.sleep(0.05)
+        assert controller.received[2:] == [b'KBMON']
+        assert b'KBP, ' not in hw._protocol.drop_prefixes
@@ -0,0 +1,14 @@
+from pyhomeworks.backoff import Backoff
+
+
+def test_delays_grow_to_maximum():
+    backoff = Backoff(1., 8., jitter=0.5, rng=lambda: 0.)
+    assert [backoff.next_delay() for _ in range(6)] == [1., 2., 4., 8., 8., 8.]
+    backoff.reset()
+    assert backoff.next_delay() == 1.
+
+
+def test_jitter_shortens_delay():
+    backoff = Backoff(4., 60., jitter=0.5, rng=lambda: 1.)
+    assert backoff.next_delay() == 2.
+    assert backoff.attempts == 1
@@ -0,0 +1,119 @@
+import asyncio
+import io
+import time
+
+import pytest
+
+from pyhomeworks import AsyncHomeworks, Homeworks
+from pyhomeworks.capture import DIRECTION_IN, DIRECTION_OUT, CaptureWriter, Record, read_capture
+from pyhomeworks.events import LightChanged
+
+from .simulator import ControllerSimulator, Inventory
+
+DIMMER = '[01:01:00:01:01]'
+
+
+def test_roundtrip_and_truncation():
+    file = io.BytesIO()
+    capture = CaptureWriter(file)
+    capture.record(DIRECTION_IN, b'DL, [01:01:00:01:01],  42\r\n', 1.5)
+    capture.record(DIRECTION_OUT, memoryview(b'RDL, [01:01:00:01:01]\r\n'), 2.)
+    capture.close()
+
+    data = file.getvalue()
+    assert list(read_capture(io.BytesIO(data))) == [
+        Record(1.5, DIRECTION_IN, b'DL, [01:01:00:01:01],  42\r\n'),
+        Record(2., DIRECTION_OUT, b'RDL, [01:01:00:01:01]\r\n')]
+    assert len(list(read_capture(io.BytesIO(data[:-3])))) == 1
+    with pytest.raises(ValueError):
+        list(read_capture(io.BytesIO(b'garbage')))
+
+
+def test_appends_to_existing_file(tmp_path):
+    path = str(tmp_path / 'traffic.hwcap')
+    for level in (1, 2):
+        capture = CaptureWriter(path)
+        capture.record(DIRECTION_IN, b'%d' % level, float(level))
+        capture.close()
+    assert [record.data for record in read_capture(path)] == [b'1', b'2']
+
+
+def test_record_after_close_is_ignored(tmp_path):
+    path = str(tmp_path / 'traffic.hwcap')
+    capture = CaptureWriter(path)
+    capture.record(DIRECTION_IN, b'1', 1.)
+    capture.close()
+    capture.record(DIRECTION_OUT, b'2', 2.)
+    capture.flush()
+    capture.close()
+    assert [record.data for record in read_capture(path)] == [b'1']
+
+
+@pytest.mark.asyncio
+async def test_capture_and_replay(tmp_path):
+    path = str(tmp_path / 'session.hwcap')
+    simulator = ControllerSimulator(Inventory([DIMMER]), fade_step=0.01)
+    simulator.inventory.levels[DIMMER] = 10
+    await simulator.start()
+    live = []
+    try:
+        async with AsyncHomeworks('127.0.0.1', simulator.port, event_callback=live.append) as hw:
+            hw.start_capture(path)
+            await hw.fade_dim(60, 1, 0, DIMMER)
+            while hw.state.get_level(DIMMER) != 60:
+                await asyncio.sleep(0.01)
+            hw.stop_capture()
+    finally:
+        await simulator.stop()
+
+    records = list(read_capture(path))
+    assert any(b'FADEDIM' in record.data for record in records if record.direction == DIRECTION_OUT)
+    assert live and all(type(event) is LightChanged for event in live)
+
+    replayed = []
+    hw = AsyncHomeworks('127.0.0.1', 0, event_callback=replayed.append)
+    started = time.monotonic()
+    await hw.replay(path, speed=None)
+    await hw.close()
+    assert time.monotonic() - started < 1
+    assert [event.level for event in replayed] == [event.level for event in live]
+    assert hw.state.get_level(DIMMER) == 60
+
+
+@pytest.mark.asyncio
+async def test_replay_keeps_scaled_timing():
+    records = [Record(10., DIRECTION_IN, b'LNET> '),
+               Record(10.4, DIRECTION_IN, b'DL, [01:01:00:01:01],  1\r\n')]
+    for speed, low, high in ((1., 0.35, 1.), (4., 0.05, 0.3)):
+        hw = AsyncHomeworks('127.0.0.1', 0)
+        started = time.monotonic()
+        await hw.replay(records, speed)
+        elapsed = time.monotonic() - started
+        await hw.close()
+        assert low < elapsed < high
+        assert hw.state.get_level(DIMMER) == 1
+
+
+def test_threaded_capture(tmp_path):
+    path = str(tmp_path / 'threaded.hwcap')
+    simulator = ControllerSimulator(Inventory([DIMMER]))
+    simulator.start_thread()
+    hw = Homeworks('127.0.0.1', simulator.port, autostart=False)
+    hw.start_capture(path)
+    hw.start()
+    try:
+        deadline = time.monotonic() + 2
+        while not hw._subscribed:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert hw.query_levels([DIMMER])[DIMMER].result(2) == 0
+    finally:
+        hw.close()
+        hw.join(1)
+        hw.stop_capture()
+        simulator.stop_thread()
+
+    received = b''.join(record.data for record in read_capture(path) if record.direction == DIRECTION_IN)
+    sent = b''.join(record.data for record in read_capture(path) if record.direction == DIRECTION_OUT)
+    assert received.startswith(b'LNET> ') and b'DL, [01:01:00:01:01],  0\r\n' in received
+    assert sent.startswith(b'PROMPTOFF\r\n') and b'RDL, [01:01:00:01:01]\r\n' in sent
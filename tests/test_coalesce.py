@@ -0,0 +1,94 @@
+import pytest
+
+from pyhomeworks.coalesce import EventCoalescer
+from pyhomeworks.events import HW_BUTTON_PRESSED, ButtonEvent, LedStateChanged, LightChanged
+from pyhomeworks.pyhomeworks import BaseHomeworks
+
+ADDR = '[01:01:00:03:02]'
+
+
+@pytest.fixture
+def delivered():
+    return []
+
+
+@pytest.fixture
+def coalescer(delivered):
+    return EventCoalescer(delivered.append, window=0.1)
+
+
+def test_single_event_is_immediate(coalescer, delivered):
+    event = LightChanged(ADDR, 10, 0.)
+    coalescer.submit(event, now=0.)
+    assert delivered == [event]
+    assert coalescer.next_deadline() is None
+
+
+def test_fade_is_bounded_and_ends_with_final_value(coalescer, delivered):
+    for step in range(10):
+        coalescer.submit(LightChanged(ADDR, step * 10, step * 0.01), now=step * 0.01)
+    assert [event.level for event in delivered] == [0]
+    assert coalescer.next_deadline() == pytest.approx(0.1)
+
+    coalescer.poll(now=0.05)
+    assert len(delivered) == 1
+
+    coalescer.poll(now=0.1)
+    assert [event.level for event in delivered] == [0, 90]
+    assert coalescer.next_deadline() is None
+
+
+def test_identical_values_are_dropped(coalescer, delivered):
+    coalescer.submit(LightChanged(ADDR, 10, 0.), now=0.)
+    coalescer.submit(LightChanged(ADDR, 10, 0.01), now=0.01)
+    coalescer.submit(LightChanged(ADDR, 20, 0.02), now=0.02)
+    coalescer.submit(LightChanged(ADDR, 10, 0.03), now=0.03)
+    coalescer.poll(now=1.)
+    assert [event.level for event in delivered] == [10]
+
+    coalescer.submit(LightChanged(ADDR, 10, 2.), now=2.)
+    assert len(delivered) == 1
+
+
+def test_addresses_are_independent(coalescer, delivered):
+    coalescer.submit(LightChanged(ADDR, 10, 0.), now=0.)
+    coalescer.submit(LightChanged('[01:01:00:03:03]', 10, 0.), now=0.)
+    assert len(delivered) == 2
+
+
+def test_per_address_window(coalescer, delivered):
+    coalescer.set_window('[1:1:0:3:2]', 0)
+    coalescer.submit(LightChanged(ADDR, 10, 0.), now=0.)
+    coalescer.submit(LightChanged(ADDR, 20, 0.), now=0.)
+    assert len(delivered) == 2
+
+
+def test_buttons_pass_through(coalescer, delivered):
+    for _ in range(3):
+        coalescer.submit(ButtonEvent(HW_BUTTON_PRESSED, '[01:04:10]', 1, 0.), now=0.)
+    assert len(delivered) == 3
+
+
+def test_flush(coalescer, delivered):
+    coalescer.submit(LightChanged(ADDR, 10, 0.), now=0.)
+    coalescer.submit(LightChanged(ADDR, 20, 0.), now=0.01)
+    coalescer.flush()
+    assert [event.level for event in delivered] == [10, 20]
+
+
+def test_state_is_updated_before_coalescing():
+    events = []
+    hw = BaseHomeworks(event_callback=events.append, event_window=10.)
+    hw._processReceivedData('DL, [01:01:00:03:02],  10', 0.)
+    hw._processReceivedData('DL, [01:01:00:03:02],  20', 0.)
+    assert hw.state.get_level(ADDR) == 20
+    assert [event.level for event in events] == [10]
+
+
+def test_pending_led_changes_are_merged(coalescer, delivered):
+    coalescer.submit(LedStateChanged('[01:04:10]', b'\x00\x00\x00', 0., 0b111), now=0.)
+    coalescer.submit(LedStateChanged('[01:04:10]', b'\x01\x00\x00', 0.01, 0b001), now=0.01)
+    coalescer.submit(LedStateChanged('[01:04:10]', b'\x01\x00\x01', 0.02, 0b100), now=0.02)
+    coalescer.poll(now=0.1)
+    assert [(event.leds, event.changed) for event in delivered] == [
+        (b'\x00\x00\x00', 0b111), (b'\x01\x00\x01', 0b101)]
@@ -0,0 +1,84 @@
+import pytest
+
+from pyhomeworks.address import format_address, normalize_address, pack_address
+from pyhomeworks.dispatch import EventDispatcher
+from pyhomeworks.events import (
+    HW_BUTTON_PRESSED, HW_BUTTON_RELEASED, HW_LIGHT_CHANGED, ButtonEvent, LightChanged)
+
+
+@pytest.mark.parametrize('spelling', [
+    '[01:01:00:02:04]', '[1:1:0:2:4]', '01.01.00.02.04', ' [01:01:00:02:04] ', (1, 1, 0, 2, 4)])
+def test_normalize_address(spelling):
+    assert normalize_address(spelling) == (1, 1, 0, 2, 4)
+
+
+def test_pack_and_format_address():
+    assert pack_address('[01:01:00:02:04]') == 0x0101000204
+    assert format_address('[1:1:0:2:4]') == '[01:01:00:02:04]'
+    with pytest.raises(ValueError):
+        normalize_address('[01:xx]')
+
+
+def test_button_reaches_exactly_one_handler():
+    dispatcher = EventDispatcher()
+    calls = []
+    for button in range(1, 25):
+        dispatcher.subscribe(lambda event, button=button: calls.append(button),
+                             '[01:04:10]', HW_BUTTON_PRESSED, button)
+
+    assert dispatcher.dispatch(ButtonEvent(HW_BUTTON_PRESSED, '[1:4:10]', 7, 0.)) == 1
+    assert dispatcher.dispatch(ButtonEvent(HW_BUTTON_RELEASED, '[01:04:10]', 7, 0.)) == 0
+    assert calls == [7]
+
+
+def test_action_and_address_wildcards():
+    dispatcher = EventDispatcher()
+    lights, everything = [], []
+    dispatcher.subscribe(lights.append, '[01:01:00:03:02]', HW_LIGHT_CHANGED)
+    dispatcher.subscribe(everything.append, '[1:1:0:3:2]')
+
+    event = LightChanged('[01:01:00:03:02]', 10, 0.)
+    assert dispatcher.dispatch(event) == 2
+    assert lights == everything == [event]
+    assert dispatcher.dispatch(LightChanged('[01:01:00:03:03]', 10, 0.)) == 0
+
+
+def test_unsubscribe():
+    dispatcher = EventDispatcher()
+    calls = []
+    unsubscribe = dispatcher.subscribe(calls.append, '[01:01:00:03:02]', HW_LIGHT_CHANGED)
+    assert dispatcher.has_subscribers('[1:1:0:3:2]')
+
+    unsubscribe()
+    unsubscribe()
+    assert not dispatcher.has_subscribers('[01:01:00:03:02]')
+    assert dispatcher.dispatch(LightChanged('[01:01:00:03:02]', 10, 0.)) == 0
+    assert calls == []
+
+
+def test_button_requires_action():
+    with pytest.raises(ValueError):
+        EventDispatcher().subscribe(print, '[01:04:10]', button=1)
+
+
+def test_addresses_by_action():
+    dispatcher = EventDispatcher()
+    dispatcher.subscribe(print, '[01:01:00:03:02]', HW_LIGHT_CHANGED)
+    dispatcher.subscribe(print, '[01:01:00:03:03]')
+    dispatcher.subscribe(print, '[01:04:10]', HW_BUTTON_PRESSED, 1)
+    assert sorted(dispatcher.addresses()) == [(1, 1, 0, 3, 2), (1, 1, 0, 3, 3), (1, 4, 10)]
+    assert sorted(dispatcher.addresses(HW_LIGHT_CHANGED)) == [(1, 1, 0, 3, 2), (1, 1, 0, 3, 3)]
+
+
+def test_on_change_follows_subscribed_actions():
+    dispatcher = EventDispatcher()
+    changes = []
+    dispatcher.on_change = lambda: changes.append(dispatcher.actions())
+    first = dispatcher.subscribe(print, '[01:01:00:03:02]', HW_LIGHT_CHANGED)
+    second = dispatcher.subscribe(print, '[01:01:00:03:03]', HW_LIGHT_CHANGED)
+    dispatcher.subscribe(print, '[01:04:10]')
+    assert changes == [{HW_LIGHT_CHANGED}, {HW_LIGHT_CHANGED, None}]
+    first()
+    assert len(changes) == 2
+    second()
+    assert changes[-1] == {None}
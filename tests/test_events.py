@@ -0,0 +1,45 @@
+from pyhomeworks.events import (
+    HW_BUTTON_PRESSED, HW_KEYPAD_LED_CHANGED, HW_LIGHT_CHANGED, ButtonEvent,
+    KeypadEnableChanged, LedStateChanged, LightChanged, legacy_callback)
+from pyhomeworks.pyhomeworks import BaseHomeworks, parse_event
+
+
+def test_parse_light_changed():
+    event = parse_event('DL, [01:01:00:03:02],  42', 1.5)
+    assert event == LightChanged('[01:01:00:03:02]', 42, 1.5)
+    assert event.action == HW_LIGHT_CHANGED
+
+
+def test_parse_button():
+    event = parse_event('KBP, [01:04:10], 3', 2.0)
+    assert isinstance(event, ButtonEvent)
+    assert (event.action, event.address, event.button) == (HW_BUTTON_PRESSED, '[01:04:10]', 3)
+
+
+def test_parse_led_and_enable():
+    assert parse_event('KLS, [01:04:10], 100000000000000000000000', 0.) == \
+        LedStateChanged('[01:04:10]', b'\x01' + bytes(23), 0.)
+    assert parse_event('KES, [01:04:10], disabled', 0.) == KeypadEnableChanged('[01:04:10]', False, 0.)
+
+
+def test_parse_unknown():
+    assert parse_event('Keypad button monitoring enabled', 0.) is None
+
+
+def test_events_have_no_dict():
+    assert not hasattr(LightChanged('[01:01:00:03:02]', 42, 0.), '__dict__')
+
+
+def test_legacy_callback():
+    calls = []
+    legacy_callback(lambda *args: calls.append(args))(LedStateChanged('[01:04:10]', (1, 0), 0.))
+    assert calls == [(HW_KEYPAD_LED_CHANGED, ['[01:04:10]', [1, 0]])]
+
+
+def test_base_dispatches_to_both_callbacks():
+    events, calls = [], []
+    hw = BaseHomeworks(callback=lambda *args: calls.append(args), event_callback=events.append)
+    hw._processReceivedData('DL, [01:01:00:03:02],  42', 3.0)
+    hw._processReceivedData('DL, [01:01:00:03:02],  x', 3.0)
+    assert events == [LightChanged('[01:01:00:03:02]', 42, 3.0)]
+    assert calls == [(HW_LIGHT_CHANGED, ['[01:01:00:03:02]', 42])]
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+from pyhomeworks.events import HW_BUTTON_PRESSED, ButtonEvent, LightChanged
+from pyhomeworks.executor import (
+    OVERFLOW_BLOCK, OVERFLOW_COALESCE, OVERFLOW_DROP_OLDEST, DispatchExecutor)
+from pyhomeworks.pyhomeworks import BaseHomeworks
+
+
+def light(address, level):
+    return LightChanged(address, level, 0.)
+
+
+class Gate:
+    """Handler that blocks until opened and records events."""
+
+    def __init__(self):
+        self.opened = threading.Event()
+        self.events = []
+
+    def __call__(self, event):
+        self.opened.wait(2)
+        self.events.append(event)
+
+
+def test_handlers_run_off_the_reader_thread():
+    threads = []
+    executor = DispatchExecutor()
+    hw = BaseHomeworks(event_callback=lambda event: threads.append(threading.current_thread()),
+                       executor=executor)
+    hw._processReceivedData('DL, [01:01:00:03:02],  42', 0.)
+    assert executor.join(1)
+    assert threads and threads[0] is not threading.current_thread()
+    assert hw.metrics.snapshot()['dispatch_queue_depth'] == 0
+    executor.close()
+
+
+def test_per_address_order_with_many_workers():
+    seen = {}
+    lock = threading.Lock()
+
+    def handler(event):
+        time.sleep(0.0001 * (event.level % 3))
+        with lock:
+            seen.setdefault(event.address, []).append(event.level)
+
+    executor = DispatchExecutor(workers=4)
+    executor.bind(handler)
+    for level in range(100):
+        for address in range(8):
+            executor.submit(light('[01:01:00:03:%02d]' % address, level))
+    assert executor.join(5)
+    executor.close()
+    assert len(seen) == 8
+    assert all(levels == list(range(100)) for levels in seen.values())
+
+
+def test_drop_oldest():
+    gate = Gate()
+    executor = DispatchExecutor(maxsize=2, overflow=OVERFLOW_DROP_OLDEST)
+    executor.bind(gate)
+    executor.submit(light('[1:1:0:3:1]', 0))
+    time.sleep(0.05)  # the worker is now waiting in the handler
+    for level in range(1, 5):
+        executor.submit(light('[1:1:0:3:1]', level))
+    assert executor.dropped == 2
+    gate.opened.set()
+    assert executor.join(1)
+    executor.close()
+    assert [event.level for event in gate.events] == [0, 3, 4]
+
+
+def test_coalesce_latest_per_address():
+    gate = Gate()
+    executor = DispatchExecutor(maxsize=3, overflow=OVERFLOW_COALESCE)
+    executor.bind(gate)
+    executor.submit(light('[1:1:0:3:1]', 0))
+    time.sleep(0.05)
+    executor.submit(light('[1:1:0:3:1]', 1))
+    executor.submit(ButtonEvent(HW_BUTTON_PRESSED, '[1:4:10]', 1, 0.))
+    executor.submit(light('[1:1:0:3:2]', 1))
+    executor.submit(light('[1:1:0:3:1]', 2))
+    executor.submit(light('[1:1:0:3:2]', 2))
+    assert executor.coalesced == 2 and executor.dropped == 0
+    gate.opened.set()
+    assert executor.join(1)
+    executor.close()
+    assert [(type(event).__name__, getattr(event, 'level', None)) for event in gate.events] == [
+        ('LightChanged', 0), ('LightChanged', 2), ('ButtonEvent', None), ('LightChanged', 2)]
+
+
+def test_block_waits_for_space():
+    gate = Gate()
+    executor = DispatchExecutor(maxsize=1, overflow=OVERFLOW_BLOCK)
+    executor.bind(gate)
+    executor.submit(light('[1:1:0:3:1]', 0))
+    time.sleep(0.05)
+    executor.submit(light('[1:1:0:3:1]', 1))
+    producer = threading.Thread(target=executor.submit, args=(light('[1:1:0:3:1]', 2),))
+    producer.start()
+    producer.join(0.1)
+    assert producer.is_alive()
+    gate.opened.set()
+    producer.join(1)
+    assert executor.join(1)
+    executor.close()
+    assert [event.level for event in gate.events] == [0, 1, 2]
+
+
+def test_handler_errors_do_not_stop_the_worker():
+    calls = []
+
+    def handler(event):
+        calls.append(event.level)
+        raise RuntimeError("boom")
+
+    executor = DispatchExecutor()
+    executor.bind(handler)
+    executor.submit(light('[1:1:0:3:1]', 1))
+    executor.submit(light('[1:1:0:3:1]', 2))
+    assert executor.join(1)
+    executor.close()
+    assert calls == [1, 2]
+
+
+def test_submit_after_close_drops():
+    events = []
+    executor = DispatchExecutor()
+    executor.bind(events.append)
+    executor.submit(light('[01]', 1))
+    executor.close()
+    threads = threading.active_count()
+    executor.submit(light('[01]', 2))
+    assert threading.active_count() == threads
+    assert events == [light('[01]', 1)]
+    assert executor.dropped == 1
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        DispatchExecutor(overflow='spill')
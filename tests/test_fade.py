@@ -0,0 +1,42 @@
+from pyhomeworks.fade import MAX_FADE_ADDRESSES, encode_fades, group_fades
+
+
+def test_groups_by_parameters_in_order():
+    groups = group_fades([
+        ('[01:01:00:02:04]', 0, 2, 0),
+        ('[01:01:00:02:05]', 100, 2, 0),
+        ('1.1.0.2.6', 0, 2, 0),
+    ])
+    assert groups == [((0, 2, 0), [(1, 1, 0, 2, 4), (1, 1, 0, 2, 6)]),
+                      ((100, 2, 0), [(1, 1, 0, 2, 5)])]
+
+
+def test_last_fade_of_an_address_wins():
+    groups = group_fades([
+        ('[01:01:00:02:04]', 0, 2, 0),
+        ('[01:01:00:02:05]', 0, 2, 0),
+        ('[1:1:0:2:4]', 50, 1, 0),
+        ('[01:01:00:02:05]', 0, 2, 0),
+    ])
+    assert groups == [((50, 1, 0), [(1, 1, 0, 2, 4)]), ((0, 2, 0), [(1, 1, 0, 2, 5)])]
+
+
+def test_encode_shares_commands():
+    data = encode_fades([
+        ('[01:01:00:02:04]', 0, 2, 0),
+        ('[01:01:00:02:05]', 0, 2., 0),
+        ('[01:01:00:02:06]', 75.6, 2, 1),
+    ])
+    assert data == (b'FADEDIM, 0, 2, 0, [1:1:0:2:4], [1:1:0:2:5]\r\n'
+                    b'FADEDIM, 75, 2, 1, [1:1:0:2:6]\r\n')
+
+
+def test_encode_splits_large_groups():
+    addrs = ['[1:1:0:%d:%d]' % (i // 4, 1 + i % 4) for i in range(MAX_FADE_ADDRESSES * 2 + 1)]
+    lines = encode_fades((addr, 0, 1, 0) for addr in addrs).split(b'\r\n')[:-1]
+    assert len(lines) == 3
+    assert [line.count(b'[') for line in lines] == [MAX_FADE_ADDRESSES, MAX_FADE_ADDRESSES, 1]
+
+
+def test_encode_empty_batch():
+    assert encode_fades([]) == b''
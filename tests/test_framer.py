@@ -0,0 +1,78 @@
+import socket
+
+from pyhomeworks.framer import FRAME_LINE, FRAME_LOGIN, FRAME_PROMPT, Framer
+
+
+def frames(framer, data):
+    framer.feed(data)
+    return list(framer.frames())
+
+
+def test_lines():
+    framer = Framer()
+    assert frames(framer, b'DL, [01:01:00:03:01],   0\r\nDL, [01:01:00:03:02],   1\r\n') == [
+        (FRAME_LINE, b'DL, [01:01:00:03:01],   0'),
+        (FRAME_LINE, b'DL, [01:01:00:03:02],   1'),
+    ]
+    assert len(framer) == 0
+
+
+def test_chunked_line():
+    framer = Framer()
+    assert frames(framer, b'DL, [') == []
+    assert frames(framer, b'01:01:00:03:02],   0\r') == []
+    assert frames(framer, b'\n') == [(FRAME_LINE, b'DL, [01:01:00:03:02],   0')]
+
+
+def test_prompts_and_login_at_start():
+    framer = Framer()
+    assert frames(framer, b'LOGIN: ') == [(FRAME_LOGIN, b'LOGIN: ')]
+    assert frames(framer, b'L232> LNET> ') == [(FRAME_PROMPT, b'L232> '), (FRAME_PROMPT, b'LNET> ')]
+
+
+def test_prompt_after_line():
+    framer = Framer()
+    assert frames(framer, b'Dimmer level monitoring enabled\r\nLNET> KLMON') == [
+        (FRAME_LINE, b'Dimmer level monitoring enabled'),
+        (FRAME_PROMPT, b'LNET> '),
+    ]
+    assert frames(framer, b'\r\n') == [(FRAME_LINE, b'KLMON')]
+
+
+def test_prompt_inside_partial_line():
+    framer = Framer()
+    assert frames(framer, b'DL, [01:0LNET> 1:00:03:02],   0\r\n') == [
+        (FRAME_PROMPT, b'LNET> '),
+        (FRAME_LINE, b'DL, [01:01:00:03:02],   0'),
+    ]
+
+
+def test_split_prompt():
+    framer = Framer()
+    assert frames(framer, b'\r\nLN') == [(FRAME_LINE, b'')]
+    assert frames(framer, b'ET> ') == [(FRAME_PROMPT, b'LNET> ')]
+
+
+def test_buffer_grows_for_long_burst():
+    framer = Framer(size=1024)
+    burst = b''.join(b'DL, [01:01:00:%02d:01],  50\r\n' % (i % 100) for i in range(1000))
+    lines = frames(framer, burst)
+    assert len(lines) == 1000
+    assert lines[-1] == (FRAME_LINE, b'DL, [01:01:00:99:01],  50')
+
+
+def test_recv_into_adapts_read_size():
+    framer = Framer()
+    reader, writer = socket.socketpair()
+    try:
+        writer.sendall(b'x' * (Framer.MIN_READ_SIZE * 4))
+        assert framer.recv_into(reader) == Framer.MIN_READ_SIZE
+        assert framer.read_size == Framer.MIN_READ_SIZE * 2
+
+        writer.sendall(b'\r\n')
+        framer.recv_into(reader)
+        framer.recv_into(reader)
+        assert list(framer.frames()) == [(FRAME_LINE, b'x' * (Framer.MIN_READ_SIZE * 4))]
+    finally:
+        reader.close()
+        writer.close()
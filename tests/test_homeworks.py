@@ -1,132 +1,311 @@
 import logging
-import queue
-from socket import socket
-from time import sleep
-from unittest.mock import Mock, call
+import socket
+import time
+from threading import Thread
+from unittest.mock import call
 
 import pytest
 
 from pyhomeworks import Homeworks
+from pyhomeworks.pyhomeworks import HW_LIGHT_CHANGED, BaseHomeworks
 from .device import HomeworksDevice
 
 logging.basicConfig(level=logging.DEBUG)
 
+SUBSCRIBE = b'PROMPTOFF\r\nKBMON\r\nGSMON\r\nDLMON\r\nKLMON\r\n'
+
+
+class Link:
+    """Socket pair connecting the library to a HomeworksDevice."""
 
-class Buffer:
     def __init__(self):
-        self._queue = queue.Queue()
-        self._buffer = b''
+        self.client, self.server = socket.socketpair()
+        self._reader = None
+
+    def attach(self, device: HomeworksDevice):
+        self._reader = Thread(target=self._pump, args=(device,), daemon=True)
+        self._reader.start()
 
-    def recv(self, bytes_len):
-        if len(self._buffer) < bytes_len:
+    def _pump(self, device):
+        while True:
             try:
-                data = self._queue.get_nowait()
-                if len(data):
-                    self._buffer += data
-            except queue.Empty:
-                pass
+                data = self.server.recv(4096)
+            except OSError:
+                return
+            if not data:
+                return
+            device.receive(data)
+
+    def send(self, data: bytes):
+        self.server.sendall(data)
+
+    def close(self):
+        self.server.close()
+        if self._reader is not None:
+            self._reader.join(1)
 
-        out = self._buffer[:bytes_len]
-        self._buffer = self._buffer[len(out):]
-        return out
 
-    def put(self, data: bytes):
-        self._queue.put_nowait(data)
+def received(device) -> bytes:
+    return b''.join(args[0] for args, _ in device.receive.call_args_list)
+
+
+def wait_for(predicate, timeout=2.):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def link():
+    link = Link()
+    yield link
+    link.close()
 
 
 @pytest.fixture
-def hw_device(in_buffer, mocker):
-    device = HomeworksDevice(on_send=in_buffer.put)
+def hw_device(link, mocker):
+    device = HomeworksDevice(on_send=link.send)
     mocker.spy(device, 'receive')
     mocker.spy(device, 'send')
-    return device
+    link.attach(device)
+    device.start()
+    yield device
+    device.stop()
+    device.join(1)
 
 
-@pytest.fixture
-def in_buffer():
-    return Buffer()
+@pytest.fixture()
+def connect(mocker, link):
+    return mocker.patch("pyhomeworks.pyhomeworks.start_connection", return_value=link.client)
 
 
 @pytest.fixture()
-def lib(mocker, socket_mock):
-    mocker.patch("socket.create_connection").return_value = socket_mock
-    mocker.patch("select.select").return_value = ([1], 0, 0)
+def lib(connect):
+    hw = Homeworks('127.0.0.1', 4003, dummy_callback, autostart=False)
+    yield hw
+    hw.close()
+    hw.join(1)
 
-    return Homeworks('127.0.0.1', 4003, dummy_callback, autostart=False)
 
+def dummy_callback(data):
+    print(data)
 
-@pytest.fixture()
-def lib_with_login(mocker, socket_mock):
-    mocker.patch("socket.create_connection").return_value = socket_mock
-    mocker.patch("select.select").return_value = ([1], 0, 0)
 
-    return Homeworks('127.0.0.1', 4003, dummy_callback, login="user,password", autostart=False)
+def test_connect_without_login(hw_device, lib):
+    lib.start()
+    wait_for(lambda: SUBSCRIBE in received(hw_device))
+    assert_subscribe(hw_device)
 
 
-@pytest.fixture
-def socket_mock(in_buffer, hw_device: HomeworksDevice):
-    sm = Mock(spec_set=socket)
-    sm.fileno.return_value = 0
-    sm.recv.side_effect = in_buffer.recv
-    sm.send.side_effect = hw_device.receive
+def assert_subscribe(hw_device):
+    # Subscription commands are coalesced into a single write.
+    assert SUBSCRIBE in received(hw_device)
+    wait_for(lambda: call(b'Keypad led monitoring enabled') in hw_device.send.call_args_list)
+    hw_device.send.assert_any_call(b'Keypad button monitoring enabled')
+    hw_device.send.assert_any_call(b'GrafikEye scene monitoring enabled')
+    hw_device.send.assert_any_call(b'Dimmer level monitoring enabled')
 
-    return sm
 
+def test_connect_with_login(link, mocker, connect):
+    device = HomeworksDevice(on_send=link.send)
+    device.require_login = 'user,password'
+    mocker.spy(device, 'receive')
+    mocker.spy(device, 'send')
+    link.attach(device)
+    lib = Homeworks('127.0.0.1', 4003, dummy_callback, login="user,password", autostart=False)
+    try:
+        device.start()
+        lib.start()
+        wait_for(lambda: SUBSCRIBE in received(device))
+        assert_login(device)
+        assert_subscribe(device)
+    finally:
+        lib.close()
+        lib.join(1)
+        device.stop()
+        device.join(1)
 
-def dummy_callback(data):
-    print(data)
 
+def assert_login(hw_device):
+    assert hw_device.send.call_args_list[0] == call(b'LOGIN: ', line_ending=False)
+    assert hw_device.receive.call_args_list[0] == call(b'user,password\r\n')
+
+
+def test_subscribe_waits_for_login_prompt_delay(hw_device, lib):
+    started = time.monotonic()
+    lib.start()
+    wait_for(lambda: SUBSCRIBE in received(hw_device))
+    assert time.monotonic() - started >= lib.LOGIN_PROMPT_WAIT_TIME
+
+
+def test_close_is_immediate(hw_device, lib):
+    lib.start()
+    wait_for(lambda: SUBSCRIBE in received(hw_device))
+    started = time.monotonic()
+    lib.close()
+    lib.join(1)
+    assert not lib.is_alive()
+    assert time.monotonic() - started < 0.5
 
-def test_connect_without_login(hw_device, lib, socket_mock):
+
+def test_close_before_start(connect):
+    hw = Homeworks('127.0.0.1', 4003, dummy_callback, autostart=False)
+    hw.close()
+    assert not hw.is_alive()
+
+
+def test_events_and_eof(link, connect):
+    events = []
+    lib = Homeworks('127.0.0.1', 4003, lambda *args: events.append(args), autostart=False)
+    lib._backoff.initial = 60.
     try:
-        hw_device.start()
         lib.start()
+        link.send(b'DL, [01:01:00:03:02],  42\r\n')
+        wait_for(lambda: events)
+        assert events == [(HW_LIGHT_CHANGED, ['[01:01:00:03:02]', 42])]
+        link.server.close()
+        wait_for(lambda: lib._socket is None)
+        assert lib.is_alive()
+    finally:
+        lib.close()
+        lib.join(1)
+    assert not lib.is_alive()
+
 
-        sleep(0.2)
-    except Exception:
-        raise
+def test_handler_error_keeps_reading(link, connect):
+    levels = []
 
+    def callback(msg_type, values):
+        levels.append(values[1])
+        raise RuntimeError('handler failed')
+
+    lib = Homeworks('127.0.0.1', 4003, callback, autostart=False)
+    try:
+        lib.start()
+        link.send(b'DL, [01:01:00:03:02],  42\r\n')
+        wait_for(lambda: levels == [42])
+        link.send(b'DL, [01:01:00:03:02],  43\r\n')
+        wait_for(lambda: levels == [42, 43])
+        assert lib.is_alive()
+        assert lib._socket is not None
     finally:
         lib.close()
         lib.join(1)
-        hw_device.stop()
-        hw_device.join(1)
 
-    assert_subscribe(hw_device, socket_mock)
 
+def test_reconnects_with_backoff_and_resyncs(mocker):
+    links = [Link(), Link()]
+    connect = mocker.patch("pyhomeworks.pyhomeworks.start_connection",
+                           side_effect=[ConnectionRefusedError("refused"), links[0].client, links[1].client])
+    levels = []
+    lib = Homeworks('127.0.0.1', 4003, autostart=False)
+    lib._backoff.initial = 0.01
+    lib.dispatcher.subscribe(lambda event: levels.append(event.level), '[01:01:00:03:02]', HW_LIGHT_CHANGED)
+    try:
+        lib.start()
+        wait_for(lambda: lib._subscribed)
+        links[0].server.close()
+        wait_for(lambda: connect.call_count == 3 and lib._subscribed)
+        data = b''
+        while b'RDL' not in data:
+            data += links[1].server.recv(4096)
+        assert data.endswith(b'RDL, [01:01:00:03:02]\r\n')
+        links[1].send(b'DL, [01:01:00:03:02],  42\r\n')
+        wait_for(lambda: levels == [42])
+        assert lib.reconnects == 1
+    finally:
+        lib.close()
+        lib.join(1)
+        for link in links:
+            link.close()
 
-def assert_subscribe(hw_device, socket_mock):
-    socket_mock.send.assert_any_call(b'PROMPTOFF\r\n')
-    socket_mock.send.assert_any_call(b'KBMON\r\n')
-    socket_mock.send.assert_any_call(b'GSMON\r\n')
-    socket_mock.send.assert_any_call(b'DLMON\r\n')
-    socket_mock.send.assert_any_call(b'KLMON\r\n')
-    hw_device.send.assert_any_call(b'Keypad button monitoring enabled')
-    hw_device.send.assert_any_call(b'GrafikEye scene monitoring enabled')
-    hw_device.send.assert_any_call(b'Dimmer level monitoring enabled')
-    hw_device.send.assert_any_call(b'Keypad led monitoring enabled')
 
+@pytest.mark.parametrize('error', [OSError(113, 'No route to host'), socket.gaierror(-2, 'Name or service not known')])
+def test_keeps_retrying_on_os_errors(mocker, link, error):
+    connect = mocker.patch("pyhomeworks.pyhomeworks.start_connection", side_effect=[error, error, link.client])
+    lib = Homeworks('127.0.0.1', 4003, autostart=False)
+    lib._backoff.initial = 0.01
+    try:
+        lib.start()
+        wait_for(lambda: lib._subscribed)
+        assert connect.call_count == 3
+        assert lib.is_alive()
+    finally:
+        lib.close()
+        lib.join(1)
 
-def test_connect_with_login(hw_device, lib_with_login, socket_mock):
-    hw_device.require_login = 'user,password'
+
+def stalled_socket():
+    """A socket that never turns writable, like a connect that hangs."""
+    client, server = socket.socketpair()
+    client.setblocking(False)
     try:
-        hw_device.start()
-        lib_with_login.start()
+        while True:
+            client.send(b'\0' * 65536)
+    except BlockingIOError:
+        pass
+    return client, server
 
-        sleep(0.2)
-    except Exception:
-        raise
 
+def test_close_during_stalled_connect(mocker):
+    client, server = stalled_socket()
+    mocker.patch("pyhomeworks.pyhomeworks.start_connection", return_value=client)
+    lib = Homeworks('127.0.0.1', 4003, autostart=False)
+    try:
+        lib.start()
+        wait_for(lambda: lib._connecting is not None)
+        started = time.monotonic()
+        lib.close()
+        lib.join(1)
+        assert not lib.is_alive()
+        assert time.monotonic() - started < 0.5
+        assert client.fileno() == -1
     finally:
-        lib_with_login.close()
-        lib_with_login.join(1)
-        hw_device.stop()
-        hw_device.join(1)
+        server.close()
 
-    assert_login(hw_device)
-    assert_subscribe(hw_device, socket_mock)
+
+def test_connect_timeout_retries(mocker, link):
+    client, server = stalled_socket()
+    connect = mocker.patch("pyhomeworks.pyhomeworks.start_connection", side_effect=[client, link.client])
+    lib = Homeworks('127.0.0.1', 4003, autostart=False)
+    lib.CONNECT_TIMEOUT = 0.05
+    lib._backoff.initial = 0.01
+    try:
+        lib.start()
+        wait_for(lambda: lib._subscribed)
+        assert connect.call_count == 2
+        assert client.fileno() == -1
+    finally:
+        lib.close()
+        lib.join(1)
+        server.close()
 
 
-def assert_login(hw_device):
-    assert hw_device.send.call_args_list[0] == call(b'LOGIN: ', line_ending=False)
-    assert hw_device.receive.call_args_list[0] == call(b'user,password\r\n')
\ No newline at end of file
+def test_connects_without_blocking():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    lib = Homeworks('127.0.0.1', listener.getsockname()[1], autostart=False)
+    try:
+        lib.start()
+        conn, _ = listener.accept()
+        data = b''
+        while b'DLMON' not in data:
+            data += conn.recv(4096)
+        conn.close()
+    finally:
+        lib.close()
+        lib.join(1)
+        listener.close()
+
+
+def test_resync_covers_known_dimmers_with_callbacks():
+    sent = []
+    hw = BaseHomeworks(event_callback=lambda event: None)
+    hw._send = lambda command, priority=None: sent.append(command)
+    hw._processReceivedData('DL, [01:01:00:03:02],  42')
+    hw._processReceivedData('DL, [01:01:00:03:03],  0')
+    hw._processReceivedData('KLS, [01:04:10], 1')
+    hw._resync()
+    assert sent == ['RDL, [01:01:00:03:02]', 'RDL, [01:01:00:03:03]']
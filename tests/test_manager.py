@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+import pytest
+
+from pyhomeworks import HomeworksManager, SyncHomeworksManager
+from pyhomeworks.events import HW_LIGHT_CHANGED, LightChanged
+
+from .conftest import FakeController
+
+
+@pytest.mark.asyncio
+async def test_events_carry_controller_id(controller):
+    events = asyncio.Queue()
+    manager = HomeworksManager(lambda cid, event: events.put_nowait((cid, event)))
+    await manager.add_controller('a', '127.0.0.1', controller.port)
+    await manager.add_controller('b', '127.0.0.1', controller.port)
+    try:
+        assert manager.controller_ids == ['a', 'b']
+        assert manager['a'].monitored_actions() is None
+        await manager.request_dimmer_level('b', '[01:01:00:03:02]')
+        cid, event = await asyncio.wait_for(events.get(), 1)
+        assert cid == 'b'
+        assert isinstance(event, LightChanged) and event.level == 42
+        assert manager.get_level('b', '1:1:0:3:2') == 42
+        assert manager.get_level('a', '1:1:0:3:2') is None
+        text = manager.prometheus_text()
+        assert 'homeworks_messages_total{controller="b",action="DL"} 1' in text
+        assert 'homeworks_messages_total{controller="a",action="DL"} 0' in text
+    finally:
+        await manager.close()
+    assert len(manager) == 0
+
+
+@pytest.mark.asyncio
+async def test_duplicate_and_failed_controllers(controller):
+    manager = HomeworksManager()
+    await manager.add_controller('a', '127.0.0.1', controller.port)
+    try:
+        assert manager['a'].monitored_actions() == {HW_LIGHT_CHANGED}
+        with pytest.raises(ValueError):
+            await manager.add_controller('a', '127.0.0.1', controller.port)
+        with pytest.raises(ConnectionError):
+            await manager.add_controller('b', '127.0.0.1', 1)
+        assert 'b' not in manager
+    finally:
+        await manager.remove_controller('a')
+    assert 'a' not in manager
+
+
+def test_sync_facade():
+    received = []
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(loop.create_server(
+        lambda: FakeController(received), '127.0.0.1', 0))
+    port = server.sockets[0].getsockname()[1]
+    server_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    server_thread.start()
+
+    pressed = threading.Event()
+    manager = SyncHomeworksManager()
+    try:
+        for cid in range(3):
+            manager.add_controller(cid, '127.0.0.1', port)
+        unsubscribe = manager.subscribe(2, lambda event: pressed.set(), '[01:01:00:03:02]')
+        assert manager.query_levels(1, ['[01:01:00:03:01]']) == {'[01:01:00:03:01]': 42}
+        manager.request_dimmer_level(2, '[01:01:00:03:02]').result(1)
+        assert pressed.wait(1)
+        unsubscribe()
+        assert len(manager.manager[2].dispatcher) == 0
+        manager.fade_dim(0, 50, 1, 0, '[01:01:00:03:03]').result(1)
+        # Answered after the fade on the same connection, so the fade has arrived.
+        manager.query_levels(0, ['[01:01:00:03:03]'])
+        assert threading.active_count() <= 3
+    finally:
+        manager.close()
+        loop.call_soon_threadsafe(server.close)
+        loop.call_soon_threadsafe(loop.stop)
+        server_thread.join(1)
+    assert b'FADEDIM, 50, 1, 0, [01:01:00:03:03]' in received
@@ -0,0 +1,62 @@
+import pytest
+
+from pyhomeworks import AsyncHomeworks
+from pyhomeworks.metrics import Histogram, Metrics, prometheus_text
+from pyhomeworks.pyhomeworks import BaseHomeworks
+
+
+def test_histogram_buckets():
+    histogram = Histogram((0.1, 1.))
+    for value in (0.05, 0.1, 0.5, 5.):
+        histogram.observe(value)
+    assert histogram.buckets() == [(0.1, 2), (1., 3), (float('inf'), 4)]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(5.65)
+
+
+def test_parse_pipeline_counts():
+    hw = BaseHomeworks(event_callback=lambda event: None)
+    for line in ('DL, [01:01:00:03:02],  42', 'KBP, [01:04:10],  1', 'KBP, [01:04:10],  x',
+                 'DL, [01:01:00:03:02],  1000', 'Keypad button monitoring enabled'):
+        hw._processReceivedData(line, 0.)
+
+    snapshot = hw.metrics.snapshot()
+    assert snapshot['messages']['DL'] == 1
+    assert snapshot['messages']['KBP'] == 1
+    assert snapshot['messages']['SVBP'] == 0
+    assert snapshot['parse_failures'] == 2
+    assert snapshot['unknown_messages'] == 1
+    assert snapshot['callback_duration']['count'] == 2
+    assert hw.reconnects == 0
+
+
+def test_prometheus_text():
+    metrics = Metrics()
+    metrics.bytes_in = 10
+    metrics.messages['DL'] = 3
+    metrics.add_gauge('read_queue_depth', lambda: 7)
+    metrics.callback_duration.observe(0.002)
+
+    text = prometheus_text([({'controller': 'a'}, metrics), ({'controller': 'b'}, Metrics())])
+    lines = text.splitlines()
+    assert lines.count('# TYPE homeworks_bytes_in_total counter') == 1
+    assert 'homeworks_bytes_in_total{controller="a"} 10' in lines
+    assert 'homeworks_bytes_in_total{controller="b"} 0' in lines
+    assert 'homeworks_messages_total{controller="a",action="DL"} 3' in lines
+    assert 'homeworks_read_queue_depth{controller="a"} 7' in lines
+    assert 'homeworks_callback_duration_seconds_bucket{controller="a",le="0.001"} 0' in lines
+    assert 'homeworks_callback_duration_seconds_bucket{controller="a",le="0.005"} 1' in lines
+    assert 'homeworks_callback_duration_seconds_bucket{controller="a",le="+Inf"} 1' in lines
+    assert 'homeworks_callback_duration_seconds_count{controller="a"} 1' in lines
+    assert Metrics().prometheus_text().startswith('# HELP homeworks_bytes_in_total')
+
+
+@pytest.mark.asyncio
+async def test_connection_bytes_and_gauges(controller):
+    async with AsyncHomeworks('127.0.0.1', controller.port) as hw:
+        assert await hw.query_levels(['[01:01:00:03:02]']) == {'[01:01:00:03:02]': 42}
+        snapshot = hw.metrics.snapshot()
+    assert snapshot['bytes_out'] == len(b'PROMPTOFF\r\nDLMON\r\nRDL, [01:01:00:03:02]\r\n')
+    assert snapshot['bytes_in'] == len(b'LNET> DL, [01:01:00:03:02],  42\r\n')
+    assert snapshot['read_queue_depth'] == 0
+    assert snapshot['outgoing_queue_depth'] == 0
@@ -0,0 +1,38 @@
+import pytest
+
+from pyhomeworks.events import HW_BUTTON_RELEASED, ButtonEvent, LedStateChanged, LightChanged
+from pyhomeworks.pyhomeworks import ACTIONS, LINE_PARSER, parse_event
+
+
+def test_parses_bytes_and_memoryview():
+    line = b'DL, [01:01:00:03:02],  42'
+    assert LINE_PARSER.parse(line, 1.) == LightChanged('[01:01:00:03:02]', 42, 1.)
+    assert LINE_PARSER.parse(memoryview(bytearray(line)), 1.) == LightChanged('[01:01:00:03:02]', 42, 1.)
+
+
+def test_every_action_has_an_entry():
+    for token in ACTIONS:
+        assert LINE_PARSER.parse(b'%s, [01:04:10], 1' % token.encode(), 0.) is not None
+
+
+def test_button_and_leds():
+    assert LINE_PARSER.parse(b'SVBR, [01:04:10],  7', 0.) == ButtonEvent(HW_BUTTON_RELEASED, '[01:04:10]', 7, 0.)
+    assert LINE_PARSER.parse(b'KLS, [01:04:10], 0123', 0.) == LedStateChanged('[01:04:10]', b'\x00\x01\x02\x03', 0.)
+
+
+@pytest.mark.parametrize('line', [b'KLS, [01:04:10], 01x', b'DL, [01:01:00:03:02],  x',
+                                  b'KBP, [01:04:10], ', b'DL, [01:01:00:\xff],  1',
+                                  b'DL, [01:01:00:03:02],  1000', b'DL, [01:01:00:03:02], -1'])
+def test_malformed_arguments_raise(line):
+    with pytest.raises(ValueError):
+        LINE_PARSER.parse(line, 0.)
+
+
+@pytest.mark.parametrize('line', [b'Dimmer level monitoring enabled', b'DL, [01:01:00:03:02]',
+                                  b'DL, [01:01:00:03:02], 1, 2', b'DLX, [01:01:00:03:02], 1', b''])
+def test_unhandled_lines(line):
+    assert LINE_PARSER.parse(line, 0.) is None
+
+
+def test_parse_event_matches_byte_parser():
+    assert parse_event('KES, [01:04:10], enabled', 0.) == LINE_PARSER.parse(b'KES, [01:04:10], enabled', 0.)
@@ -0,0 +1,60 @@
+import logging
+import time
+
+from pyhomeworks.events import HW_LIGHT_CHANGED
+from pyhomeworks.profiling import CallbackTimings, SlowCallbackLogger, SlowestDispatches
+from pyhomeworks.pyhomeworks import BaseHomeworks
+
+
+def slow_handler(event):
+    time.sleep(0.02)
+
+
+def test_hooks_time_each_handler():
+    calls = []
+    hw = BaseHomeworks(event_callback=lambda event: calls.append('listener'))
+    hw.dispatcher.subscribe(lambda event: calls.append('handler'), '[01:01:00:03:02]', HW_LIGHT_CHANGED)
+    timed = []
+    remove = hw.add_dispatch_hook(lambda event, handler, duration: timed.append((event.level, duration)))
+
+    hw._processReceivedData('DL, [01:01:00:03:02],  42', 0.)
+    assert calls == ['handler', 'listener']
+    assert [level for level, _ in timed] == [42, 42]
+
+    remove()
+    hw._processReceivedData('DL, [01:01:00:03:02],  43', 0.)
+    assert len(timed) == 2
+    assert len(calls) == 4
+
+
+def test_slow_callback_warning(caplog):
+    hw = BaseHomeworks(event_callback=slow_handler)
+    hw.add_dispatch_hook(SlowCallbackLogger(threshold=0.01))
+    with caplog.at_level(logging.WARNING, logger='pyhomeworks.profiling'):
+        hw._processReceivedData('DL, [1:1:0:3:2],  42', 0.)
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert 'slow_handler' in message and 'LightChanged [01:01:00:03:02]' in message
+
+
+def test_timings_and_slowest():
+    hw = BaseHomeworks(event_callback=lambda event: None)
+    timings = CallbackTimings()
+    slowest = SlowestDispatches(2)
+    hw.add_dispatch_hook(timings)
+    hw.add_dispatch_hook(slowest)
+    hw.dispatcher.subscribe(slow_handler, '[01:01:00:03:02]')
+    for line in ('DL, [01:01:00:03:02],  1', 'DL, [1:1:0:3:2],  2', 'DL, [01:01:00:03:03],  3',
+                 'KBP, [01:04:10],  1'):
+        hw._processReceivedData(line, 0.)
+
+    report = timings.report()
+    assert list(report)[0] == ('LightChanged', '[01:01:00:03:02]')
+    assert report[('LightChanged', '[01:01:00:03:02]')].count == 4
+    assert report[('LightChanged', '[01:01:00:03:02]')].total >= 0.04
+    assert report[('ButtonEvent', '[01:04:10]')].count == 1
+
+    samples = slowest.samples()
+    assert len(samples) == 2
+    assert all(sample.handler.endswith('slow_handler') for sample in samples)
+    assert samples[0].duration >= samples[1].duration
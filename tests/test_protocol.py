@@ -89,7 +89,7 @@ def test_ready_with_an_event(protocol):
     protocol.data_received(b'DL, [01:01:00:03:02],   0\r\n')
     assert protocol.ready_future.result() is True
 
-    assert protocol.read_queue.get_nowait() == 'DL, [01:01:00:03:02],   0'
+    assert protocol.read_queue.get_nowait().payload == 'DL, [01:01:00:03:02],   0'
     with pytest.raises(asyncio.QueueEmpty):
         protocol.read_queue.get_nowait()
 
@@ -97,7 +97,7 @@ def test_ready_with_an_event(protocol):
 def test_read_queue_extra_lines(protocol):
     protocol.data_received(b'\r\n\r\n\r\nDL, [01:01:00:03:02],   0\r\n\r\n\r\n')
 
-    assert protocol.read_queue.get_nowait() == 'DL, [01:01:00:03:02],   0'
+    assert protocol.read_queue.get_nowait().payload == 'DL, [01:01:00:03:02],   0'
     with pytest.raises(asyncio.QueueEmpty):
         protocol.read_queue.get_nowait()
 
@@ -107,7 +107,7 @@ def test_receive_chunked(protocol):
     protocol.data_received(b'01:01:00:03:02')
     protocol.data_received(b'],   0\r\n')
 
-    assert protocol.read_queue.get_nowait() == 'DL, [01:01:00:03:02],   0'
+    assert protocol.read_queue.get_nowait().payload == 'DL, [01:01:00:03:02],   0'
     with pytest.raises(asyncio.QueueEmpty):
         protocol.read_queue.get_nowait()
 
@@ -116,8 +116,16 @@ def test_receive_multiple(protocol):
     protocol.data_received(b'DL, [01:01:00:03:01],   0\r\n')
     protocol.data_received(b'DL, [01:01:00:03:02],   1\r\n')
 
-    assert protocol.read_queue.get_nowait() == 'DL, [01:01:00:03:01],   0'
-    assert protocol.read_queue.get_nowait() == 'DL, [01:01:00:03:02],   1'
+    assert protocol.read_queue.get_nowait().payload == 'DL, [01:01:00:03:01],   0'
+    assert protocol.read_queue.get_nowait().payload == 'DL, [01:01:00:03:02],   1'
+    with pytest.raises(asyncio.QueueEmpty):
+        protocol.read_queue.get_nowait()
+
+
+def test_undecodable_line_is_skipped(protocol):
+    protocol.data_received(b'\xff\xfe\r\nDL, [01:01:00:03:01],   0\r\n')
+
+    assert protocol.read_queue.get_nowait().payload == 'DL, [01:01:00:03:01],   0'
     with pytest.raises(asyncio.QueueEmpty):
         protocol.read_queue.get_nowait()
 
@@ -141,4 +149,73 @@ def test_connection_lost_without_exception(protocol):
         protocol.ready_future.result()
 
     with pytest.raises(HomeworksConnectionLost):
-        protocol.connection_lost_future.result()
\ No newline at end of file
+        protocol.connection_lost_future.result()
+
+@pytest.mark.asyncio
+async def test_send_coalesces_commands(transport):
+    p = HomeworksProtocol(coalesce_window=0.01)
+    p.connection_made(transport)
+    first = p.send(b'KBMON\r\n')
+    second = p.send(b'DLMON\r\n')
+    transport.write.assert_not_called()
+
+    await asyncio.sleep(0.05)
+    transport.write.assert_called_once_with(b'KBMON\r\nDLMON\r\n')
+    assert first.result(0) and second.result(0)
+
+
+@pytest.mark.asyncio
+async def test_send_is_paced_by_baud(transport):
+    p = HomeworksProtocol(coalesce_window=0, baud=9600)
+    p.connection_made(transport)
+    futures = [p.send(b'RDL, [01:01:00:03:%02d]\r\n' % i) for i in range(20)]
+
+    await asyncio.sleep(0.05)
+    assert 0 < transport.write.call_count
+    assert not all(future.done() for future in futures)
+
+    p.flush()
+    assert all(future.done() for future in futures)
+
+
+def test_connection_lost_fails_queued_commands(protocol):
+    future = protocol.send(b'KBMON\r\n')
+    protocol.connection_lost(None)
+    with pytest.raises(HomeworksConnectionLost):
+        future.result(0)
+
+
+def test_reading_pauses_at_high_watermark(transport):
+    protocol = HomeworksProtocol(max_queue=4)
+    protocol.connection_made(transport)
+    protocol.data_received(b''.join(b'DL, [01:01:00:03:%02d],  0\r\n' % i for i in range(3)))
+    transport.pause_reading.assert_not_called()
+    assert protocol.queue_occupancy == 0.75
+
+    protocol.data_received(b'DL, [01:01:00:03:03],  0\r\nDL, [01:01:00:03:04],  0\r\n')
+    transport.pause_reading.assert_called_once_with()
+    assert protocol.reading_paused
+    assert protocol.read_queue.qsize() == 5
+
+    for _ in range(2):
+        protocol.read_queue.get_nowait()
+    transport.resume_reading.assert_not_called()
+    protocol.read_queue.get_nowait()
+    transport.resume_reading.assert_called_once_with()
+    assert not protocol.reading_paused
+
+
+def test_unbounded_queue_never_pauses(protocol, transport):
+    protocol.data_received(b'DL, [01:01:00:03:01],  0\r\n' * 100)
+    assert protocol.read_queue.qsize() == 100
+    assert protocol.queue_occupancy == 0.
+    transport.pause_reading.assert_not_called()
+
+
+def test_drop_prefixes_skip_lines_before_decoding(protocol):
+    protocol.drop_prefixes = (b'KLS, ',)
+    protocol.data_received(b'KLS, [01:04:10], 000\xff\r\nDL, [01:01:00:03:02],  42\r\nKLSX, 1\r\n')
+    assert [protocol.read_queue.get_nowait().payload for _ in range(2)] == [
+        'DL, [01:01:00:03:02],  42', 'KLSX, 1']
+    assert protocol.read_queue.empty()
+    assert protocol.metrics.dropped_messages == 1
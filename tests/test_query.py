@@ -0,0 +1,80 @@
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from pyhomeworks.query import LevelQueries
+
+
+@pytest.fixture
+def sent():
+    return []
+
+
+@pytest.fixture
+def queries(sent):
+    return LevelQueries(sent.append, window=2, timeout=1.)
+
+
+def test_window_limits_in_flight(queries, sent):
+    futures = queries.query(['[01]', '[02]', '[03]'])
+    assert sent == ['[01]', '[02]']
+
+    queries.on_level('[02]', 40, now=0.)
+    assert futures['[02]'].result(0) == 40
+    assert sent == ['[01]', '[02]', '[03]']
+    assert len(queries) == 2
+
+
+def test_duplicate_queries_share_request(queries, sent):
+    first = queries.query(['[01]'])
+    second = queries.query(['[01]', '[01]'])
+    assert sent == ['[01]']
+
+    queries.on_level('[01]', 100)
+    assert first['[01]'].result(0) == second['[01]'].result(0) == 100
+
+
+def test_unsolicited_level_is_ignored(queries, sent):
+    queries.on_level('[09]', 10)
+    assert len(queries) == 0
+
+
+def test_timeout_frees_window(queries, sent):
+    futures = queries.query(['[01]', '[02]', '[03]'])
+    deadline = queries.next_deadline()
+
+    queries.expire(deadline - 0.5)
+    assert not futures['[01]'].done()
+
+    queries.expire(deadline)
+    with pytest.raises(TimeoutError):
+        futures['[01]'].result(0)
+    with pytest.raises(TimeoutError):
+        futures['[02]'].result(0)
+    assert sent == ['[01]', '[02]', '[03]']
+    assert queries.next_deadline() > deadline
+
+
+def test_cancel_all(queries):
+    futures = queries.query(['[01]', '[02]', '[03]'])
+    queries.cancel_all(ConnectionError('lost'))
+    for future in futures.values():
+        with pytest.raises(ConnectionError):
+            future.result(0)
+    assert queries.next_deadline() is None
+
+
+def test_send_failure_fails_requests():
+    def send(addr):
+        if addr != '[01]':
+            raise ConnectionError('not connected')
+
+    queries = LevelQueries(send, window=2, timeout=1.)
+    futures = queries.query(['[01]', '[02]', '[03]'])
+    for addr in ('[02]', '[03]'):
+        with pytest.raises(ConnectionError):
+            futures[addr].result(0)
+    assert len(queries) == 1
+    queries.on_level('[01]', 10)
+    assert futures['[01]'].result(0) == 10
+    assert len(queries) == 0
@@ -0,0 +1,192 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+
+from pyhomeworks import AsyncHomeworks, Homeworks
+from pyhomeworks.events import HW_BUTTON_PRESSED, ButtonEvent, LedStateChanged, LightChanged
+
+from .simulator import ControllerSimulator, Faults, Inventory
+
+DIMMER = '[01:01:00:01:01]'
+KEYPAD = '[01:04:01]'
+
+
+@pytest_asyncio.fixture
+async def simulator():
+    simulator = ControllerSimulator(Inventory.generate(dimmers=2000, keypads=200), fade_step=0.01)
+    await simulator.start()
+    yield simulator
+    await simulator.stop()
+
+
+def test_generated_inventory_is_unique():
+    inventory = Inventory.generate(dimmers=5000, keypads=500)
+    assert len(inventory.levels) == 5000
+    assert len(inventory.leds) == 500
+    assert DIMMER in inventory.levels and KEYPAD in inventory.leds
+
+
+@pytest.mark.asyncio
+async def test_query_levels(simulator):
+    addrs = list(simulator.inventory.levels)[:500]
+    for i, addr in enumerate(addrs):
+        simulator.inventory.levels[addr] = i % 101
+    async with AsyncHomeworks('127.0.0.1', simulator.port) as hw:
+        assert await hw.query_levels(addrs) == {addr: i % 101 for i, addr in enumerate(addrs)}
+
+
+@pytest.mark.asyncio
+async def test_fade_streams_intermediate_levels(simulator):
+    levels = []
+    done = asyncio.Event()
+
+    def on_event(event):
+        levels.append(event.level)
+        if event.level == 100:
+            done.set()
+
+    async with AsyncHomeworks('127.0.0.1', simulator.port, event_callback=on_event) as hw:
+        await hw.fade_dim(100, 1, 0, DIMMER)
+        await asyncio.wait_for(done.wait(), 2)
+    assert len(levels) > 2
+    assert levels == sorted(levels)
+    assert simulator.inventory.levels[DIMMER] == 100
+
+
+@pytest.mark.asyncio
+async def test_fade_many_is_one_write(simulator):
+    addrs = list(simulator.inventory.levels)[:50]
+    fades = [(addr, 0 if i % 2 else 40, 0, 0) for i, addr in enumerate(addrs)]
+    async with AsyncHomeworks('127.0.0.1', simulator.port) as hw:
+        await hw.fade_many(fades + fades[:5])
+        bytes_out = hw.metrics.bytes_out
+        levels = await hw.query_levels(addrs)
+    assert sum(command.startswith(b'FADEDIM') for command in simulator.received) == 6
+    assert bytes_out < sum(len('FADEDIM, 40, 0, 0, %s\r\n' % addr) for addr in addrs)
+    assert levels == {addr: 0 if i % 2 else 40 for i, addr in enumerate(addrs)}
+
+
+@pytest.mark.asyncio
+async def test_keypad_traffic(simulator):
+    events = []
+    async with AsyncHomeworks('127.0.0.1', simulator.port, event_callback=events.append):
+        await asyncio.sleep(0.05)
+        simulator.press(KEYPAD, 3)
+        simulator.set_leds(KEYPAD, [1, 0, 2] + [0] * 21)
+        simulator.start_traffic(rate=1000)
+        await asyncio.sleep(0.2)
+        simulator.stop_traffic()
+    assert events[0] == ButtonEvent(HW_BUTTON_PRESSED, KEYPAD, 3, events[0].timestamp)
+    assert events[2].leds[:3] == b'\x01\x00\x02'
+    # The generator toggles one LED at a time, so keypads seen before report one change.
+    seen = {KEYPAD}
+    for event in events[3:]:
+        if type(event) is LedStateChanged:
+            assert bin(event.changed).count('1') == (1 if event.address in seen else 24)
+            seen.add(event.address)
+    assert len(events) > 50
+    assert {type(event) for event in events} == {ButtonEvent, LedStateChanged}
+
+
+@pytest.mark.asyncio
+async def test_login_split_packets_and_garbage():
+    simulator = ControllerSimulator(Inventory([DIMMER]), login='user,password',
+                                    faults=Faults(split_packets=3, garbage_rate=0.3))
+    simulator.inventory.levels[DIMMER] = 42
+    await simulator.start()
+    try:
+        async with AsyncHomeworks('127.0.0.1', simulator.port, login='user,password') as hw:
+            assert await hw.query_levels([DIMMER] * 3) == {DIMMER: 42}
+            await hw.request_dimmer_level(DIMMER)
+            assert hw.state.get_level(DIMMER) == 42
+    finally:
+        await simulator.stop()
+
+
+@pytest.mark.asyncio
+async def test_baud_throttling():
+    simulator = ControllerSimulator(Inventory.generate(dimmers=50), baud=19200)
+    await simulator.start()
+    try:
+        async with AsyncHomeworks('127.0.0.1', simulator.port) as hw:
+            started = time.monotonic()
+            levels = await hw.query_levels(list(simulator.inventory.levels))
+            elapsed = time.monotonic() - started
+        assert set(levels.values()) == {0}
+        # 50 replies of 28 bytes at 1920 bytes/s.
+        assert elapsed > 0.6
+    finally:
+        await simulator.stop()
+
+
+@pytest.mark.asyncio
+async def test_disconnect_triggers_reconnect():
+    # Dropped right after the only monitor reply, DLMON's.
+    simulator = ControllerSimulator(Inventory([DIMMER]), faults=Faults(disconnect_after=1))
+    await simulator.start()
+    try:
+        hw = AsyncHomeworks('127.0.0.1', simulator.port)
+        hw._backoff.initial = 0.1
+        await hw.connect()
+        try:
+            while not hw.reconnects:
+                await asyncio.sleep(0.005)
+            simulator.faults.disconnect_after = None
+            while not hw.connected:
+                await asyncio.sleep(0.01)
+            assert await hw.query_levels([DIMMER]) == {DIMMER: 0}
+        finally:
+            await hw.close()
+    finally:
+        await simulator.stop()
+
+
+def test_threaded_client():
+    simulator = ControllerSimulator(Inventory([DIMMER]), fade_step=0.01)
+    simulator.start_thread()
+    events = []
+    hw = Homeworks('127.0.0.1', simulator.port, event_callback=events.append)
+    try:
+        deadline = time.monotonic() + 3
+        while not hw._subscribed:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert hw.query_levels([DIMMER])[DIMMER].result(2) == 0
+        hw.fade_dim(50, 1, 0, DIMMER).result(1)
+        while hw.state.get_level(DIMMER) != 50:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        hw.fade_many([(DIMMER, 20, 0, 0)]).result(1)
+        while hw.state.get_level(DIMMER) != 20:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        hw.close()
+        hw.join(1)
+        simulator.stop_thread()
+    assert all(type(event) is LightChanged for event in events)
+
+
+@pytest.mark.asyncio
+async def test_flood_with_bounded_read_queue(simulator):
+    class SmallQueue(AsyncHomeworks):
+        READ_QUEUE_SIZE = 16
+
+    received = []
+    async with SmallQueue('127.0.0.1', simulator.port, event_callback=received.append) as hw:
+        await asyncio.sleep(0.05)
+        reader, hw._reader = hw._reader, None
+        reader.cancel()
+        # More than the largest single read, so the queue can only hold part of it.
+        for _ in range(5000):
+            simulator.press(KEYPAD, 1, release=False)
+        await asyncio.sleep(0.1)
+        assert hw._protocol.reading_paused
+        assert hw._protocol.read_queue.qsize() < 5000
+        hw._reader = asyncio.get_running_loop().create_task(hw._read())
+        while len(received) < 5000:
+            await asyncio.sleep(0.01)
+        assert not hw._protocol.reading_paused
+    assert len(received) == 5000
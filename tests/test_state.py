@@ -0,0 +1,87 @@
+from pyhomeworks.events import KeypadEnableChanged, LedStateChanged, LightChanged
+from pyhomeworks.pyhomeworks import BaseHomeworks
+from pyhomeworks.state import DeviceState, led_changes
+
+
+def test_levels():
+    state = DeviceState()
+    assert state.get_level('[01:01:00:03:02]') is None
+    assert state.update(LightChanged('[01:01:00:03:02]', 0, 1.))
+    assert state.get_level('[01:01:00:03:02]') == 0
+    assert state.last_update('[01:01:00:03:02]') == 1.
+
+
+def test_change_only_notifications():
+    state = DeviceState()
+    changes = []
+    remove = state.add_listener(changes.append)
+
+    events = [
+        LightChanged('[01:01:00:03:02]', 50, 1.),
+        LightChanged('[01:01:00:03:02]', 50, 2.),
+        LedStateChanged('[01:04:10]', b'\x01\x00\x00', 3.),
+        LedStateChanged('[01:04:10]', b'\x01\x00\x00', 4.),
+        KeypadEnableChanged('[01:04:10]', True, 5.),
+        KeypadEnableChanged('[01:04:10]', True, 6.),
+    ]
+    for event in events:
+        state.update(event)
+    assert changes == [events[0], events[2]._replace(changed=0b111), events[4]]
+    assert state.last_update('[01:01:00:03:02]') == 1.
+
+    remove()
+    state.update(LightChanged('[01:01:00:03:02]', 0, 7.))
+    assert len(changes) == 3
+
+
+def test_led_changes():
+    assert led_changes(None, bytes(24)) == (1 << 24) - 1
+    assert led_changes(bytes(24), bytes(24)) == 0
+    leds = bytearray(24)
+    leds[0], leds[9], leds[23] = 1, 2, 3
+    assert led_changes(bytes(24), bytes(leds)) == 1 | 1 << 9 | 1 << 23
+    assert led_changes(bytes(3), bytes(4)) == 0b1111
+
+
+def test_led_events_carry_only_changes():
+    state = DeviceState()
+    assert state.apply(LedStateChanged('[01:04:10]', bytes(24), 1.)).changed == (1 << 24) - 1
+    leds = bytearray(24)
+    leds[5] = 1
+    event = state.apply(LedStateChanged('[01:04:10]', bytes(leds), 2.))
+    assert event.changed == 1 << 5
+    assert event.changes() == {5: 1}
+    assert event.led_changed(5) and not event.led_changed(4)
+    assert state.apply(LedStateChanged('[01:04:10]', bytes(leds), 3.)) is None
+    assert state.get_led('[01:04:10]', 5) == 1
+    assert state.get_led('[01:04:10]', 24) is None
+
+
+def test_snapshot():
+    state = DeviceState()
+    state.update(LightChanged('[01:01:00:03:02]', 75, 1.))
+    state.update(LedStateChanged('[01:04:10]', (1, 2), 1.))
+    state.update(KeypadEnableChanged('[01:04:10]', False, 1.))
+
+    snapshot = state.snapshot()
+    assert snapshot.levels == {'[01:01:00:03:02]': 75}
+    assert snapshot.leds == {'[01:04:10]': (1, 2)}
+    assert snapshot.enabled == {'[01:04:10]': False}
+    assert state.get_level('[01:04:10]') is None
+    assert state.get_leds('[01:04:10]') == (1, 2)
+    assert state.is_enabled('[01:04:10]') is False
+
+
+def test_fed_by_parse_path():
+    hw = BaseHomeworks()
+    hw._processReceivedData('DL, [01:01:00:03:02],  42', 1.)
+    assert hw.state.get_level('[01:01:00:03:02]') == 42
+
+
+def test_unchanged_leds_are_not_delivered():
+    events = []
+    hw = BaseHomeworks(event_callback=events.append)
+    hw._processReceivedData('KLS, [01:04:10], 000', 1.)
+    hw._processReceivedData('KLS, [01:04:10], 000', 2.)
+    hw._processReceivedData('KLS, [01:04:10], 010', 3.)
+    assert [event.changed for event in events] == [0b111, 0b010]
@@ -0,0 +1,130 @@
+import time
+
+import pytest
+
+from pyhomeworks.events import HW_KEYPAD_LED_CHANGED, KeypadEnableChanged, LedStateChanged, LightChanged
+from pyhomeworks.pyhomeworks import BaseHomeworks
+from pyhomeworks.statefile import MappedDeviceState, StateFileReader
+
+
+def test_restore(tmp_path):
+    path = str(tmp_path / 'state')
+    state = MappedDeviceState(path)
+    assert state.restored() == []
+    state.update(LightChanged('[01:01:00:03:02]', 42, time.monotonic()))
+    state.update(LedStateChanged('[01:04:10]', b'\x01\x00\x02', time.monotonic()))
+    state.update(KeypadEnableChanged('[01:04:10]', False, time.monotonic()))
+    updated = state.last_update('[01:01:00:03:02]')
+    state.close()
+
+    state = MappedDeviceState(path)
+    assert state.get_level('[1:1:0:3:2]') == 42
+    assert state.get_leds('[01:04:10]') == (1, 0, 2)
+    assert state.is_enabled('[01:04:10]') is False
+    assert state.last_update('[01:01:00:03:02]') == pytest.approx(updated, abs=0.01)
+    assert state.restored() == [(1, 1, 0, 3, 2)]
+    assert state.restored() == []
+    state.close()
+
+
+def test_reader_follows_writer(tmp_path):
+    path = str(tmp_path / 'state')
+    state = MappedDeviceState(path)
+    with StateFileReader(path) as reader:
+        assert len(reader) == 0
+        assert reader.get_level('[01:01:00:03:02]') is None
+
+        before = time.time()
+        state.update(LightChanged('[01:01:00:03:02]', 42, time.monotonic()))
+        assert reader.get_level('[01:01:00:03:02]') == 42
+        assert reader.last_update('[01:01:00:03:02]') >= before - 0.01
+        state.update(LightChanged('[01:01:00:03:02]', 7, time.monotonic()))
+        assert reader.get_level('[01:01:00:03:02]') == 7
+
+        state.update(LedStateChanged('[01:04:10]', b'\x01\x00', time.monotonic()))
+        assert reader.get_leds('[01:04:10]') == (1, 0)
+        assert reader.get_level('[01:04:10]') is None
+        assert reader.is_enabled('[01:04:10]') is None
+        assert reader.addresses() == ['[01:01:00:03:02]', '[01:04:10]']
+        assert reader.snapshot() == state.snapshot()
+    state.close()
+
+
+def test_capacity(tmp_path):
+    path = str(tmp_path / 'state')
+    state = MappedDeviceState(path, capacity=1)
+    state.update(LightChanged('[01:01:00:03:02]', 42, 1.))
+    state.update(LightChanged('[01:01:00:03:03]', 43, 1.))
+    assert state.get_level('[01:01:00:03:03]') == 43
+    with StateFileReader(path) as reader:
+        assert reader.addresses() == ['[01:01:00:03:02]']
+    state.close()
+
+    # An existing file keeps its capacity.
+    state = MappedDeviceState(path, capacity=16)
+    assert state.capacity == 1
+    state.close()
+
+
+def test_not_a_state_file(tmp_path):
+    path = tmp_path / 'state'
+    path.write_bytes(b'x' * 128)
+    with pytest.raises(ValueError):
+        MappedDeviceState(str(path))
+    with pytest.raises(ValueError):
+        StateFileReader(str(path))
+
+
+def test_restored_levels_are_reconciled(tmp_path):
+    path = str(tmp_path / 'state')
+    state = MappedDeviceState(path)
+    state.update(LightChanged('[01:01:00:03:02]', 42, 1.))
+    state.update(LedStateChanged('[01:04:10]', b'\x01', 1.))
+    state.close()
+
+    sent = []
+    leds = []
+    hw = BaseHomeworks(state_file=path)
+    hw._send = lambda command, priority=None: sent.append(command)
+    hw.dispatcher.subscribe(leds.append, '[01:04:10]', HW_KEYPAD_LED_CHANGED)
+    assert hw.state.get_level('[01:01:00:03:02]') == 42
+    hw._subscribe()
+    assert sent[-2:] == ['RDL, [01:01:00:03:02]', 'RKLS, [01:04:10]']
+    hw._processReceivedData('DL, [01:01:00:03:02],  10', time.monotonic())
+    # The first report is delivered even though it matches the restored LEDs.
+    hw._processReceivedData('KLS, [01:04:10], 1', time.monotonic())
+    hw._processReceivedData('KLS, [01:04:10], 1', time.monotonic())
+    assert [event.changed for event in leds] == [1]
+    hw.state.close()
+    with StateFileReader(path) as reader:
+        assert reader.get_level('[01:01:00:03:02]') == 10
+
+
+def test_single_writer(tmp_path):
+    path = str(tmp_path / 'state')
+    state = MappedDeviceState(path)
+    with pytest.raises(OSError):
+        MappedDeviceState(path)
+    with StateFileReader(path) as reader:
+        assert len(reader) == 0
+    state.close()
+    MappedDeviceState(path).close()
+
+
+def test_new_slot_reads_as_unknown(tmp_path):
+    path = str(tmp_path / 'state')
+    state = MappedDeviceState(path)
+    # A slot allocated but not yet written, as when the writer stops in between.
+    state._slot((1, 1, 0, 3, 2))
+    with StateFileReader(path) as reader:
+        assert reader.addresses() == ['[01:01:00:03:02]']
+        assert reader.get_level('[01:01:00:03:02]') is None
+        assert reader.get_leds('[01:01:00:03:02]') is None
+        assert reader.is_enabled('[01:01:00:03:02]') is None
+    state.close()
+
+    state = MappedDeviceState(path)
+    assert state.get_level('[01:01:00:03:02]') is None
+    assert state.restored() == []
+    assert state.restored_keypads() == []
+    state.close()
@@ -0,0 +1,120 @@
+import pytest
+
+from pyhomeworks.writer import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, CommandWriter, OutgoingQueue, TokenBucket,
+    encode_command, write_all)
+
+
+class PartialSocket:
+    """Accepts at most `limit` bytes per send call."""
+
+    def __init__(self, limit=4):
+        self.limit = limit
+        self.calls = []
+
+    def send(self, data):
+        chunk = bytes(data[:self.limit])
+        self.calls.append(chunk)
+        return len(chunk)
+
+
+def test_encode_command_is_cached():
+    assert encode_command('KBMON') == b'KBMON\r\n'
+    assert encode_command('KBMON') is encode_command('KBMON')
+
+
+def test_write_all_handles_partial_sends():
+    sock = PartialSocket(limit=3)
+    assert write_all(sock.send, b'PROMPTOFF\r\n') == 11
+    assert b''.join(sock.calls) == b'PROMPTOFF\r\n'
+    assert len(sock.calls) == 4
+
+
+def test_outgoing_queue_take():
+    queue = OutgoingQueue()
+    queue.put(b'A\r\n')
+    queue.put(b'B\r\n')
+    data, futures = queue.take()
+    assert data == b'A\r\nB\r\n'
+    assert len(futures) == 2
+    assert not queue
+
+
+def test_writer_coalesces_burst():
+    sock = PartialSocket(limit=1024)
+    writer = CommandWriter(sock.send, coalesce_window=0.05)
+    futures = [writer.write(encode_command('RDL, [01:01:00:03:%02d]' % i)) for i in range(20)]
+    assert all(future.result(1) for future in futures)
+    writer.close()
+    assert len(sock.calls) == 1
+    assert sock.calls[0].count(b'\r\n') == 20
+
+
+def test_writer_flushes_on_close():
+    sock = PartialSocket(limit=1024)
+    writer = CommandWriter(sock.send, coalesce_window=10)
+    future = writer.write(b'KLMON\r\n')
+    writer.close()
+    assert future.result(0) is True
+    assert sock.calls == [b'KLMON\r\n']
+
+    with pytest.raises(ConnectionError):
+        writer.write(b'KLMON\r\n').result(0)
+
+
+def test_writer_reports_send_failure():
+    def send(data):
+        raise BrokenPipeError('gone')
+
+    writer = CommandWriter(send, coalesce_window=0)
+    with pytest.raises(ConnectionError):
+        writer.write(b'KLMON\r\n').result(1)
+    writer.close()
+
+
+def test_interactive_lane_goes_first():
+    queue = OutgoingQueue(coalesce_window=0)
+    queue.put(b'RDL, [01]\r\n', PRIORITY_BACKGROUND)
+    queue.put(b'FADEDIM, 0, 0, 0, [02]\r\n')
+    data, futures = queue.take()
+    assert data == b'FADEDIM, 0, 0, 0, [02]\r\nRDL, [01]\r\n'
+    assert queue.stats[PRIORITY_INTERACTIVE].count == queue.stats[PRIORITY_BACKGROUND].count == 1
+
+
+def test_token_bucket_paces_queue():
+    size = len(b'RDL, [01:01:00:03:00]\r\n')
+    bucket = TokenBucket.for_baud(9600, capacity=2 * size)
+    assert bucket.rate == 960
+    queue = OutgoingQueue(coalesce_window=0, bucket=bucket)
+    for i in range(3):
+        queue.put(b'RDL, [01:01:00:03:0%d]\r\n' % i, PRIORITY_BACKGROUND)
+
+    now = bucket._updated
+    data, futures = queue.take(now)
+    assert len(futures) == 2
+    assert queue.ready_at(now) == pytest.approx(now + size / 960)
+
+    # A late interactive command overtakes the waiting background one.
+    queue.put(b'FADEDIM, 0, 0, 0, [02]\r\n')
+    fade_size = len(b'FADEDIM, 0, 0, 0, [02]\r\n')
+    assert queue.take(now + (fade_size - 1) / 960) == (b'', [])
+    later = now + (fade_size + 0.5) / 960
+    data, futures = queue.take(later)
+    assert data == b'FADEDIM, 0, 0, 0, [02]\r\n'
+    assert len(queue) == 1
+
+    data, futures = queue.take(later, limited=False)
+    assert len(futures) == 1
+    assert queue.ready_at(later) is None
+
+
+def test_writer_with_bucket_delivers_everything():
+    sock = PartialSocket(limit=1024)
+    writer = CommandWriter(sock.send, coalesce_window=0, bucket=TokenBucket(rate=20000, capacity=64))
+    futures = [writer.write(encode_command('RDL, [01:01:00:03:%02d]' % i), PRIORITY_BACKGROUND)
+               for i in range(20)]
+    assert all(future.result(2) for future in futures)
+    writer.close()
+    assert len(sock.calls) > 1
+    assert writer.stats[PRIORITY_BACKGROUND].count == 20
+    assert writer.stats[PRIORITY_BACKGROUND].max_delay > 0